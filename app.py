@@ -1,169 +1,89 @@
 #!/usr/bin/env python3
 import subprocess
 import os
-from flask import Flask, request, jsonify, send_from_directory
-from markitdown import MarkItDown
+import asyncio
+import time
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, g
 from dotenv import load_dotenv
-import io
-import openai
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 # Load environment variables
 load_dotenv()
 
+# Local modules read their settings from the environment at import time
+import browser_pool
+from page_cache import PageCache
+from pipeline import CallPipeline
+from call_events import EventBroker, poll_store, sse
+import call_store
+import llm_cache
+import converter
+import llm_transport
+import model_router
+import metrics
+import timeline
+import batch
+
 # Initialize OpenAI client with OpenRouter
-client = OpenAI(
+# (retries are handled by llm_transport, so the SDK's own are disabled)
+client = AsyncOpenAI(
     api_key=os.environ.get("OPENROUTER_API_KEY"),
-    base_url="https://openrouter.ai/api/v1"
+    base_url=os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+    http_client=llm_transport.http_client(),
+    max_retries=0,
 )
 
-app = Flask(__name__, static_folder='fe')
-
-# Placeholder for personas
-personas = [
-    {"id": "persona1", "system_prompt": "You are a friendly chatbot.", "voice": "voice1"},
-    {"id": "persona2", "system_prompt": "You are a sarcastic chatbot.", "voice": "voice2"},
-    {"id": "persona3", "system_prompt": "You are a formal chatbot.", "voice": "voice3"},
-]
-
-# Placeholder for call data
-call_data = {}
-
-@app.route('/')
-def index():
-    return send_from_directory('fe', 'index.html')
-
-@app.route('/<path:path>')
-def serve_static(path):
-    return send_from_directory('fe', path)
-
-@app.route('/scrape', methods=['POST'])
-def scrape():
-    url = request.json.get('url')
-    if not url:
-        return jsonify({"error": "URL is required"}), 400
-    result = scrape_url(url)
-    return jsonify({"result": result})
-
-def scrape_url(url):
-    try:
-        # Execute the lightpanda command
-        result = subprocess.run(['./lightpanda', 'fetch', '--dump', url], capture_output=True, text=True, check=True)
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        return jsonify({"error": f"Subprocess failed with error: {e.stderr}"}), 500
-    except Exception as e:
-        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
-
-def convert_to_markdown(html_content):
-    md = MarkItDown()
-    # MarkItDown expects a binary file-like object
-    html_bytes = html_content.encode('utf-8')
-    html_io = io.BytesIO(html_bytes)
-    result = md.convert_stream(html_io)
-    return result.text_content
+# Rate limiting, backoff and per-model circuit breakers for LLM calls
+transport = llm_transport.ResilientTransport()
 
-def summarize(markdown_content, system_prompt):
-    try:
-        # Use chat completions instead of completions
-        response = client.chat.completions.create(
-            model="mistralai/mistral-7b-instruct",  # Updated model name
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Summarize the following: {markdown_content}"}
-            ],
-            max_tokens=150,
-            temperature=0.5,
-            extra_headers={
-                "HTTP-Referer": "http://localhost:3000",  # Replace with your actual site
-                "X-Title": "Party Line Game",
-            }
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error in summarize: {str(e)}")
-        return f"Error generating summary: {str(e)}"
+# Picks among LLM_MODELS (or a persona's own "models") by live latency and errors
+router = model_router.ModelRouter(is_available=lambda model: transport.breaker(model).available)
 
-@app.route('/call', methods=['POST'])
-def call():
-    data = request.get_json()
-    url = data['url']
-    persona_ids = data['personas']
-
-    # Scrape URL
-    scraped_content = scrape_url(url)
-
-    # Convert to markdown
-    markdown_content = convert_to_markdown(scraped_content)
-
-    # Get system prompts for selected personas
-    system_prompts = [persona["system_prompt"] for persona in personas if persona["id"] in persona_ids]
-    # Combine system prompts
-    combined_system_prompt = "\n".join(system_prompts)
-
-    # Summarize
-    summary = summarize(markdown_content, combined_system_prompt)
-
-    call_id = "12345"  # Placeholder
-    call_data[call_id] = {"url": url, "personas": persona_ids, "content": summary}
-
-    return jsonify({"id": call_id})
+app = Flask(__name__, static_folder='fe')
 
-@app.route('/add_to_call', methods=['POST'])
-def add_to_call():
-    data = request.get_json()
-    call_id = data['id']
-    persona_id = data['persona']
+# Opt-in stack sampling for hot-path analysis (METRICS_PROFILE_HZ)
+metrics.profiler.start()
 
-    if call_id in call_data:
-        call_data[call_id]['personas'].append(persona_id)
-        return jsonify({"status": "success"})
-    else:
-        return jsonify({"status": "error", "message": "Invalid call ID"})
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
 
-@app.route('/remove_from_call', methods=['POST'])
-def remove_from_call():
-    data = request.get_json()
-    call_id = data['id']
-    persona_id = data['persona']
+@app.after_request
+def record_request(response):
+    # Per-route latency; the rule keeps /call/<id> from becoming one series per call
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    if request.endpoint != 'serve_static' and hasattr(g, 'request_started'):
+        metrics.observe("http_request_seconds", time.perf_counter() - g.request_started,
+                        route=route, method=request.method)
+        metrics.inc("http_requests_total", route=route, method=request.method, status=response.status_code)
+    return response
 
-    if call_id in call_data:
-        call_data[call_id]['personas'] = [p for p in call_data[call_id]['personas'] if p != persona_id]
-        return jsonify({"status": "success"})
-    else:
-        return jsonify({"status": "error", "message": "Invalid call ID"})
+# Sampling settings; part of the response cache key along with the model list
+SUMMARY_PARAMS = {"max_tokens": 150, "temperature": 0.5}
 
-if __name__ == '__main__':
-    app.run(debug=True)#!/usr/bin/env python3
-import subprocess
-import os
-from flask import Flask, request, jsonify, send_from_directory
-from markitdown import MarkItDown
-from dotenv import load_dotenv
-import io
-import openai
-from openai import OpenAI
+# Cached completions in front of OpenRouter
+response_cache = llm_cache.from_env()
 
-# Load environment variables
-load_dotenv()
+# Placeholder for personas (ids match the cards in fe/script.js)
+personas = [
+    {"id": "cool-dude", "system_prompt": "You are a laid-back, friendly party starter.", "voice": "voice1"},
+    {"id": "nerd", "system_prompt": "You are a trivia-obsessed nerd who loves details.", "voice": "voice2"},
+    {"id": "singer", "system_prompt": "You are a dramatic karaoke singer.", "voice": "voice3"},
+    {"id": "chef", "system_prompt": "You are a chef who relates everything to food.", "voice": "voice4"},
+    {"id": "dancer", "system_prompt": "You are an energetic dancer who is always moving.", "voice": "voice5"},
+]
 
-# Initialize OpenAI client with OpenRouter
-client = OpenAI(
-    api_key=os.environ.get("OPENROUTER_API_KEY"),
-    base_url="https://openrouter.ai/api/v1"
-)
+# Call sessions (memory, or SQLite shared by every worker on the host)
+calls = call_store.from_env()
 
-app = Flask(__name__, static_folder='fe')
+# Per-call event logs relayed to the browser over SSE
+call_events = EventBroker()
 
-# Placeholder for personas
-personas = [
-    {"id": "persona1", "system_prompt": "You are a friendly chatbot.", "voice": "voice1"},
-    {"id": "persona2", "system_prompt": "You are a sarcastic chatbot.", "voice": "voice2"},
-    {"id": "persona3", "system_prompt": "You are a formal chatbot.", "voice": "voice3"},
-]
+# Scraped HTML and its markdown, shared by /scrape and /call
+page_cache = PageCache()
 
-# Placeholder for call data
-call_data = {}
+# Per-call processed page and transcript, so a joining persona costs one completion
+timelines = timeline.TimelineStore()
 
 @app.route('/')
 def index():
@@ -178,47 +98,179 @@ def scrape():
     url = request.json.get('url')
     if not url:
         return jsonify({"error": "URL is required"}), 400
-    result = scrape_url(url)
-    return jsonify({"result": result})
-
-def scrape_url(url):
     try:
-        # Execute the lightpanda command
-        result = subprocess.run(['./lightpanda', 'fetch', '--dump', url], capture_output=True, text=True, check=True)
-        return result.stdout
+        result = get_page(url)["html"]
     except subprocess.CalledProcessError as e:
         return jsonify({"error": f"Subprocess failed with error: {e.stderr}"}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+    return jsonify({"result": result})
 
-def convert_to_markdown(html_content):
-    md = MarkItDown()
-    # MarkItDown expects a binary file-like object
-    html_bytes = html_content.encode('utf-8')
-    html_io = io.BytesIO(html_bytes)
-    result = md.convert_stream(html_io)
-    return result.text_content
-
-def summarize(markdown_content, system_prompt):
+def scrape_url(url):
+    # Prefer a leased browser from the long-lived Lightpanda CDP pool
+    pool = browser_pool.get_pool()
+    if pool is not None:
+        try:
+            return pool.fetch(url)
+        except Exception as e:
+            print(f"Browser pool failed for {url}, falling back to fetch: {str(e)}")
+    return fetch_url_subprocess(url)
+
+def fetch_url_subprocess(url):
+    # Execute the lightpanda command
+    result = subprocess.run([browser_pool.LIGHTPANDA_BINARY, 'fetch', '--dump', url], capture_output=True, text=True, check=True)
+    return result.stdout
+
+async def scrape_url_async(url):
+    # Async counterpart of scrape_url used by the /call pipeline
+    pool = browser_pool.get_pool()
+    if pool is not None:
+        try:
+            # CDP leases are blocking; the scrape stage limit bounds these threads
+            return await asyncio.to_thread(pool.fetch, url)
+        except Exception as e:
+            print(f"Browser pool failed for {url}, falling back to fetch: {str(e)}")
+
+    cmd = [browser_pool.LIGHTPANDA_BINARY, 'fetch', '--dump', url]
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout.decode(), stderr.decode())
+    return stdout.decode()
+
+def get_page(url):
+    # Cached scrape; concurrent requests for one URL (calls included) share a fetch.
+    # Conversion is left to whoever needs the markdown.
+    return page_cache.get(url, scrape_url)
+
+def models_for(persona_id):
+    # Ordered candidate models for a persona, falling back to LLM_MODELS
+    for persona in personas:
+        if persona["id"] == persona_id and persona.get("models"):
+            return persona["models"]
+    return model_router.LLM_MODELS
+
+async def open_completion(model, system_prompt, markdown_content, transcript=None):
+    # Start a streamed completion on `model` and wait for its first fragment
+    stream = await transport.call(model, lambda: client.chat.completions.create(
+        model=model,
+        messages=timeline.prompt_messages(system_prompt, markdown_content, transcript),
+        **SUMMARY_PARAMS,
+        stream=True,
+        extra_headers={
+            "HTTP-Referer": "http://localhost:3000",  # Replace with your actual site
+            "X-Title": "Party Line Game",
+        }
+    ))
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                return stream, chunk.choices[0].delta.content
+        return stream, ""
+    except BaseException:
+        # Cancelled hedge losers must give their connection back
+        await stream.close()
+        raise
+
+async def close_completion(opened):
+    await opened[0].close()
+
+class SummaryError(Exception):
+    """A completion failed (now or recently, per the negative cache)"""
+
+async def summarize(markdown_content, system_prompt, persona_id="-", transcript=None):
+    # Async generator of reply fragments as OpenRouter streams them; with a
+    # transcript (even an empty one) this is a turn in a call, else a one-off
+    models = models_for(persona_id)
+    # Keyed on the candidate list, so a hit doesn't depend on which model won
+    cache_key = llm_cache.make_key("|".join(models), system_prompt,
+                                   timeline.cache_content(markdown_content, transcript), **SUMMARY_PARAMS)
+    cached = await response_cache.lookup_async(cache_key, persona_id)
+    if cached is not None:
+        if "error" in cached:
+            # A recent failure, remembered so the provider isn't hammered; never content
+            raise SummaryError(cached["error"])
+        yield cached["text"]
+        return
+
+    parts = []
     try:
-        # Use chat completions instead of completions
-        response = client.chat.completions.create(
-            model="mistralai/mistral-7b-instruct",  # Updated model name
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Summarize the following: {markdown_content}"}
-            ],
-            max_tokens=150,
-            temperature=0.5,
-            extra_headers={
-                "HTTP-Referer": "http://localhost:3000",  # Replace with your actual site
-                "X-Title": "Party Line Game",
-            }
+        # Fastest healthy model wins; persona replies are hedged, map-step calls are not
+        stream, first = await router.first(
+            models,
+            lambda model: open_completion(model, system_prompt, markdown_content, transcript),
+            hedge=model_router.LLM_HEDGE and persona_id != "map",
+            discard=close_completion,
         )
-        return response.choices[0].message.content.strip()
+        if first:
+            parts.append(first)
+            yield first
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
     except Exception as e:
         print(f"Error in summarize: {str(e)}")
-        return f"Error generating summary: {str(e)}"
+        await response_cache.store_error_async(cache_key, str(e), persona_id)
+        raise SummaryError(str(e)) from e
+    # Only complete replies are cached
+    await response_cache.store_async(cache_key, "".join(parts).strip())
+
+# scrape -> convert -> summarize with per-stage concurrency limits
+# (conversion runs in worker processes, so it is passed as the picklable module function)
+pipeline = CallPipeline(page_cache, scrape_url_async, converter.convert_html, summarize,
+                        cpu_executor=converter.process_pool())
+
+def system_prompts_for(persona_ids):
+    # Get system prompts for selected personas, keyed by persona id
+    return {persona["id"]: persona["system_prompt"] for persona in personas if persona["id"] in persona_ids}
+
+def voice_for(persona_id):
+    return next((persona["voice"] for persona in personas if persona["id"] == persona_id), None)
+
+def start_generation(call, persona_ids, on_scraped=None):
+    # Queue turns for these personas and relay tokens/turns to the call's event stream
+    # (the call id doubles as the trace id, down to the TTS session). Each persona
+    # responds to the transcript so far; once the call's page is processed, a
+    # joining persona costs one completion
+    call_id = call['id']
+    started = time.perf_counter()
+    page, transcript = timelines.snapshot(call)
+
+    def on_token(persona_id, text):
+        call_events.publish(call_id, {"type": "token", "persona": persona_id, "text": text})
+
+    def on_response(persona_id, text):
+        with metrics.timer("call_store_seconds", op="set_response"):
+            calls.set_response(call_id, persona_id, text)
+        turn = timelines.append(call, persona_id, text)
+        call_events.publish(call_id, {"type": "response", "persona": persona_id, "text": text, "turn": turn,
+                                      "voice": voice_for(persona_id), "trace_id": call_id})
+
+    def on_error(persona_id, message):
+        # Failed turns stay out of the transcript, so later joiners never answer them
+        call_events.publish(call_id, {"type": "error", "persona": persona_id, "message": message,
+                                      "trace_id": call_id})
+
+    def on_done(future):
+        metrics.observe("call_generation_seconds", time.perf_counter() - started)
+        if future.exception() is not None:
+            metrics.inc("call_generation_errors_total")
+            call_events.finish(call_id, {"type": "error", "message": str(future.exception())})
+        else:
+            job = future.result()
+            if not job.partial_page:
+                timelines.set_page(call, job.condensed)
+            call_events.finish(call_id, {"type": "done", "personas": list(job.responses), "errors": job.errors,
+                                          "ttft_ms": {p: round(t, 1) for p, t in job.ttft_ms.items()},
+                                          "input_tokens": job.tokens})
+
+    call_events.begin(call_id)
+    future = pipeline.submit(call['url'], system_prompts_for(persona_ids), on_response=on_response,
+                             on_token=on_token, trace_id=call_id, transcript=transcript, condensed=page,
+                             on_error=on_error, on_scraped=on_scraped)
+    future.add_done_callback(on_done)
+    return future
 
 @app.route('/call', methods=['POST'])
 def call():
@@ -226,24 +278,127 @@ def call():
     url = data['url']
     persona_ids = data['personas']
 
-    # Scrape URL
-    scraped_content = scrape_url(url)
-
-    # Convert to markdown
-    markdown_content = convert_to_markdown(scraped_content)
-
-    # Get system prompts for selected personas
-    system_prompts = [persona["system_prompt"] for persona in personas if persona["id"] in persona_ids]
-    # Combine system prompts
-    combined_system_prompt = "\n".join(system_prompts)
-
-    # Summarize
-    summary = summarize(markdown_content, combined_system_prompt)
-
-    call_id = "12345"  # Placeholder
-    call_data[call_id] = {"url": url, "personas": persona_ids, "content": summary}
-
-    return jsonify({"id": call_id})
+    with metrics.timer("call_store_seconds", op="create"):
+        session = calls.create(url, persona_ids)
+    call_id = session["id"]
+    call_events.open(call_id)
+
+    # Scrape, convert and stream every persona's reply in the background;
+    # the browser follows along on /call/<id>/events
+    start_generation(session, persona_ids)
+
+    return jsonify({"id": call_id, "trace_id": call_id})
+
+def start_batch_call(url, persona_ids, release_domain):
+    # A batch job becomes an ordinary call, created exactly as /call does
+    known = {persona["id"] for persona in personas}
+    unknown = [p for p in persona_ids if p not in known]
+    if unknown:
+        raise ValueError(f"unknown personas: {', '.join(unknown)}")
+    session = calls.create(url, persona_ids)
+    call_events.open(session["id"])
+    return session["id"], start_generation(session, persona_ids, on_scraped=release_domain)
+
+# Bulk /calls/batch jobs, started in priority order under per-domain limits; a finished
+# job only answers duplicates while its call is still in the store
+batch_queue = batch.BatchQueue(start_batch_call, call_exists=lambda call_id: calls.get(call_id) is not None)
+
+@app.route('/calls/batch', methods=['POST'])
+def calls_batch():
+    # A JSON {"jobs": [{url, personas, priority?}, ...]} body, or the same objects
+    # one per line (JSONL, e.g. `python batch.py urls.jsonl`); returns job ids at once
+    if not batch.BATCH_ENABLED:
+        return jsonify({"error": "Batch calls are disabled (BATCH_ENABLED=0)"}), 404
+    priority = request.args.get('priority', 'normal')
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'text/plain'):
+        entries = batch.parse_jsonl(request.get_data(as_text=True))
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('jobs'), list):
+            return jsonify({"error": "Expected {\"jobs\": [...]} or a JSONL body"}), 400
+        priority = data.get('priority', priority)
+        entries = enumerate(data['jobs'], 1)
+    try:
+        priority = batch.parse_priority(priority)
+    except batch.BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        result = batch_queue.submit(entries, priority)
+    except batch.BatchClosed as e:
+        return jsonify({"error": str(e)}), 503
+    status = 202 if result["jobs"] else 400
+    return jsonify(result), status
+
+@app.route('/calls/batch/<batch_id>')
+def calls_batch_status(batch_id):
+    result = batch_queue.batch(batch_id)
+    if result is None:
+        return jsonify({"status": "error", "message": "Invalid batch ID"}), 404
+    return jsonify(result)
+
+@app.route('/calls/jobs/<job_id>')
+def calls_job_status(job_id):
+    job = batch_queue.job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Invalid job ID"}), 404
+    return jsonify(job)
+
+@app.route('/call/<call_id>')
+def get_call(call_id):
+    session = calls.get(call_id)
+    if session is None:
+        return jsonify({"status": "error", "message": "Invalid call ID"}), 404
+    return jsonify(dict(call_store.to_json(session), transcript=timelines.transcript(session)))
+
+@app.route('/call/<call_id>/events')
+def call_events_stream(call_id):
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    stream = call_events.get(call_id)
+    if stream is None:
+        # Generated by another worker (or long ago): follow its replies in the shared store
+        if calls.get(call_id) is None:
+            return jsonify({"status": "error", "message": "Invalid call ID"}), 404
+        return Response(stream_with_context(poll_store(calls.get, call_id)), mimetype='text/event-stream',
+                        headers=headers)
+    # Resume after the last event the browser saw when EventSource reconnects, or
+    # from ?last_id= when it follows again after the stream ended (a persona joined)
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    start = int(last_id) + 1 if last_id and last_id.isdigit() else 0
+    return Response(stream_with_context(sse(stream, start)), mimetype='text/event-stream', headers=headers)
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(page_cache.snapshot())
+
+@app.route('/llm_cache_stats')
+def llm_cache_stats():
+    return jsonify(response_cache.snapshot())
+
+@app.route('/llm_transport_stats')
+def llm_transport_stats():
+    return jsonify(transport.snapshot())
+
+@app.route('/routing_stats')
+def routing_stats():
+    return jsonify(router.snapshot())
+
+@app.route('/pipeline_stats')
+def pipeline_stats():
+    return jsonify(dict(pipeline.latency_summary(), **pipeline.token_summary(), queues=pipeline.queue_depths(),
+                        timelines=timelines.stats()))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # This worker's metrics only; see metrics.py
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/debug/profile')
+def debug_profile():
+    # Collapsed stacks for flamegraph.pl / speedscope; empty unless METRICS_PROFILE_HZ is set.
+    # Not served at all unless METRICS_PROFILE_ENDPOINT=1
+    if not metrics.METRICS_PROFILE_ENDPOINT:
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    return Response(metrics.profiler.collapsed(reset=request.args.get('reset') == '1'), mimetype='text/plain')
 
 @app.route('/add_to_call', methods=['POST'])
 def add_to_call():
@@ -251,9 +406,16 @@ def add_to_call():
     call_id = data['id']
     persona_id = data['persona']
 
-    if call_id in call_data:
-        call_data[call_id]['personas'].append(persona_id)
-        return jsonify({"status": "success"})
+    try:
+        session = calls.add_persona(call_id, persona_id, data.get('version'))
+    except call_store.ConflictError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+
+    if session is not None:
+        # Generate only the new persona's reply, in the background
+        if persona_id not in session['responses']:
+            start_generation(session, [persona_id])
+        return jsonify({"status": "success", "version": session['version']})
     else:
         return jsonify({"status": "error", "message": "Invalid call ID"})
 
@@ -263,11 +425,25 @@ def remove_from_call():
     call_id = data['id']
     persona_id = data['persona']
 
-    if call_id in call_data:
-        call_data[call_id]['personas'] = [p for p in call_data[call_id]['personas'] if p != persona_id]
-        return jsonify({"status": "success"})
+    try:
+        session = calls.remove_persona(call_id, persona_id, data.get('version'))
+    except call_store.ConflictError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+
+    if session is not None:
+        return jsonify({"status": "success", "version": session['version']})
     else:
         return jsonify({"status": "error", "message": "Invalid call ID"})
 
+def shutdown(timeout=30):
+    # Stop starting batch jobs and stop the browser and converter processes first, so
+    # they are never orphaned if we are killed mid-drain; in-flight calls get what's left
+    batch_queue.stop()
+    browser_pool.shutdown()
+    converter.shutdown()
+    if not pipeline.stop(timeout):
+        print(f"Stopped with calls still running after {timeout}s")
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server; run serve.py in production
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1", threaded=True)
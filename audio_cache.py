@@ -0,0 +1,269 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration (overridable from the environment)
+TTS_CACHE_MEMORY_BYTES = int(os.environ.get("TTS_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", ".cache/tts")
+TTS_CACHE_DISK = os.environ.get("TTS_CACHE_DISK", "1") == "1"
+# Upper bound on the segment files; two generations of half this each
+TTS_CACHE_DISK_BYTES = int(os.environ.get("TTS_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+
+# Raw float model output; levelling and quantization happen per session on the way out
+SAMPLE_DTYPE = np.dtype("<f4")
+# Part of every key: bump when what gets stored changes
+CACHE_FORMAT = 1
+
+SEGMENT_FILE = re.compile(r"segments-(\d+)\.f32")
+
+
+def phrase_key(speaker: str, text: str, model_version: str) -> str:
+    """Case and whitespace differences in a phrase should hit the same audio"""
+    payload = {"speaker": speaker, "text": " ".join(text.lower().split()), "model": model_version,
+               "format": CACHE_FORMAT}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class MemoryLRU:
+    """Sample arrays by key, evicting least recently used past `max_bytes`"""
+
+    def __init__(self, max_bytes: int = TTS_CACHE_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            pcm = self._entries.get(key)
+            if pcm is not None:
+                self._entries.move_to_end(key)
+            return pcm
+
+    def put(self, key: str, pcm: np.ndarray):
+        if pcm.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self._entries[key] = pcm
+            self.bytes += pcm.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+
+class SegmentStore:
+    """Float32 segment files in generations, read through mmap, indexed in SQLite
+
+    Segments are appended to the current generation's file. Once that file
+    would pass half of `max_bytes` a new generation starts and everything
+    older than the previous one is deleted, file and index rows, so the
+    directory stays within `max_bytes`. A hit in the previous generation
+    is copied forward, so phrases still in use survive rotation, and bytes
+    left dead by a replaced key last only until their generation goes.
+    Lookups return read-only NumPy views straight into the mapping; a
+    mapping stays valid for views already handed out after its file is
+    deleted. Writes take an exclusive lock on a lock file so several
+    server processes can share one directory.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_DISK_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, "index.sqlite3")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._lock_file = open(os.path.join(directory, "segments.lock"), "a+b")
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS phrases (key TEXT PRIMARY KEY, generation INTEGER NOT NULL, "
+                "offset INTEGER NOT NULL, samples INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _segment_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"segments-{generation}.f32")
+
+    def _mapping(self, generation: int, end: int) -> Optional[mmap.mmap]:
+        # Remap only when a segment lies past the end of the current mapping.
+        # Old mappings are not closed: views handed out earlier may still use them
+        with self._lock:
+            mapping = self._maps.get(generation)
+            if mapping is None or len(mapping) < end:
+                try:
+                    with open(self._segment_path(generation), "rb") as f:
+                        size = os.fstat(f.fileno()).st_size
+                        if size < end:
+                            return None
+                        mapping = self._maps[generation] = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+                except FileNotFoundError:
+                    return None  # rotated away by another process
+            return mapping
+
+    def _forget_maps(self, current: int):
+        # Drop our references to deleted generations so their disk space can be freed (lock held)
+        for generation in [g for g in self._maps if g < current - 1]:
+            del self._maps[generation]
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self._conn().execute(
+            "SELECT p.generation, p.offset, p.samples, m.value FROM phrases p, meta m "
+            "WHERE p.key = ? AND m.name = 'generation'", (key,)).fetchone()
+        if row is None:
+            return None
+        generation, offset, samples, current = row
+        with self._lock:
+            self._forget_maps(current)
+        mapping = self._mapping(generation, offset + samples * SAMPLE_DTYPE.itemsize)
+        if mapping is None:
+            return None
+        view = np.frombuffer(mapping, dtype=SAMPLE_DTYPE, count=samples, offset=offset)
+        if generation < current:
+            self.put(key, view)  # copy forward before the next rotation deletes it
+        return view
+
+    def put(self, key: str, samples: np.ndarray):
+        samples = np.ascontiguousarray(samples, dtype=SAMPLE_DTYPE)
+        data = memoryview(samples).cast("B")
+        conn = self._conn()
+        with self._lock:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                generation = conn.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+                try:
+                    size = os.path.getsize(self._segment_path(generation))
+                except FileNotFoundError:
+                    size = 0
+                if size and size + len(data) > self.max_bytes // 2:
+                    generation = self._rotate(conn, generation)
+                with open(self._segment_path(generation), "ab") as f:
+                    offset = f.tell()
+                    f.write(data)
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO phrases (key, generation, offset, samples) "
+                                 "VALUES (?, ?, ?, ?)", (key, generation, offset, len(samples)))
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _rotate(self, conn: sqlite3.Connection, generation: int) -> int:
+        """Start generation + 1 and delete everything older than `generation` (both locks held)"""
+        current = generation + 1
+        with conn:
+            conn.execute("UPDATE meta SET value = ? WHERE name = 'generation'", (current,))
+            conn.execute("DELETE FROM phrases WHERE generation < ?", (generation,))
+        for name in os.listdir(self.directory):
+            match = SEGMENT_FILE.fullmatch(name)
+            if match and int(match.group(1)) < generation:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError as e:
+                    logger.warning(f"Could not remove old phrase segments {name}: {e}")
+        self._forget_maps(current)
+        logger.info(f"Phrase cache rotated to generation {current}")
+        return current
+
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.directory, name))
+                   for name in os.listdir(self.directory) if SEGMENT_FILE.fullmatch(name))
+
+
+class PhraseCache:
+    """Generated samples per (speaker, normalized text, model version): memory first, then disk"""
+
+    def __init__(self, model_version: str, memory: Optional[MemoryLRU] = None,
+                 disk: Optional[SegmentStore] = None):
+        self.model_version = model_version
+        self.memory = memory if memory is not None else MemoryLRU()
+        self.disk = disk
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stored": 0}
+
+    def get(self, speaker: str, text: str) -> Optional[np.ndarray]:
+        key = phrase_key(speaker, text, self.model_version)
+        pcm = self.memory.get(key)
+        if pcm is not None:
+            self.stats["memory_hits"] += 1
+            return pcm
+        if self.disk is not None:
+            try:
+                pcm = self.disk.get(key)
+            except Exception as e:
+                logger.warning(f"Phrase cache read failed: {e}")
+                pcm = None
+            if pcm is not None:
+                self.stats["disk_hits"] += 1
+                self.memory.put(key, pcm)
+                return pcm
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, speaker: str, text: str, pcm: np.ndarray):
+        if not len(pcm):
+            return
+        key = phrase_key(speaker, text, self.model_version)
+        self.memory.put(key, pcm)
+        self.stats["stored"] += 1
+        if self.disk is not None:
+            try:
+                self.disk.put(key, pcm)
+            except Exception as e:
+                logger.warning(f"Phrase cache write failed: {e}")
+
+    async def get_async(self, speaker: str, text: str) -> Optional[np.ndarray]:
+        """get() for the event loop: a memory hit answers inline, the SQLite/disk lookup runs on a thread"""
+        pcm = self.memory.get(phrase_key(speaker, text, self.model_version))
+        if pcm is not None:
+            self.stats["memory_hits"] += 1
+            return pcm
+        if self.disk is None:
+            self.stats["misses"] += 1
+            return None
+        return await asyncio.to_thread(self.get, speaker, text)
+
+    async def put_async(self, speaker: str, text: str, pcm: np.ndarray):
+        """put() for the event loop, with the disk write on a thread"""
+        if self.disk is None:
+            self.put(speaker, text, pcm)
+        else:
+            await asyncio.to_thread(self.put, speaker, text, pcm)
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, memory_bytes=self.memory.bytes, disk=self.disk is not None,
+                    disk_bytes=self.disk.disk_bytes() if self.disk is not None else 0)
+
+
+def from_env(model_version: str) -> PhraseCache:
+    """PhraseCache with the on-disk store unless TTS_CACHE_DISK=0"""
+    disk = None
+    if TTS_CACHE_DISK:
+        try:
+            disk = SegmentStore()
+        except Exception as e:
+            logger.error(f"Phrase cache directory {TTS_CACHE_DIR!r} unavailable, memory only: {e}")
+    return PhraseCache(model_version, disk=disk)
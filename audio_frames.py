@@ -0,0 +1,72 @@
+import struct
+from typing import List
+
+import numpy as np
+
+# Binary protocol: one header frame per audio chunk, then `frames` payload frames.
+#   magic "VVAF" | version u8 | format u8 | chunk_index u32 | sample_rate u32 | frames u32
+# Little-endian, 18 bytes. Metadata (text, timings) stays on the JSON side.
+HEADER = struct.Struct("<4sBBIII")
+MAGIC = b"VVAF"
+VERSION = 1
+FORMAT_CODES = {"pcm16": 1, "opus": 2}
+
+# 20 ms Opus frames; Opus only accepts 2.5/5/10/20/40/60 ms
+OPUS_FRAME_MS = 20
+
+
+def opus_available() -> bool:
+    try:
+        import opuslib  # noqa: F401  (optional, only needed for the opus format)
+    except ImportError:
+        return False
+    return True
+
+
+def binary_formats() -> List[str]:
+    return ["pcm16", "opus"] if opus_available() else ["pcm16"]
+
+
+def header(fmt: str, chunk_index: int, sample_rate: int, frames: int) -> bytes:
+    return HEADER.pack(MAGIC, VERSION, FORMAT_CODES[fmt], chunk_index, sample_rate, frames)
+
+
+def header_spec() -> dict:
+    """Description of the header sent to clients in the handshake"""
+    return {"struct": HEADER.format, "size": HEADER.size, "magic": MAGIC.decode(),
+            "fields": ["magic", "version", "format", "chunk_index", "sample_rate", "frames"],
+            "formats": FORMAT_CODES}
+
+
+class OpusEncoder:
+    """Mono Opus encoder for one session (the codec keeps state between frames)"""
+
+    def __init__(self, sample_rate: int):
+        import opuslib
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * OPUS_FRAME_MS // 1000
+        self.encoder = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_VOIP)
+        # Samples short of a full frame, held for the front of the next chunk
+        self._leftover = np.zeros(0, dtype="<i2")
+
+    def reset(self):
+        self._leftover = np.zeros(0, dtype="<i2")
+
+    def encode(self, samples: np.ndarray, last: bool = False) -> List[bytes]:
+        """Opus packets for whole frames; with `last`, the final partial frame is padded with silence"""
+        if len(self._leftover):
+            samples = np.concatenate([self._leftover, samples])
+        remainder = len(samples) % self.frame_size
+        if remainder and last:
+            samples = np.concatenate([samples, np.zeros(self.frame_size - remainder, dtype="<i2")])
+            self._leftover = np.zeros(0, dtype="<i2")
+        elif remainder:
+            # Copied: `samples` may be a buffer the caller reuses
+            self._leftover = samples[-remainder:].copy()
+            samples = samples[:-remainder]
+        else:
+            self._leftover = np.zeros(0, dtype="<i2")
+        view = memoryview(np.ascontiguousarray(samples)).cast("B")
+        step = self.frame_size * 2
+        return [self.encoder.encode(view[i:i + step].tobytes(), self.frame_size)
+                for i in range(0, len(view), step)]
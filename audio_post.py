@@ -0,0 +1,115 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+# Post-processing configuration (overridable from the environment)
+# Target RMS relative to full scale (0.1 ~ -20 dBFS)
+TTS_TARGET_RMS = float(os.environ.get("TTS_TARGET_RMS", "0.1"))
+TTS_MAX_GAIN = float(os.environ.get("TTS_MAX_GAIN", "8"))
+# Weight of the newest chunk in the running loudness estimate
+TTS_LOUDNESS_SMOOTHING = float(os.environ.get("TTS_LOUDNESS_SMOOTHING", "0.3"))
+TTS_CROSSFADE_MS = float(os.environ.get("TTS_CROSSFADE_MS", "5"))
+# Peaks above this (relative to full scale) are softly compressed instead of clipped
+TTS_LIMIT_THRESHOLD = float(os.environ.get("TTS_LIMIT_THRESHOLD", "0.9"))
+
+PCM16_SCALE = 32767.0
+
+
+class SessionAudioProcessor:
+    """Loudness-levels and joins one session's chunks, float model output in, PCM16 out
+
+    Keeps a running RMS across chunks so the voice does not jump in volume
+    at chunk boundaries, and crossfades each boundary: the last few ms of a
+    chunk are held back and blended with the start of the next. Gain and
+    peak limiting happen in float; samples are quantized to int16 once, at
+    the end. Work is done in place in buffers that grow only when a longer
+    chunk arrives. The returned array is reused by the next call, so send
+    it (or copy it) before processing another chunk.
+    """
+
+    def __init__(self, sample_rate: int, target_rms: float = TTS_TARGET_RMS, max_gain: float = TTS_MAX_GAIN,
+                 smoothing: float = TTS_LOUDNESS_SMOOTHING, crossfade_ms: float = TTS_CROSSFADE_MS,
+                 limit_threshold: float = TTS_LIMIT_THRESHOLD):
+        self.target = target_rms
+        self.max_gain = max_gain
+        self.threshold = limit_threshold
+        self.smoothing = smoothing
+        self.fade = int(sample_rate * crossfade_ms / 1000)
+        self.loudness: Optional[float] = None
+        self._work = np.empty(0, dtype=np.float32)
+        self._out = np.empty(0, dtype="<i2")
+        self._tail = np.empty(self.fade, dtype=np.float32)
+        self._tail_len = 0
+        ramp = np.linspace(0.0, 1.0, self.fade + 2, dtype=np.float32)[1:-1]
+        self._fade_in, self._fade_out = ramp, ramp[::-1].copy()
+
+    def reset_boundary(self):
+        """Forget the held-back tail (new utterance, or the last one was cut off)"""
+        self._tail_len = 0
+
+    def _buffers(self, n: int):
+        if len(self._work) < n:
+            self._work = np.empty(n, dtype=np.float32)
+            self._out = np.empty(n, dtype="<i2")
+        return self._work[:n], self._out
+
+    def _gain(self, work: np.ndarray) -> float:
+        rms = float(np.sqrt(np.dot(work, work) / len(work)))
+        if rms <= 0:
+            return 1.0 if self.loudness is None else min(self.max_gain, self.target / self.loudness)
+        self.loudness = rms if self.loudness is None else (
+            self.smoothing * rms + (1 - self.smoothing) * self.loudness)
+        return min(self.max_gain, self.target / self.loudness)
+
+    def _limit(self, work: np.ndarray):
+        """Soft-knee limiter in place: |x| above the threshold is bent towards 1.0 with tanh"""
+        peak = max(float(work.max()), -float(work.min()))
+        if peak <= self.threshold:
+            return
+        knee = 1.0 - self.threshold
+        over = np.abs(work) > self.threshold
+        hot = work[over]
+        magnitude = np.abs(hot)
+        magnitude -= self.threshold
+        magnitude /= knee
+        np.tanh(magnitude, out=magnitude)
+        magnitude *= knee
+        magnitude += self.threshold
+        work[over] = np.copysign(magnitude, hot)
+
+    def process(self, samples: np.ndarray, last: bool = False) -> np.ndarray:
+        """Level one chunk of float samples (full scale 1.0) into PCM16; with `last`, nothing is held back"""
+        n = len(samples)
+        if not n:
+            return self._out[:0]
+        work, out = self._buffers(n)
+        np.copyto(work, samples, casting="unsafe")
+        gain = self._gain(work)
+
+        # Gain and limiting in float, in place; quantized once below
+        np.multiply(work, gain, out=work)
+        self._limit(work)
+
+        fade = min(self.fade, self._tail_len, n)
+        if fade:
+            # Overlap-add the previous chunk's tail onto this chunk's head (complementary
+            # ramps, so the sum stays within the limited range)
+            head = work[:fade]
+            np.multiply(head, self._fade_in[:fade], out=head)
+            tail = self._tail[:fade]
+            np.multiply(tail, self._fade_out[:fade], out=tail)
+            head += tail
+        self._tail_len = 0
+
+        keep = 0 if last or n <= self.fade else self.fade
+        if keep:
+            self._tail[:keep] = work[n - keep:]
+            self._tail_len = keep
+        end = n - keep
+        body = work[:end]
+        np.multiply(body, PCM16_SCALE, out=body)
+        np.clip(body, -PCM16_SCALE, PCM16_SCALE, out=body)
+        np.rint(body, out=body)
+        np.copyto(out[:end], body, casting="unsafe")
+        return out[:end]
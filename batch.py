@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+import concurrent.futures
+import heapq
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import metrics
+from page_cache import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# Batch configuration (overridable from the environment / .env)
+# The queue lives in one process: serve.py refuses several workers while this is on
+BATCH_ENABLED = os.environ.get("BATCH_ENABLED", "1") == "1"
+# Batch calls in the pipeline at once, so interactive calls aren't queued behind them
+BATCH_MAX_INFLIGHT = int(os.environ.get("BATCH_MAX_INFLIGHT", "16"))
+# Batch calls in flight per host, to stay polite to any one site
+BATCH_DOMAIN_CONCURRENCY = int(os.environ.get("BATCH_DOMAIN_CONCURRENCY", "2"))
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", "20000"))
+BATCH_MAX_SUBMIT = int(os.environ.get("BATCH_MAX_SUBMIT", "5000"))
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+FINISHED = ("done", "error")
+
+# (url, persona ids, release_domain) -> (call id, future resolving to the finished pipeline
+# CallJob); release_domain() is called once the call has fetched its page and is off the site
+StartCall = Callable[[str, List[str], Callable[[], None]], Tuple[str, concurrent.futures.Future]]
+
+
+class BatchError(ValueError):
+    """A batch job description that can't be queued"""
+
+
+class BatchClosed(RuntimeError):
+    """The queue has been stopped (the process is shutting down)"""
+
+
+class BatchJob:
+    """One {url, personas} entry of a batch and the call it became"""
+
+    def __init__(self, job_id: str, batch_id: str, url: str, personas: List[str], priority: int):
+        self.id = job_id
+        self.batch_id = batch_id
+        self.url = url
+        self.personas = personas
+        self.priority = priority
+        self.domain = (urlsplit(url).hostname or "").lower()
+        self.key = (normalize_url(url), tuple(sorted(personas)))
+        self.status = "queued"
+        self.call_id: Optional[str] = None
+        # Whether the job still counts against its domain's limit
+        self.holds_domain = False
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_json(self) -> dict:
+        return {"id": self.id, "batch_id": self.batch_id, "url": self.url, "personas": self.personas,
+                "priority": self.priority, "status": self.status, "call_id": self.call_id, "error": self.error,
+                "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at}
+
+
+def parse_job(entry, default_priority="normal") -> Tuple[str, List[str], int]:
+    """(url, personas, priority) from a {"url", "personas", "priority"?} object"""
+    if not isinstance(entry, dict):
+        raise BatchError("expected an object with url and personas")
+    url, personas = entry.get("url"), entry.get("personas")
+    if not isinstance(url, str) or not urlsplit(url).hostname:
+        raise BatchError("url must be an absolute URL")
+    if not isinstance(personas, list) or not personas or not all(isinstance(p, str) for p in personas):
+        raise BatchError("personas must be a non-empty list of persona ids")
+    return url, personas, parse_priority(entry.get("priority", default_priority))
+
+
+def parse_priority(value) -> int:
+    """A priority name or integer (lower runs first); integers may come as query-string digits"""
+    if isinstance(value, str):
+        if value in PRIORITIES:
+            return PRIORITIES[value]
+        if value.lstrip("-").isdigit():
+            return int(value)
+        raise BatchError(f"priority must be one of {', '.join(PRIORITIES)} or an integer")
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise BatchError("priority must be a name or an integer (lower runs first)")
+    return value
+
+
+def call_error(future: concurrent.futures.Future) -> Optional[BaseException]:
+    """Why a started call failed, or None: the pipeline raising, or every persona's turn failing
+
+    The summarize stage keeps per-persona failures in the job, so a call
+    whose turns all failed still resolves normally.
+    """
+    if future.cancelled():
+        return concurrent.futures.CancelledError()
+    error = future.exception()
+    if error is not None:
+        return error
+    call = future.result()
+    if not call.responses or set(call.errors) >= set(call.personas):
+        details = "; ".join(f"{persona}: {message}" for persona, message in call.errors.items())
+        return RuntimeError(f"every persona failed{': ' + details if details else ''}")
+    return None
+
+
+def parse_jsonl(text: str) -> Iterable[Tuple[int, object]]:
+    """(line number, decoded value) for each non-blank line; bad JSON is yielded as a BatchError"""
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, BatchError(f"invalid JSON: {e}")
+
+
+class BatchQueue:
+    """Priority queue of batch jobs, started as calls by one dispatcher thread
+
+    Jobs run in priority order (then submission order) subject to a global
+    in-flight cap and a per-domain one; a job for a busy domain waits while
+    later jobs for other domains go ahead. The domain slot is held only
+    while the call scrapes; its LLM turns count against the global cap
+    alone. A job whose URL and persona set match one still queued, running
+    or finished (while its call still exists, per `call_exists`) is
+    answered with that job instead of making a second call. Jobs live in
+    this process only, like the memory call store.
+    """
+
+    def __init__(self, start_call: StartCall, max_inflight: int = BATCH_MAX_INFLIGHT,
+                 domain_concurrency: int = BATCH_DOMAIN_CONCURRENCY, max_jobs: int = BATCH_MAX_JOBS,
+                 call_exists: Optional[Callable[[str], bool]] = None):
+        self.start_call = start_call
+        self.call_exists = call_exists
+        self.max_inflight = max_inflight
+        self.domain_concurrency = domain_concurrency
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        self.batches: Dict[str, List[str]] = {}
+        self._by_key: Dict[tuple, str] = {}
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._ids = itertools.count(1)
+        self._running: Dict[str, int] = {}
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        metrics.gauge_fn("batch_jobs", self.counts, label="status", help="Batch jobs by status")
+
+    def start(self):
+        with self._cond:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._dispatch, name="batch-dispatch", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Stop starting jobs; queued ones stay queued and later submits raise BatchClosed"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _reusable(self, job_id: Optional[str]) -> bool:
+        """Whether a duplicate can be answered with this job (its call may have expired)"""
+        if job_id is None:
+            return False
+        job = self.jobs[job_id]
+        if job.status == "error":
+            return False
+        if job.status == "done" and self.call_exists is not None and not self.call_exists(job.call_id):
+            return False
+        return True
+
+    def submit(self, entries: Iterable[Tuple[int, object]], priority="normal") -> dict:
+        """Queue numbered job entries as one batch; returns its id, job ids and per-entry errors"""
+        self.start()
+        batch_id = f"b{int(time.time() * 1000):x}{next(self._ids):x}"
+        accepted, duplicates, errors = [], 0, []
+        with self._cond:
+            if self._stopped:
+                raise BatchClosed("batch queue is shutting down")
+            for number, entry in entries:
+                if len(accepted) + len(errors) >= BATCH_MAX_SUBMIT:
+                    errors.append({"line": number, "error": f"more than {BATCH_MAX_SUBMIT} jobs in one batch"})
+                    break
+                try:
+                    if isinstance(entry, BatchError):
+                        raise entry
+                    url, personas, level = parse_job(entry, priority)
+                except BatchError as e:
+                    errors.append({"line": number, "error": str(e)})
+                    continue
+                key = (normalize_url(url), tuple(sorted(personas)))
+                existing = self._by_key.get(key)
+                if self._reusable(existing):
+                    accepted.append({"line": number, "job_id": existing, "duplicate": True})
+                    duplicates += 1
+                    continue
+                job = BatchJob(f"{batch_id}-{number}", batch_id, url, personas, level)
+                self.jobs[job.id] = job
+                self._by_key[job.key] = job.id
+                heapq.heappush(self._heap, (job.priority, next(self._sequence), job.id))
+                accepted.append({"line": number, "job_id": job.id})
+            self.batches[batch_id] = [item["job_id"] for item in accepted]
+            self._trim()
+            self._cond.notify()
+        metrics.inc("batch_jobs_submitted_total", len(accepted) - duplicates)
+        return {"batch_id": batch_id, "jobs": accepted, "duplicates": duplicates, "errors": errors}
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond max_jobs; queued and running ones stay
+        excess = len(self.jobs) - self.max_jobs
+        for job_id in [k for k, job in self.jobs.items() if job.status in FINISHED][:max(0, excess)]:
+            job = self.jobs.pop(job_id)
+            if self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
+        if excess > 0:
+            for batch_id in [b for b, ids in self.batches.items() if not any(i in self.jobs for i in ids)]:
+                del self.batches[batch_id]
+
+    def _next_job(self) -> Optional[BatchJob]:
+        """Highest-priority queued job whose domain has room (caller holds the lock)"""
+        if self._inflight >= self.max_inflight:
+            return None
+        deferred, chosen = [], None
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            job = self.jobs.get(item[2])
+            if job is None or job.status != "queued":
+                continue
+            if self._running.get(job.domain, 0) >= self.domain_concurrency:
+                deferred.append(item)
+                continue
+            chosen = job
+            break
+        for item in deferred:
+            heapq.heappush(self._heap, item)
+        return chosen
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                job = None if self._stopped else self._next_job()
+                while job is None:
+                    if self._stopped:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                job.status = "running"
+                job.started_at = time.time()
+                job.holds_domain = True
+                self._running[job.domain] = self._running.get(job.domain, 0) + 1
+                self._inflight += 1
+            try:
+                job.call_id, future = self.start_call(job.url, job.personas,
+                                                      lambda job=job: self._release_domain(job))
+            except Exception as e:
+                self._finish(job, e)
+                continue
+            future.add_done_callback(lambda f, job=job: self._finish(job, call_error(f)))
+
+    def _release_domain(self, job: BatchJob):
+        with self._cond:
+            self._release_domain_locked(job)
+            self._cond.notify()
+
+    def _release_domain_locked(self, job: BatchJob):
+        if not job.holds_domain:
+            return
+        job.holds_domain = False
+        self._running[job.domain] -= 1
+        if not self._running[job.domain]:
+            del self._running[job.domain]
+
+    def _finish(self, job: BatchJob, error: Optional[BaseException]):
+        with self._cond:
+            job.status = "error" if error is not None else "done"
+            job.error = str(error) if error is not None else None
+            job.finished_at = time.time()
+            self._release_domain_locked(job)
+            self._inflight -= 1
+            self._cond.notify()
+        metrics.inc("batch_jobs_finished_total", status=job.status)
+        if job.started_at is not None:
+            metrics.observe("batch_job_seconds", job.finished_at - job.started_at)
+
+    def job(self, job_id: str) -> Optional[dict]:
+        with self._cond:
+            job = self.jobs.get(job_id)
+            return job.to_json() if job else None
+
+    def batch(self, batch_id: str) -> Optional[dict]:
+        with self._cond:
+            job_ids = self.batches.get(batch_id)
+            if job_ids is None:
+                return None
+            jobs = [self.jobs[job_id].to_json() for job_id in dict.fromkeys(job_ids) if job_id in self.jobs]
+        counts = {status: 0 for status in ("queued", "running", "done", "error")}
+        for job in jobs:
+            counts[job["status"]] += 1
+        return {"batch_id": batch_id, "counts": counts, "complete": not counts["queued"] and not counts["running"],
+                "jobs": jobs}
+
+    def counts(self) -> Dict[str, int]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+
+def import_file(path: str, server: str, priority: str = "normal") -> dict:
+    """POST a JSONL file of {url, personas, priority?} lines to a running app's /calls/batch"""
+    with open(path, "rb") as f:
+        body = f.read()
+    req = urllib.request.Request(f"{server.rstrip('/')}/calls/batch?priority={priority}", data=body,
+                                 method="POST", headers={"Content-Type": "application/x-ndjson"})
+    with urllib.request.urlopen(req, timeout=60) as response:
+        return json.loads(response.read())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"usage: {sys.argv[0]} FILE.jsonl [SERVER] [high|normal|low]")
+        sys.exit(2)
+    server = sys.argv[2] if len(sys.argv) > 2 else "http://localhost:5000"
+    result = import_file(sys.argv[1], server, *sys.argv[3:4])
+    print(f"batch {result['batch_id']}: {len(result['jobs'])} jobs "
+          f"({result['duplicates']} duplicates), {len(result['errors'])} errors")
+    for error in result["errors"]:
+        print(f"  line {error['line']}: {error['error']}")
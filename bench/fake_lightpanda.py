@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Stand-in for the lightpanda binary that serves fixture HTML
+
+    fake_lightpanda.py fetch [--dump] URL          # one-shot, prints the page
+    fake_lightpanda.py serve --host H --port P     # CDP server for browser_pool
+
+Each URL maps to one of the files in BENCH_FIXTURES (default
+bench/fixtures) by hash, so a benchmark can spread requests over many
+URLs while the content stays deterministic. BENCH_FETCH_MS adds a
+simulated page-load delay. `serve` answers only the CDP commands
+browser_pool.LightpandaInstance.fetch sends.
+"""
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+
+FIXTURES = os.environ.get("BENCH_FIXTURES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+FETCH_MS = float(os.environ.get("BENCH_FETCH_MS", "150"))
+
+
+def load_pages():
+    pages = sorted(name for name in os.listdir(FIXTURES) if name.endswith(".html"))
+    if not pages:
+        raise SystemExit(f"no fixtures in {FIXTURES}")
+    contents = []
+    for name in pages:
+        with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+            contents.append(f.read())
+    return contents
+
+
+def page_for(pages, url):
+    return pages[int(hashlib.sha256(url.encode("utf-8")).hexdigest(), 16) % len(pages)]
+
+
+def fetch(argv):
+    if not argv:
+        print("usage: fake_lightpanda.py fetch [--dump] URL", file=sys.stderr)
+        return 2
+    pages = load_pages()
+    time.sleep(FETCH_MS / 1000)
+    sys.stdout.write(page_for(pages, argv[-1]))
+    return 0
+
+
+def serve(argv):
+    import argparse
+    from websockets.sync.server import serve as ws_serve
+
+    parser = argparse.ArgumentParser(prog="fake_lightpanda.py serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9222)
+    args = parser.parse_args(argv)
+    pages = load_pages()
+    ids = itertools.count(1)
+
+    def handle(ws):
+        # One connection per page load, like browser_pool uses it
+        urls = {}
+        for raw in ws:
+            message = json.loads(raw)
+            method, params = message.get("method"), message.get("params") or {}
+            session_id = message.get("sessionId")
+            result = {}
+            if method == "Target.createBrowserContext":
+                result = {"browserContextId": f"ctx-{next(ids)}"}
+            elif method == "Target.createTarget":
+                result = {"targetId": f"target-{next(ids)}"}
+            elif method == "Target.attachToTarget":
+                result = {"sessionId": f"session-{next(ids)}"}
+            elif method == "Page.navigate":
+                urls[session_id] = params.get("url", "")
+                result = {"frameId": session_id}
+            elif method == "Runtime.evaluate":
+                if session_id not in urls:
+                    ws.send(json.dumps({"id": message["id"], "error": {"message": "no page loaded"}}))
+                    continue
+                result = {"result": {"type": "string", "value": page_for(pages, urls[session_id])}}
+            reply = {"id": message["id"], "result": result}
+            if session_id:
+                reply["sessionId"] = session_id
+            ws.send(json.dumps(reply))
+            if method == "Page.navigate":
+                time.sleep(FETCH_MS / 1000)
+                ws.send(json.dumps({"method": "Page.loadEventFired", "params": {"timestamp": time.time()},
+                                    "sessionId": session_id}))
+
+    with ws_serve(handle, args.host, args.port, max_size=None) as server:
+        server.serve_forever()
+    return 0
+
+
+def main(argv):
+    if argv and argv[0] == "fetch":
+        return fetch(argv[1:])
+    if argv and argv[0] == "serve":
+        return serve(argv[1:])
+    print("usage: fake_lightpanda.py fetch [--dump] URL | serve --host H --port P", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
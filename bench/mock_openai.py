@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""OpenAI-compatible chat completions server with tunable latency, for benchmarks
+
+    python bench/mock_openai.py --port 8911 --latency-ms 300 --tokens-per-s 60
+
+Point the app at it with OPENROUTER_BASE_URL=http://127.0.0.1:8911/v1.
+A model whose name contains "slow" waits `--slow-factor` times longer,
+and one containing "flaky" fails `--error-rate` of its requests with 503,
+so routing and hedging can be exercised too.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the party line never sleeps and everyone has an opinion about this page "
+         "which is honestly a lot to take in but here we go again with feeling").split()
+
+
+class MockState:
+    def __init__(self, latency_ms: float, tokens_per_s: float, reply_tokens: int,
+                 slow_factor: float, error_rate: float):
+        self.latency = latency_ms / 1000
+        self.token_interval = 1 / tokens_per_s if tokens_per_s > 0 else 0
+        self.reply_tokens = reply_tokens
+        self.slow_factor = slow_factor
+        self.error_rate = error_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _chunk(self, text: str):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._json(200, {"object": "list", "data": [{"id": "mock/model", "object": "model"}]})
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+            with state.lock:
+                state.requests += 1
+
+            model = request.get("model", "mock/model")
+            if "flaky" in model and random.random() < state.error_rate:
+                self._json(503, {"error": {"message": "mock overloaded", "code": 503}})
+                return
+            factor = state.slow_factor if "slow" in model else 1.0
+            tokens = min(state.reply_tokens, int(request.get("max_tokens") or state.reply_tokens))
+            reply = [random.choice(WORDS) + " " for _ in range(tokens)]
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            time.sleep(state.latency * factor)
+
+            if not request.get("stream"):
+                self._json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(reply).strip()}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i, token in enumerate(reply):
+                    if i and state.token_interval:
+                        time.sleep(state.token_interval * factor)
+                    event = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [{"index": 0, "delta": {"content": token},
+                                                          "finish_reason": None}]}
+                    self._chunk(f"data: {json.dumps(event)}\n\n")
+                final = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self._chunk(f"data: {json.dumps(final)}\n\n")
+                self._chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client hung up (e.g. a cancelled hedge)
+
+    return Handler
+
+
+def serve(port: int, latency_ms: float = 300, tokens_per_s: float = 60, reply_tokens: int = 60,
+          slow_factor: float = 4, error_rate: float = 0.2, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    state = MockState(latency_ms, tokens_per_s, reply_tokens, slow_factor, error_rate)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--latency-ms", type=float, default=300, help="time to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=60)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--slow-factor", type=float, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    args = parser.parse_args()
+    server = serve(args.port, args.latency_ms, args.tokens_per_s, args.reply_tokens,
+                   args.slow_factor, args.error_rate)
+    print(f"Mock OpenAI API on http://127.0.0.1:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""Load test for the app and the TTS server against a local mock stack
+
+    python bench/run.py                                  # start everything, run all scenarios
+    python bench/run.py --scenarios call --concurrency 32 --requests 400
+    python bench/run.py --compare bench/results/<older>.json
+
+By default this starts the mock OpenAI API (bench/mock_openai.py), the app
+with bench/fake_lightpanda.py as its browser (a CDP pool, as in production;
+--browser-pool 0 measures the one-shot `fetch` subprocess path instead), and the TTS server with a
+stub model (bench/stub_tts.py), so runs need no network, keys or GPU and
+are repeatable. Pass --app-url / --tts-url to drive servers you started
+yourself instead. The scenarios mirror call_urls.sh plus a speech session.
+Each run writes latency percentiles, throughput, errors and peak memory to
+bench/results/ as JSON, tagged with the git commit, for --compare.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+SCENARIOS = ("scrape", "call", "tts")
+PERSONAS = ["cool-dude", "nerd"]
+TTS_TEXT = ("Okay, so this page is about party lines. Honestly? It's the first group chat, "
+            "and everyone was listening in. Five minutes was considered a polite call. Wild.")
+
+
+# -- services ---------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args[:3]} exited with {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on {port} after {timeout:.0f}s")
+
+
+class Stack:
+    """The mock API, the app and the stub TTS as child processes"""
+
+    def __init__(self, args):
+        self.args = args
+        self.tmp = tempfile.mkdtemp(prefix="bench-")
+        self.procs: Dict[str, subprocess.Popen] = {}
+        self.browser = "whatever the app at --app-url is configured with"
+
+    def _spawn(self, name: str, cmd: List[str], env: Optional[dict] = None) -> subprocess.Popen:
+        log = open(os.path.join(self.tmp, f"{name}.log"), "w")
+        proc = subprocess.Popen(cmd, cwd=ROOT, env={**os.environ, **(env or {})},
+                                stdout=log, stderr=subprocess.STDOUT)
+        self.procs[name] = proc
+        return proc
+
+    def start(self, scenarios):
+        args = self.args
+        if args.app_url is None and {"scrape", "call"} & set(scenarios):
+            env = {}
+            if args.convert_processes is not None:
+                env["CONVERT_PROCESSES"] = str(args.convert_processes)
+            mock_port, app_port = free_port(), free_port()
+            mock = self._spawn("mock_openai", [
+                sys.executable, os.path.join(BENCH_DIR, "mock_openai.py"), "--port", str(mock_port),
+                "--latency-ms", str(args.llm_latency_ms), "--tokens-per-s", str(args.tokens_per_s),
+                "--reply-tokens", str(args.reply_tokens)])
+            wait_for_port(mock_port, mock)
+            app = self._spawn("app", [
+                sys.executable, "-c",
+                f"import app; app.app.run(host='127.0.0.1', port={app_port}, threaded=True)"], env={
+                "OPENROUTER_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+                "OPENROUTER_API_KEY": "bench",
+                "LLM_MODELS": args.models,
+                "LLM_CACHE_BACKEND": "off",
+                "LIGHTPANDA_BINARY": os.path.join(BENCH_DIR, "fake_lightpanda.py"),
+                "LIGHTPANDA_POOL_SIZE": str(args.browser_pool),
+                "BENCH_FETCH_MS": str(args.fetch_ms),
+                "PAGE_CACHE_DIR": os.path.join(self.tmp, "pages"),
+                "PAGE_CACHE_REVALIDATE": "0",
+                "CALL_STORE_BACKEND": "memory",
+                **env,
+            })
+            wait_for_port(app_port, app)
+            args.app_url = f"http://127.0.0.1:{app_port}"
+            self.browser = (f"fake CDP pool of {args.browser_pool}" if args.browser_pool > 0
+                            else "fake one-shot `fetch` subprocess per page")
+        if args.tts_url is None and "tts" in scenarios:
+            tts_port = free_port()
+            tts = self._spawn("stub_tts", [
+                sys.executable, os.path.join(BENCH_DIR, "stub_tts.py"), "--port", str(tts_port),
+                "--ms-per-word", str(args.tts_ms_per_word)])
+            wait_for_port(tts_port, tts)
+            args.tts_url = f"ws://127.0.0.1:{tts_port}"
+
+    def memory(self) -> Dict[str, dict]:
+        return {name: rss(proc.pid) for name, proc in self.procs.items() if proc.poll() is None}
+
+    def stop(self):
+        for proc in self.procs.values():
+            proc.terminate()
+        for proc in self.procs.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        print(f"Service logs in {self.tmp}")
+
+
+def rss(pid: int) -> dict:
+    """Current and peak resident set size in MB (Linux)"""
+    readings = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key = "rss_mb" if line.startswith("VmRSS") else "peak_rss_mb"
+                    readings[key] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return readings
+
+
+# -- scenarios --------------------------------------------------------------
+
+def http(method: str, url: str, body: Optional[dict] = None, timeout: float = 120):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def page_url(args, i: int) -> str:
+    # A small pool measures the warm page cache; unique URLs measure cold scrapes
+    n = i % args.url_pool if args.url_pool else i
+    return f"https://bench.example/page/{n}"
+
+
+def scenario_scrape(args, i: int) -> Dict[str, float]:
+    started = time.perf_counter()
+    http("POST", f"{args.app_url}/scrape", {"url": page_url(args, i)})
+    return {"latency": time.perf_counter() - started}
+
+
+def scenario_call(args, i: int) -> Dict[str, float]:
+    """POST /call, follow its SSE stream to "done", then add and remove a persona"""
+    started = time.perf_counter()
+    call_id = http("POST", f"{args.app_url}/call", {"url": page_url(args, i), "personas": PERSONAS})["id"]
+    timings = {"accept": time.perf_counter() - started}
+
+    with urllib.request.urlopen(f"{args.app_url}/call/{call_id}/events", timeout=120) as events:
+        event_type = None
+        for raw in events:
+            line = raw.decode("utf-8").rstrip("\n")
+            if line.startswith("event: "):
+                event_type = line[7:]
+            elif line.startswith("data: "):
+                if event_type == "token" and "first_token" not in timings:
+                    timings["first_token"] = time.perf_counter() - started
+                elif event_type == "response" and "first_response" not in timings:
+                    timings["first_response"] = time.perf_counter() - started
+                elif event_type == "error":
+                    raise RuntimeError(json.loads(line[6:]).get("message"))
+                elif event_type == "done":
+                    timings["complete"] = time.perf_counter() - started
+                    break
+    if "complete" not in timings:
+        raise RuntimeError("event stream ended before done")
+
+    for route in ("add_to_call", "remove_from_call"):
+        step = time.perf_counter()
+        reply = http("POST", f"{args.app_url}/{route}", {"id": call_id, "persona": "chef"})
+        if reply.get("status") != "success":
+            raise RuntimeError(f"{route}: {reply.get('message')}")
+        timings[route] = time.perf_counter() - step
+    return timings
+
+
+async def tts_session(args, i: int) -> Dict[str, float]:
+    import websockets
+
+    async with websockets.connect(args.tts_url, max_size=None) as ws:
+        json.loads(await ws.recv())  # connection_established
+        await ws.send(json.dumps({"type": "configure", "protocol": "binary", "format": "pcm16"}))
+        while json.loads(await ws.recv()).get("type") != "configured":
+            pass
+        # A distinct sentence per request keeps the phrase cache from answering
+        text = TTS_TEXT if args.tts_cached else f"Take {i}. {TTS_TEXT}"
+        started = time.perf_counter()
+        await ws.send(json.dumps({"type": "generate_speech", "text": text, "speaker_names": ["Alice"]}))
+        timings = {}
+        async for message in ws:
+            if isinstance(message, bytes):
+                if "first_audio" not in timings:
+                    timings["first_audio"] = time.perf_counter() - started
+                if args.tts_unpaced:
+                    # Claim an empty buffer so the server sends as fast as it can generate
+                    await ws.send(json.dumps({"type": "buffer_status", "buffered_ms": 0}))
+                continue
+            reply = json.loads(message)
+            if reply["type"] == "generation_complete":
+                timings["complete"] = time.perf_counter() - started
+                return timings
+            if reply["type"] == "error":
+                raise RuntimeError(reply.get("message"))
+    raise RuntimeError("connection closed before generation_complete")
+
+
+def scenario_tts(args, i: int) -> Dict[str, float]:
+    return asyncio.run(tts_session(args, i))
+
+
+SCENARIO_FNS: Dict[str, Callable] = {"scrape": scenario_scrape, "call": scenario_call, "tts": scenario_tts}
+
+
+# -- driver -----------------------------------------------------------------
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest rank
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, dict]:
+    summary = {}
+    for name, values in samples.items():
+        values = sorted(values)
+        summary[name] = {"n": len(values), "mean_ms": round(1000 * sum(values) / len(values), 1),
+                         **{f"p{q}_ms": round(1000 * percentile(values, q), 1) for q in (50, 95, 99)},
+                         "max_ms": round(1000 * values[-1], 1)}
+    return summary
+
+
+def run_scenario(name: str, args, stack: Optional[Stack]) -> dict:
+    """Closed loop: `concurrency` workers each issue requests back to back"""
+    fn = SCENARIO_FNS[name]
+    counter = iter(range(args.requests))
+    lock = threading.Lock()
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            try:
+                timings = fn(args, i)
+            except Exception as e:
+                key = f"{type(e).__name__}: {e}"[:120]
+                with lock:
+                    errors[key] = errors.get(key, 0) + 1
+                continue
+            with lock:
+                for metric, seconds in timings.items():
+                    samples.setdefault(metric, []).append(seconds)
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(args.concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    failed = sum(errors.values())
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round((args.requests - failed) / elapsed, 2),
+        "errors": failed,
+        "error_kinds": errors,
+        "latency": summarize(samples),
+        "memory": stack.memory() if stack else {},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def server_stats(args) -> dict:
+    """The app's own view of the run, saved alongside the client-side numbers"""
+    stats = {}
+    for route in ("pipeline_stats", "cache_stats", "routing_stats"):
+        try:
+            stats[route] = http("GET", f"{args.app_url}/{route}", timeout=5)
+        except (OSError, ValueError, urllib.error.URLError):
+            pass
+    return stats
+
+
+def print_report(result: dict):
+    print(f"\nbrowser: {result['browser']}")
+    for name, scenario in result["scenarios"].items():
+        print(f"\n{name}: {scenario['throughput_rps']} req/s, {scenario['errors']} errors "
+              f"({scenario['requests']} requests, concurrency {scenario['concurrency']})")
+        for metric, s in scenario["latency"].items():
+            print(f"  {metric:<18} p50 {s['p50_ms']:>8.1f}  p95 {s['p95_ms']:>8.1f}  p99 {s['p99_ms']:>8.1f} ms")
+        for kind, count in scenario["error_kinds"].items():
+            print(f"  ! {count} x {kind}")
+        for service, mem in scenario["memory"].items():
+            print(f"  {service:<18} rss {mem.get('rss_mb', 0):.0f} MB, peak {mem.get('peak_rss_mb', 0):.0f} MB")
+
+
+def compare(old: dict, new: dict):
+    """Side-by-side of two result files; negative latency deltas are improvements"""
+    print(f"\n{old['commit']} -> {new['commit']}")
+    if old.get("browser") != new.get("browser"):
+        print(f"  ! browser differs: {old.get('browser')} -> {new.get('browser')}")
+    for name, scenario in new["scenarios"].items():
+        before = old["scenarios"].get(name)
+        if not before:
+            continue
+        change = (scenario["throughput_rps"] - before["throughput_rps"]) / max(before["throughput_rps"], 1e-9)
+        print(f"\n{name}: {before['throughput_rps']} -> {scenario['throughput_rps']} req/s ({change:+.0%}), "
+              f"errors {before['errors']} -> {scenario['errors']}")
+        for metric, s in scenario["latency"].items():
+            b = before["latency"].get(metric)
+            if not b:
+                continue
+            deltas = "  ".join(
+                f"{q} {b[f'{q}_ms']:.0f}->{s[f'{q}_ms']:.0f} "
+                f"({(s[f'{q}_ms'] - b[f'{q}_ms']) / max(b[f'{q}_ms'], 1e-9):+.0%})"
+                for q in ("p50", "p95", "p99"))
+            print(f"  {metric:<18} {deltas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="per scenario")
+    parser.add_argument("--url-pool", type=int, default=0,
+                        help="distinct page URLs to cycle through; 0 = every request a new (uncached) page")
+    parser.add_argument("--app-url", help="use a running app instead of starting one")
+    parser.add_argument("--tts-url", help="use a running TTS server instead of starting the stub")
+    parser.add_argument("--models", default="mock/model", help="LLM_MODELS for the started app")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-s", type=float, default=60)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--fetch-ms", type=float, default=150, help="simulated page load time")
+    parser.add_argument("--browser-pool", type=int, default=2,
+                        help="LIGHTPANDA_POOL_SIZE for the started app; 0 = one `fetch` subprocess per page")
+    parser.add_argument("--convert-processes", type=int,
+                        help="CONVERT_PROCESSES for the started app (default: the app's own default)")
+    parser.add_argument("--tts-ms-per-word", type=float, default=40)
+    parser.add_argument("--tts-unpaced", action="store_true",
+                        help="report an empty playback buffer so TTS sends at generation speed")
+    parser.add_argument("--tts-cached", action="store_true", help="repeat one text so the phrase cache answers")
+    parser.add_argument("--output", help="result file (default bench/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", metavar="OLD_JSON", help="print deltas against an earlier result")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    stack = Stack(args)
+    try:
+        stack.start(scenarios)
+        result = {
+            "commit": git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "browser": stack.browser,
+            "scenarios": {},
+        }
+        for name in scenarios:
+            print(f"Running {name} ...", flush=True)
+            result["scenarios"][name] = run_scenario(name, args, stack)
+        if args.app_url:
+            result["server_stats"] = server_stats(args)
+    finally:
+        stack.stop()
+
+    print_report(result)
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""The real TTS WebSocket server with the model swapped for a timed sine generator
+
+    python bench/stub_tts.py --port 8965 --ms-per-word 40 --batch-overhead-ms 30
+
+Everything around the model (batching, chunking, session queues, caching,
+levelling, framing) is the production code from stream.py, so the numbers
+reflect the serving path. Inference costs `--batch-overhead-ms` per batch
+plus `--ms-per-word` for the longest chunk in it, and yields about 0.3 s of
+audio per word.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Module-level settings are read at import: no model, workers, disk cache or
+# second metrics port in the benchmark process unless asked for
+os.environ.setdefault("TTS_WORKERS", "0")
+os.environ.setdefault("TTS_WARMUP", "0")
+os.environ.setdefault("TTS_CACHE_DISK", "0")
+os.environ.setdefault("TTS_METRICS_PORT", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import websockets  # noqa: E402
+
+import stream  # noqa: E402
+
+SECONDS_PER_WORD = 0.3
+
+
+class StubTTSServer(stream.VibeVoiceWebSocketServer):
+    def __init__(self, ms_per_word: float, batch_overhead_ms: float):
+        super().__init__(model_path="bench/stub", workers=0)
+        self.ms_per_word = ms_per_word
+        self.batch_overhead_ms = batch_overhead_ms
+
+    async def initialize_model(self):
+        stream.logger.info("Stub TTS: no model to load")
+
+    def _sync_generate_batch(self, texts):
+        words = [max(1, len(text.split()) - 1) for text in texts]  # minus the "Speaker:" prefix
+        time.sleep((self.batch_overhead_ms + self.ms_per_word * max(words)) / 1000)
+        outputs = []
+        for count in words:
+            t = np.arange(int(self.sample_rate * SECONDS_PER_WORD * count), dtype=np.float32) / self.sample_rate
+            outputs.append(0.2 * np.sin(2 * np.pi * 220 * t))
+        return outputs
+
+
+async def run(port: int, ms_per_word: float, batch_overhead_ms: float):
+    server = StubTTSServer(ms_per_word, batch_overhead_ms)
+    await server.initialize_model()
+
+    async with websockets.serve(server.handle_client, "127.0.0.1", port, write_limit=stream.TTS_WRITE_LIMIT):
+        print(f"Stub TTS on ws://127.0.0.1:{port}", flush=True)
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8965)
+    parser.add_argument("--ms-per-word", type=float, default=40)
+    parser.add_argument("--batch-overhead-ms", type=float, default=30)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.port, args.ms_per_word, args.batch_overhead_ms))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,327 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from websockets.exceptions import WebSocketException
+from websockets.sync.client import connect
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration (overridable from the environment / .env)
+LIGHTPANDA_BINARY = os.environ.get("LIGHTPANDA_BINARY", "./lightpanda")
+LIGHTPANDA_HOST = os.environ.get("LIGHTPANDA_HOST", "127.0.0.1")
+# 0 = a free port picked per instance at each start, so several server processes
+# (gunicorn workers) never collide; a fixed base uses base, base + 1, ...
+LIGHTPANDA_BASE_PORT = int(os.environ.get("LIGHTPANDA_BASE_PORT", "0"))
+LIGHTPANDA_POOL_SIZE = int(os.environ.get("LIGHTPANDA_POOL_SIZE", "2"))
+LIGHTPANDA_PAGE_TIMEOUT = float(os.environ.get("LIGHTPANDA_PAGE_TIMEOUT", "15"))
+LIGHTPANDA_ACQUIRE_TIMEOUT = float(os.environ.get("LIGHTPANDA_ACQUIRE_TIMEOUT", "30"))
+LIGHTPANDA_STARTUP_TIMEOUT = float(os.environ.get("LIGHTPANDA_STARTUP_TIMEOUT", "5"))
+LIGHTPANDA_MAX_PAGES = int(os.environ.get("LIGHTPANDA_MAX_PAGES", "200"))
+LIGHTPANDA_MAX_RSS_MB = int(os.environ.get("LIGHTPANDA_MAX_RSS_MB", "512"))
+
+
+class CDPError(Exception):
+    """Raised when the browser returns a CDP error or misbehaves"""
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def _listening_inodes(port: int) -> Optional[set]:
+    """Socket inodes listening on `port` (Linux /proc), or None where that can't be read"""
+    inodes, readable = set(), False
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # local_address is HEX_IP:HEX_PORT; state 0A is LISTEN
+                    if int(fields[1].rsplit(":", 1)[1], 16) == port and fields[3] == "0A":
+                        inodes.add(fields[9])
+            readable = True
+        except (OSError, StopIteration, IndexError, ValueError):
+            continue
+    return inodes if readable else None
+
+
+def _owns_socket(pid: int, inodes: set) -> bool:
+    try:
+        for fd in os.listdir(f"/proc/{pid}/fd"):
+            try:
+                target = os.readlink(f"/proc/{pid}/fd/{fd}")
+            except OSError:
+                continue
+            if target.startswith("socket:[") and target[8:-1] in inodes:
+                return True
+    except OSError:
+        pass
+    return False
+
+
+def _connection_failed(error: BaseException) -> bool:
+    """Whether a fetch failed because the browser connection itself broke, not the page"""
+    if isinstance(error, TimeoutError):
+        return False  # the page didn't load in time (TimeoutError is an OSError)
+    return isinstance(error, (OSError, WebSocketException))
+
+
+class LightpandaInstance:
+    """A single long-lived `lightpanda serve` process speaking CDP"""
+
+    def __init__(self, binary: str, host: str, port: int = 0):
+        self.binary = binary
+        self.host = host
+        # 0: pick a free port at every start
+        self.fixed_port = port
+        self.port = port
+        self.process: Optional[subprocess.Popen] = None
+        self.pages_served = 0
+        self._ids = itertools.count(1)
+
+    @property
+    def endpoint(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self, startup_timeout: float = LIGHTPANDA_STARTUP_TIMEOUT):
+        """Spawn the CDP server and wait until it accepts connections
+
+        Ready means the port is listening *in the process we spawned*: a
+        browser from another worker on the same port would otherwise pass
+        the probe while ours fails to bind.
+        """
+        self.port = self.fixed_port or _free_port(self.host)
+        self.process = subprocess.Popen(
+            [self.binary, "serve", "--host", self.host, "--port", str(self.port)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.pages_served = 0
+
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CDPError(f"lightpanda exited with code {self.process.returncode}")
+            try:
+                with socket.create_connection((self.host, self.port), timeout=0.2):
+                    pass
+            except OSError:
+                time.sleep(0.05)
+                continue
+            inodes = _listening_inodes(self.port)
+            if inodes is None or _owns_socket(self.process.pid, inodes):
+                logger.info(f"Lightpanda CDP server ready on {self.endpoint}")
+                return
+            # Someone else is listening there; ours will exit on bind (or hasn't bound yet)
+            time.sleep(0.05)
+
+        self.stop()
+        raise CDPError(f"lightpanda did not start on {self.endpoint} in {startup_timeout}s "
+                       f"(or the port belongs to another process)")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def rss_mb(self) -> float:
+        """Resident memory of the browser process (Linux only, 0 elsewhere)"""
+        if not self.is_alive():
+            return 0.0
+        try:
+            with open(f"/proc/{self.process.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+    def fetch(self, url: str, timeout: float = LIGHTPANDA_PAGE_TIMEOUT) -> str:
+        """Load `url` in a fresh browser context and return the rendered HTML"""
+        deadline = time.monotonic() + timeout
+
+        with connect(self.endpoint, max_size=None, open_timeout=timeout) as ws:
+            def send(method, params=None, session_id=None):
+                message = {"id": next(self._ids), "method": method, "params": params or {}}
+                if session_id:
+                    message["sessionId"] = session_id
+                ws.send(json.dumps(message))
+                return message["id"]
+
+            def wait_for(predicate):
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"Timed out loading {url}")
+                    message = json.loads(ws.recv(timeout=remaining))
+                    if "error" in message:
+                        raise CDPError(message["error"].get("message", str(message["error"])))
+                    if predicate(message):
+                        return message
+
+            def command(method, params=None, session_id=None):
+                message_id = send(method, params, session_id)
+                return wait_for(lambda m: m.get("id") == message_id).get("result", {})
+
+            context_id = command("Target.createBrowserContext")["browserContextId"]
+            try:
+                target_id = command("Target.createTarget", {
+                    "url": "about:blank",
+                    "browserContextId": context_id,
+                })["targetId"]
+                session_id = command("Target.attachToTarget", {
+                    "targetId": target_id,
+                    "flatten": True,
+                })["sessionId"]
+
+                command("Page.enable", session_id=session_id)
+                send("Page.navigate", {"url": url}, session_id)
+                wait_for(lambda m: m.get("method") == "Page.loadEventFired"
+                         and m.get("sessionId") == session_id)
+
+                result = command("Runtime.evaluate", {
+                    "expression": "document.documentElement.outerHTML",
+                    "returnByValue": True,
+                }, session_id)
+                html = result.get("result", {}).get("value")
+                if html is None:
+                    raise CDPError(f"Could not read document for {url}")
+
+                command("Target.closeTarget", {"targetId": target_id})
+                return html
+            finally:
+                try:
+                    command("Target.disposeBrowserContext", {"browserContextId": context_id})
+                except Exception:
+                    pass
+
+
+class BrowserPool:
+    """Pool of Lightpanda CDP servers, each leased to one request at a time"""
+
+    def __init__(self, size: int = LIGHTPANDA_POOL_SIZE, binary: str = LIGHTPANDA_BINARY,
+                 host: str = LIGHTPANDA_HOST, base_port: int = LIGHTPANDA_BASE_PORT,
+                 page_timeout: float = LIGHTPANDA_PAGE_TIMEOUT,
+                 acquire_timeout: float = LIGHTPANDA_ACQUIRE_TIMEOUT,
+                 max_pages: int = LIGHTPANDA_MAX_PAGES,
+                 max_rss_mb: int = LIGHTPANDA_MAX_RSS_MB):
+        self.page_timeout = page_timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.instances = [LightpandaInstance(binary, host, base_port + i if base_port else 0)
+                          for i in range(size)]
+        self._idle: "queue.Queue[LightpandaInstance]" = queue.Queue()
+
+    def start(self):
+        for instance in self.instances:
+            instance.start()
+            self._idle.put(instance)
+
+    def close(self):
+        for instance in self.instances:
+            instance.stop()
+
+    def _needs_recycle(self, instance: LightpandaInstance) -> bool:
+        if not instance.is_alive():
+            return True
+        if self.max_pages and instance.pages_served >= self.max_pages:
+            return True
+        return bool(self.max_rss_mb) and instance.rss_mb() > self.max_rss_mb
+
+    @contextmanager
+    def lease(self):
+        """Borrow an idle instance, recycling it afterwards if it crashed or grew too big
+
+        A page that fails to load (timeout, CDP error for a bad URL) leaves
+        the browser in place; only a dead process or a broken connection to
+        it costs a restart.
+        """
+        try:
+            instance = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise CDPError("No browser available in the pool")
+
+        failed = False
+        try:
+            if not instance.is_alive():
+                logger.warning(f"Lightpanda on port {instance.port} died, restarting")
+                instance.restart()
+            yield instance
+        except Exception as e:
+            failed = not instance.is_alive() or _connection_failed(e)
+            raise
+        finally:
+            instance.pages_served += 1
+            try:
+                if failed or self._needs_recycle(instance):
+                    logger.info(f"Recycling lightpanda on port {instance.port} "
+                                f"after {instance.pages_served} pages")
+                    instance.restart()
+            except Exception as e:
+                logger.error(f"Failed to recycle lightpanda on port {instance.port}: {e}")
+            self._idle.put(instance)
+
+    def fetch(self, url: str) -> str:
+        with self.lease() as instance:
+            return instance.fetch(url, self.page_timeout)
+
+
+_pool: Optional[BrowserPool] = None
+_pool_failed = False
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> Optional[BrowserPool]:
+    """Lazily start the shared pool; returns None if it is disabled or cannot start"""
+    global _pool, _pool_failed
+    if _pool is not None or _pool_failed or LIGHTPANDA_POOL_SIZE <= 0:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None and not _pool_failed:
+            pool = BrowserPool()
+            try:
+                pool.start()
+                atexit.register(pool.close)
+                _pool = pool
+            except Exception as e:
+                logger.error(f"Could not start Lightpanda pool, using fetch fallback: {e}")
+                pool.close()
+                _pool_failed = True
+    return _pool
+
+
+def shutdown():
+    """Stop the pool's browsers now rather than at interpreter exit"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
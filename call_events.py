@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+# How long an untouched call's event log is kept around
+CALL_EVENTS_IDLE_TTL = 3600
+# Seconds between SSE keep-alive comments
+CALL_EVENTS_HEARTBEAT = 15
+# A worker following a call generated elsewhere re-reads the shared store this often,
+# and gives up after CALL_EVENTS_POLL_TIMEOUT without every persona answering
+CALL_EVENTS_POLL_INTERVAL = 1.0
+CALL_EVENTS_POLL_TIMEOUT = 300
+
+
+class CallStream:
+    """Append-only event log for one call that any number of listeners can follow
+
+    `running` counts the generations still publishing; a follower stops once
+    it has caught up and none are left, i.e. right after the last one's
+    terminal (done or error) event.
+    """
+
+    def __init__(self):
+        self.events: List[dict] = []
+        self.running = 0
+        self.touched = time.monotonic()
+        self._cond = threading.Condition()
+
+    def publish(self, event: dict):
+        with self._cond:
+            self.events.append(event)
+            self.touched = time.monotonic()
+            self._cond.notify_all()
+
+    def begin(self):
+        """A generation started; followers keep waiting until it finishes"""
+        with self._cond:
+            self.running += 1
+            self.touched = time.monotonic()
+
+    def finish(self, event: dict):
+        """Publish a generation's terminal event, ending followers if it was the last"""
+        with self._cond:
+            self.running -= 1
+            self.events.append(event)
+            self.touched = time.monotonic()
+            self._cond.notify_all()
+
+    def follow(self, start: int = 0, heartbeat: float = CALL_EVENTS_HEARTBEAT) -> Iterator[Optional[tuple]]:
+        """Yield (index, event) until caught up with no generation running, or None after `heartbeat` seconds of silence"""
+        index = start
+        while True:
+            with self._cond:
+                if index >= len(self.events) and self.running:
+                    self._cond.wait(timeout=heartbeat)
+                pending = self.events[index:]
+                if not pending and not self.running:
+                    return
+            if not pending:
+                yield None
+            for event in pending:
+                yield index, event
+                index += 1
+
+
+class EventBroker:
+    """Call id -> CallStream, shared between the pipeline thread and SSE responses"""
+
+    def __init__(self, idle_ttl: float = CALL_EVENTS_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._streams: Dict[str, CallStream] = {}
+        self._lock = threading.Lock()
+
+    def open(self, call_id: str) -> CallStream:
+        with self._lock:
+            self._prune()
+            stream = self._streams[call_id] = CallStream()
+            return stream
+
+    def get(self, call_id: str) -> Optional[CallStream]:
+        with self._lock:
+            return self._streams.get(call_id)
+
+    def publish(self, call_id: str, event: dict):
+        stream = self.get(call_id)
+        if stream is not None:
+            stream.publish(event)
+
+    def begin(self, call_id: str):
+        stream = self.get(call_id)
+        if stream is not None:
+            stream.begin()
+
+    def finish(self, call_id: str, event: dict):
+        stream = self.get(call_id)
+        if stream is not None:
+            stream.finish(event)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        for call_id in [k for k, s in self._streams.items() if s.touched < cutoff]:
+            del self._streams[call_id]
+
+
+def _sse_event(event: dict, index: Optional[int] = None) -> str:
+    prefix = f"id: {index}\n" if index is not None else ""
+    return f"{prefix}event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def poll_store(get_call: Callable[[str], Optional[dict]], call_id: str,
+               interval: float = CALL_EVENTS_POLL_INTERVAL, timeout: float = CALL_EVENTS_POLL_TIMEOUT,
+               heartbeat: float = CALL_EVENTS_HEARTBEAT) -> Iterator[str]:
+    """SSE body for a call this process isn't generating, read from the shared call store
+
+    Each reply is sent once as it appears, then `done` when every persona
+    on the call has one. The store keeps no event order, so these events
+    carry no ids; the browser treats them as replays. Ends early if the
+    call expires or `timeout` passes (a failed turn never gets a reply).
+    """
+    yield "retry: 2000\n\n"
+    sent = set()
+    deadline = time.monotonic() + timeout
+    quiet_since = time.monotonic()
+    while True:
+        call = get_call(call_id)
+        if call is None:
+            break
+        for persona_id, text in call["responses"].items():
+            if persona_id not in sent:
+                sent.add(persona_id)
+                quiet_since = time.monotonic()
+                yield _sse_event({"type": "response", "persona": persona_id, "text": text})
+        if set(call["personas"]) <= sent:
+            yield _sse_event({"type": "done", "personas": sorted(sent)})
+            break
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        if now - quiet_since >= heartbeat:
+            quiet_since = now
+            yield ": keep-alive\n\n"
+        time.sleep(interval)
+    yield "event: end\ndata: {}\n\n"
+
+
+def sse(stream: CallStream, start: int = 0) -> Iterator[str]:
+    """Render a call's events as a Server-Sent Events body
+
+    The body ends once the call is idle, with an `end` event (no id, so a
+    later resume still starts after the last real event) telling the
+    browser to close rather than reconnect.
+    """
+    yield "retry: 2000\n\n"
+    for item in stream.follow(start):
+        if item is None:
+            yield ": keep-alive\n\n"
+            continue
+        index, event = item
+        yield _sse_event(event, index)
+    yield "event: end\ndata: {}\n\n"
@@ -0,0 +1,221 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+# Store configuration (overridable from the environment / .env)
+CALL_STORE_BACKEND = os.environ.get("CALL_STORE_BACKEND", "memory")  # memory | sqlite
+CALL_STORE_PATH = os.environ.get("CALL_STORE_PATH", ".cache/calls.sqlite3")
+CALL_IDLE_TTL = float(os.environ.get("CALL_IDLE_TTL", "3600"))
+# Minimum seconds between sweeps for idle calls
+CALL_SWEEP_INTERVAL = 60
+# Internal retries when a concurrent writer bumps the version first
+CALL_UPDATE_RETRIES = 5
+
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def new_call_id() -> str:
+    """ULID: 48-bit millisecond timestamp + 80 random bits, Crockford base32"""
+    value = (int(time.time() * 1000) << 80) | secrets.randbits(80)
+    chars = []
+    for _ in range(26):
+        chars.append(CROCKFORD[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+class ConflictError(Exception):
+    """The call changed since the version the client last saw"""
+
+
+class MemoryCallStore:
+    """Calls for a single process; personas are sets so membership is O(1)"""
+
+    def __init__(self, idle_ttl: float = CALL_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._calls: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def create(self, url: str, persona_ids) -> dict:
+        now = time.time()
+        call = {"id": new_call_id(), "url": url, "personas": set(persona_ids), "responses": {},
+                "version": 1, "created_at": now, "touched_at": now}
+        with self._lock:
+            self._sweep(now)
+            self._calls[call["id"]] = call
+            return self._copy(call)
+
+    def get(self, call_id: str) -> Optional[dict]:
+        with self._lock:
+            call = self._live(call_id)
+            return self._copy(call) if call else None
+
+    def add_persona(self, call_id: str, persona_id: str, expected_version: Optional[int] = None) -> Optional[dict]:
+        return self._update(call_id, expected_version, lambda call: call["personas"].add(persona_id))
+
+    def remove_persona(self, call_id: str, persona_id: str, expected_version: Optional[int] = None) -> Optional[dict]:
+        return self._update(call_id, expected_version, lambda call: call["personas"].discard(persona_id))
+
+    def set_response(self, call_id: str, persona_id: str, text: str):
+        with self._lock:
+            call = self._live(call_id)
+            if call is not None:
+                call["responses"][persona_id] = text
+                call["touched_at"] = time.time()
+
+    def _update(self, call_id, expected_version, change) -> Optional[dict]:
+        with self._lock:
+            call = self._live(call_id)
+            if call is None:
+                return None
+            if expected_version is not None and expected_version != call["version"]:
+                raise ConflictError(f"call {call_id} is at version {call['version']}")
+            change(call)
+            call["version"] += 1
+            call["touched_at"] = time.time()
+            return self._copy(call)
+
+    def _live(self, call_id: str) -> Optional[dict]:
+        call = self._calls.get(call_id)
+        if call is not None and call["touched_at"] < time.time() - self.idle_ttl:
+            del self._calls[call_id]
+            return None
+        return call
+
+    def _sweep(self, now: float):
+        if now - self._last_sweep < CALL_SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        cutoff = now - self.idle_ttl
+        for call_id in [k for k, c in self._calls.items() if c["touched_at"] < cutoff]:
+            del self._calls[call_id]
+
+    @staticmethod
+    def _copy(call: dict) -> dict:
+        return dict(call, personas=set(call["personas"]), responses=dict(call["responses"]))
+
+
+class SQLiteCallStore:
+    """Calls in a WAL-mode SQLite file so every worker process on the host shares them"""
+
+    def __init__(self, path: str = CALL_STORE_PATH, idle_ttl: float = CALL_IDLE_TTL):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS calls (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    touched_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS calls_touched ON calls (touched_at);
+                CREATE TABLE IF NOT EXISTS call_personas (
+                    call_id TEXT NOT NULL REFERENCES calls (id) ON DELETE CASCADE,
+                    persona TEXT NOT NULL,
+                    PRIMARY KEY (call_id, persona)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS call_responses (
+                    call_id TEXT NOT NULL REFERENCES calls (id) ON DELETE CASCADE,
+                    persona TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    PRIMARY KEY (call_id, persona)
+                ) WITHOUT ROWID;
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def create(self, url: str, persona_ids) -> dict:
+        now = time.time()
+        call_id = new_call_id()
+        with self._conn() as conn:
+            self._sweep(conn, now)
+            conn.execute("INSERT INTO calls (id, url, version, created_at, touched_at) VALUES (?, ?, 1, ?, ?)",
+                         (call_id, url, now, now))
+            conn.executemany("INSERT OR IGNORE INTO call_personas (call_id, persona) VALUES (?, ?)",
+                             [(call_id, p) for p in persona_ids])
+        return self.get(call_id)
+
+    def get(self, call_id: str) -> Optional[dict]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT id, url, version, created_at, touched_at FROM calls WHERE id = ? AND touched_at >= ?",
+            (call_id, time.time() - self.idle_ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        personas = {p for (p,) in conn.execute("SELECT persona FROM call_personas WHERE call_id = ?", (call_id,))}
+        responses = dict(conn.execute("SELECT persona, text FROM call_responses WHERE call_id = ?", (call_id,)))
+        return {"id": row[0], "url": row[1], "personas": personas, "responses": responses,
+                "version": row[2], "created_at": row[3], "touched_at": row[4]}
+
+    def add_persona(self, call_id: str, persona_id: str, expected_version: Optional[int] = None) -> Optional[dict]:
+        return self._update(call_id, expected_version,
+                            "INSERT OR IGNORE INTO call_personas (call_id, persona) VALUES (?, ?)", persona_id)
+
+    def remove_persona(self, call_id: str, persona_id: str, expected_version: Optional[int] = None) -> Optional[dict]:
+        return self._update(call_id, expected_version,
+                            "DELETE FROM call_personas WHERE call_id = ? AND persona = ?", persona_id)
+
+    def set_response(self, call_id: str, persona_id: str, text: str):
+        with self._conn() as conn:
+            if conn.execute("UPDATE calls SET touched_at = ? WHERE id = ?", (time.time(), call_id)).rowcount:
+                conn.execute("INSERT OR REPLACE INTO call_responses (call_id, persona, text) VALUES (?, ?, ?)",
+                             (call_id, persona_id, text))
+
+    def _update(self, call_id, expected_version, statement, persona_id) -> Optional[dict]:
+        # Compare-and-swap on the version column; retry internally unless the
+        # client pinned a version, in which case a mismatch is its conflict
+        for _ in range(CALL_UPDATE_RETRIES):
+            call = self.get(call_id)
+            if call is None:
+                return None
+            version = call["version"]
+            if expected_version is not None and expected_version != version:
+                raise ConflictError(f"call {call_id} is at version {version}")
+            with self._conn() as conn:
+                swapped = conn.execute(
+                    "UPDATE calls SET version = version + 1, touched_at = ? WHERE id = ? AND version = ?",
+                    (time.time(), call_id, version),
+                ).rowcount
+                if swapped:
+                    conn.execute(statement, (call_id, persona_id))
+            if swapped:
+                return self.get(call_id)
+        raise ConflictError(f"call {call_id} kept changing; gave up after {CALL_UPDATE_RETRIES} tries")
+
+    def _sweep(self, conn: sqlite3.Connection, now: float):
+        if now - self._last_sweep < CALL_SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        conn.execute("DELETE FROM calls WHERE touched_at < ?", (now - self.idle_ttl,))
+
+
+def from_env():
+    """Call store named by CALL_STORE_BACKEND"""
+    if CALL_STORE_BACKEND == "sqlite":
+        return SQLiteCallStore()
+    return MemoryCallStore()
+
+
+def to_json(call: dict) -> dict:
+    """JSON-safe view of a call"""
+    return dict(call, personas=sorted(call["personas"]))
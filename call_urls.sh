@@ -1,5 +1,7 @@
 #!/bin/bash
 
+# For a repeatable load test of these same steps against a local mock stack, see bench/run.py
+
 BASE_URL="http://localhost:5000"
 URL_TO_SCRAPE="https://example.com"
 
@@ -11,16 +13,30 @@ echo ""
 
 # Call
 echo "Calling..."
-curl -X POST -H "Content-Type: application/json" -d "{\"url\": \"$URL_TO_SCRAPE\", \"personas\": [\"persona1\", \"persona2\"]}" "$BASE_URL/call"
+CALL_ID=$(curl -s -X POST -H "Content-Type: application/json" -d "{\"url\": \"$URL_TO_SCRAPE\", \"personas\": [\"cool-dude\", \"nerd\"]}" "$BASE_URL/call" | sed -E 's/.*"id": *"([^"]+)".*/\1/')
+echo "$CALL_ID"
+
+echo ""
+
+# Follow the streamed persona replies for a few seconds
+echo "Streaming call events..."
+curl -N --max-time 10 "$BASE_URL/call/$CALL_ID/events"
 
 echo ""
 
 # Add to Call
 echo "Adding to call..."
-curl -X POST -H "Content-Type: application/json" -d '{"id": "12345", "persona": "persona3"}' "$BASE_URL/add_to_call"
+curl -X POST -H "Content-Type: application/json" -d "{\"id\": \"$CALL_ID\", \"persona\": \"chef\"}" "$BASE_URL/add_to_call"
 
 echo ""
 
 # Remove from Call
 echo "Removing from call..."
-curl -X POST -H "Content-Type: application/json" -d '{"id": "12345", "persona": "persona3"}' "$BASE_URL/remove_from_call"
\ No newline at end of file
+curl -X POST -H "Content-Type: application/json" -d "{\"id\": \"$CALL_ID\", \"persona\": \"chef\"}" "$BASE_URL/remove_from_call"
+echo ""
+
+# Batch: queue several calls at once (JSONL works too: python batch.py urls.jsonl)
+echo "Queueing a batch..."
+BATCH_ID=$(curl -s -X POST -H "Content-Type: application/json" -d "{\"jobs\": [{\"url\": \"$URL_TO_SCRAPE\", \"personas\": [\"nerd\"]}, {\"url\": \"https://example.org\", \"personas\": [\"chef\", \"singer\"], \"priority\": \"high\"}]}" "$BASE_URL/calls/batch" | sed -E 's/.*"batch_id": *"([^"]+)".*/\1/')
+echo "$BATCH_ID"
+curl "$BASE_URL/calls/batch/$BATCH_ID"
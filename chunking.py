@@ -0,0 +1,176 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+from typing import List, Optional
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a character heuristic
+    _encoding = None
+
+# Input tokens a single completion may carry before map-reduce kicks in
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("SUMMARY_TOKEN_BUDGET", "3000"))
+# Upper bound on chunks summarized in the map step
+SUMMARY_MAX_CHUNKS = int(os.environ.get("SUMMARY_MAX_CHUNKS", "8"))
+
+HEADING = re.compile(r"^#{1,6}\s+(.*)$")
+LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+WORD = re.compile(r"[a-z][a-z0-9'-]{2,}")
+
+# Lines that are chrome rather than content
+BOILERPLATE = re.compile(
+    r"^\W*(skip to (main )?content|sign in|log ?in|sign up|subscribe|menu|search|share|"
+    r"cookie|accept all|privacy policy|terms of (use|service)|all rights reserved|"
+    r"follow us|back to top|advertisement)\b",
+    re.IGNORECASE,
+)
+
+STOPWORDS = frozenset("""
+the and for are but not you all any can had her was one our out has have his how its
+may new now old see two who did get him let put say she too use that with this from
+they will would there their what about which when make like time just know take into
+your some could them than then these been were more also only over such most other
+""".split())
+
+
+def estimate_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+class Chunk:
+    """A heading-delimited section of a page"""
+
+    def __init__(self, heading: str, text: str, position: int):
+        self.heading = heading
+        self.text = text
+        self.position = position
+        self.tokens = estimate_tokens(text)
+        self.score = 0.0
+
+
+class PreparedDocument:
+    """The page after cleanup, with its chunks in reading order"""
+
+    def __init__(self, chunks: List[Chunk], original_tokens: int):
+        self.chunks = chunks
+        self.original_tokens = original_tokens
+        self.tokens = sum(chunk.tokens for chunk in chunks)
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(chunk.text for chunk in self.chunks)
+
+
+def _is_boilerplate(line: str) -> bool:
+    stripped = line.strip()
+    if not stripped:
+        return False
+    if BOILERPLATE.match(stripped) and len(stripped) < 80:
+        return True
+    # Navigation: lines that are mostly links (menus, breadcrumbs, tag clouds)
+    link_text = sum(len(m.group(0)) for m in LINK.finditer(stripped))
+    prose = LINK.sub("", stripped).strip(" -*|>•·")
+    return link_text > 0 and link_text / len(stripped) > 0.6 and len(prose) < 40
+
+
+def clean_markdown(markdown: str) -> str:
+    """Strip nav/boilerplate lines, link targets and repeated blocks"""
+    lines = [line for line in markdown.splitlines() if not _is_boilerplate(line)]
+    # Keep link text, drop URLs and images: they cost tokens and say nothing
+    text = LINK.sub(lambda m: "" if m.group(0).startswith("!") else m.group(1), "\n".join(lines))
+
+    seen = set()
+    blocks = []
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        fingerprint = hashlib.sha1(" ".join(block.lower().split()).encode("utf-8")).digest()
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        blocks.append(block)
+    return "\n\n".join(blocks)
+
+
+def split_by_headings(markdown: str, max_tokens: int) -> List[Chunk]:
+    """Split on markdown headings, then on paragraphs for sections over `max_tokens`"""
+    sections = []
+    heading, body = "", []
+    for line in markdown.splitlines():
+        match = HEADING.match(line)
+        if match and body:
+            sections.append((heading, "\n".join(body)))
+            body = []
+        if match:
+            heading = match.group(1).strip()
+        body.append(line)
+    if body:
+        sections.append((heading, "\n".join(body)))
+
+    chunks = []
+    for heading, text in sections:
+        if all(HEADING.match(line) or not line.strip() for line in text.splitlines()):
+            continue  # a heading with nothing under it
+        if estimate_tokens(text) <= max_tokens:
+            chunks.append(Chunk(heading, text, len(chunks)))
+            continue
+        current = []
+        for paragraph in text.split("\n\n"):
+            candidate = "\n\n".join(current + [paragraph])
+            heading_only = len(current) == 1 and HEADING.match(current[0])
+            if current and not heading_only and estimate_tokens(candidate) > max_tokens:
+                chunks.append(Chunk(heading, "\n\n".join(current), len(chunks)))
+                current = []
+            current.append(paragraph)
+        if current:
+            chunks.append(Chunk(heading, "\n\n".join(current), len(chunks)))
+    return chunks
+
+
+def _terms(text: str) -> List[str]:
+    return [w for w in WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+def rank_chunks(chunks: List[Chunk], query: Optional[str] = None) -> List[Chunk]:
+    """Score chunks by overlap with the page's key terms (plus `query`), best first
+
+    Key terms are the most frequent content words on the page, weighted up
+    when they appear in a heading. Earlier sections get a small bonus since
+    articles front-load what they are about.
+    """
+    counts = Counter()
+    for chunk in chunks:
+        counts.update(_terms(chunk.text))
+        counts.update(_terms(chunk.heading) * 3)
+    if query:
+        counts.update(_terms(query) * 5)
+    keywords = dict(counts.most_common(40))
+
+    for chunk in chunks:
+        terms = _terms(chunk.text)
+        if not terms:
+            chunk.score = 0.0
+            continue
+        hits = sum(keywords.get(term, 0) for term in terms)
+        chunk.score = hits / math.sqrt(len(terms)) / (1 + 0.05 * chunk.position)
+    return sorted(chunks, key=lambda c: c.score, reverse=True)
+
+
+def prepare(markdown: str, budget: int = SUMMARY_TOKEN_BUDGET) -> PreparedDocument:
+    """Clean the page and cut it into budget-sized, heading-aligned chunks"""
+    original_tokens = estimate_tokens(markdown)
+    return PreparedDocument(split_by_headings(clean_markdown(markdown), budget), original_tokens)
+
+
+def select(document: PreparedDocument, max_chunks: int = SUMMARY_MAX_CHUNKS,
+           query: Optional[str] = None) -> List[Chunk]:
+    """The `max_chunks` most relevant chunks, back in reading order"""
+    ranked = rank_chunks(list(document.chunks), query)
+    chosen = [chunk for chunk in ranked[:max_chunks] if chunk.score > 0] or ranked[:1]
+    return sorted(chosen, key=lambda c: c.position)
@@ -0,0 +1,227 @@
+import concurrent.futures
+import io
+import logging
+import multiprocessing
+import os
+import re
+from html.parser import HTMLParser
+from typing import Iterable, List, Optional
+
+from markitdown import MarkItDown
+
+logger = logging.getLogger(__name__)
+
+# Converter configuration (overridable from the environment / .env)
+CONVERT_PROCESSES = int(os.environ.get("CONVERT_PROCESSES", str(max(1, (os.cpu_count() or 2) // 2))))
+CONVERT_FAST_PATH = os.environ.get("CONVERT_FAST_PATH", "0") == "1"
+# Characters handed to the streaming parser per feed() call
+CONVERT_FEED_SIZE = 64 * 1024
+# Fast-path output this small relative to the input means it missed the content
+CONVERT_MIN_YIELD = 0.01
+
+# Built once per process (the pool initializer or first use) and reused
+_markitdown: Optional[MarkItDown] = None
+
+
+def _get_markitdown() -> MarkItDown:
+    global _markitdown
+    if _markitdown is None:
+        _markitdown = MarkItDown()
+    return _markitdown
+
+
+class Unsupported(Exception):
+    """The page needs the full MarkItDown converter"""
+
+
+class StreamingMarkdownConverter(HTMLParser):
+    """Incremental HTML -> markdown for ordinary article pages
+
+    Handles headings, paragraphs, lists, links, emphasis, quotes and code.
+    Anything it can't render faithfully (tables, forms) raises Unsupported
+    so the caller can fall back to MarkItDown.
+    """
+
+    SKIP = {"script", "style", "noscript", "svg", "nav", "header", "footer", "aside", "template", "iframe"}
+    BLOCK = {"p", "div", "section", "article", "main", "figure", "figcaption", "br", "hr", "dl", "dt", "dd"}
+    UNSUPPORTED = {"table", "form", "frameset"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # (text, is_list_item); consecutive list items are joined tightly
+        self.blocks: List[tuple] = []
+        self._line: List[str] = []
+        self._prefix = ""
+        self._skip_depth = 0
+        self._lists: List[list] = []  # [tag, counter] per open list
+        self._quote = 0
+        self._pre = 0
+        self._href: Optional[str] = None
+
+    # -- output helpers ------------------------------------------------------
+
+    def _flush(self):
+        text = "".join(self._line)
+        prefix, self._line, self._prefix = self._prefix, [], ""
+        if not self._pre:
+            text = re.sub(r"\s+", " ", text).strip()
+        if text:
+            text = prefix + text
+            if self._quote:
+                text = "\n".join("> " + line for line in text.splitlines())
+            self.blocks.append((text, bool(prefix) and not prefix.startswith("#")))
+
+    def _emit(self, text: str):
+        self._line.append(text)
+
+    # -- parser callbacks ----------------------------------------------------
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.UNSUPPORTED:
+            raise Unsupported(tag)
+        if self._skip_depth or tag in self.SKIP:
+            self._skip_depth += tag in self.SKIP
+            return
+        attrs = dict(attrs)
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._flush()
+            self._prefix = "#" * int(tag[1]) + " "
+        elif tag in self.BLOCK:
+            self._flush()
+            if tag == "hr":
+                self.blocks.append(("---", False))
+        elif tag in ("ul", "ol"):
+            self._flush()
+            self._lists.append([tag, 0])
+        elif tag == "li":
+            self._flush()
+            indent = "  " * max(0, len(self._lists) - 1)
+            if self._lists and self._lists[-1][0] == "ol":
+                self._lists[-1][1] += 1
+                self._prefix = f"{indent}{self._lists[-1][1]}. "
+            else:
+                self._prefix = f"{indent}* "
+        elif tag == "blockquote":
+            self._flush()
+            self._quote += 1
+        elif tag == "pre":
+            self._flush()
+            self._pre += 1
+            self._emit("```\n")
+        elif tag == "code" and not self._pre:
+            self._emit("`")
+        elif tag in ("strong", "b"):
+            self._emit("**")
+        elif tag in ("em", "i"):
+            self._emit("*")
+        elif tag == "a":
+            self._href = attrs.get("href")
+            self._emit("[")
+        elif tag == "img" and attrs.get("alt"):
+            self._emit(f"![{attrs['alt']}]({attrs.get('src', '')})")
+
+    def handle_endtag(self, tag):
+        if self._skip_depth:
+            self._skip_depth -= tag in self.SKIP
+            return
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6") or tag in self.BLOCK or tag == "li":
+            self._flush()
+        elif tag in ("ul", "ol"):
+            self._flush()
+            if self._lists:
+                self._lists.pop()
+        elif tag == "blockquote":
+            self._flush()
+            self._quote = max(0, self._quote - 1)
+        elif tag == "pre":
+            self._emit("\n```")
+            self._flush()
+            self._pre = max(0, self._pre - 1)
+        elif tag == "code" and not self._pre:
+            self._emit("`")
+        elif tag in ("strong", "b"):
+            self._emit("**")
+        elif tag in ("em", "i"):
+            self._emit("*")
+        elif tag == "a":
+            self._emit(f"]({self._href})" if self._href else "]")
+            self._href = None
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._emit(data)
+
+    def result(self) -> str:
+        self.close()
+        self._flush()
+        parts = []
+        previous_item = False
+        for text, is_item in self.blocks:
+            if parts:
+                parts.append("\n" if is_item and previous_item else "\n\n")
+            parts.append(text)
+            previous_item = is_item
+        return "".join(parts)
+
+
+def stream_to_markdown(chunks: Iterable[str]) -> str:
+    """Convert HTML arriving in pieces (e.g. from a pipe) without buffering it whole"""
+    parser = StreamingMarkdownConverter()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.result()
+
+
+def _fast_path(html_content: str) -> str:
+    # The page is already one string here (the scraper and the page cache hold
+    # it whole), so feeding it in slices bounds the parser's per-call work, not
+    # peak memory; a streaming scraper could hand stream_to_markdown its chunks
+    chunks = (html_content[i:i + CONVERT_FEED_SIZE] for i in range(0, len(html_content), CONVERT_FEED_SIZE))
+    markdown = stream_to_markdown(chunks)
+    if len(markdown) < len(html_content) * CONVERT_MIN_YIELD:
+        raise Unsupported("too little text extracted")
+    return markdown
+
+
+def convert_html(html_content: str) -> str:
+    """HTML -> markdown with the fast path when enabled, MarkItDown otherwise"""
+    if CONVERT_FAST_PATH:
+        try:
+            return _fast_path(html_content)
+        except Unsupported:
+            pass
+    # MarkItDown expects a binary file-like object; BytesIO shares the encoded buffer
+    result = _get_markitdown().convert_stream(io.BytesIO(html_content.encode("utf-8")), file_extension=".html")
+    return result.text_content
+
+
+def _init_worker():
+    _get_markitdown()
+
+
+_pool: Optional[concurrent.futures.Executor] = None
+
+
+def process_pool() -> Optional[concurrent.futures.Executor]:
+    """Shared worker processes for conversion and other CPU-bound page work
+
+    Returns None when CONVERT_PROCESSES is 0, meaning convert in-process.
+    Workers are started with forkserver/spawn: forking a process that
+    already runs the pipeline's threads is not safe.
+    """
+    global _pool
+    if _pool is None and CONVERT_PROCESSES > 0:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        _pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=CONVERT_PROCESSES, mp_context=context, initializer=_init_worker
+        )
+    return _pool
+
+
+def shutdown():
+    """Stop the worker processes (at server exit; queued conversions are dropped)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -14,6 +14,17 @@ const callIdDisplay = document.getElementById('callIdDisplay');
 
 let currentCallId = null;
 let selectedPersonas = new Set();
+let callEvents = null;
+let lastEventId = null;
+let ttsWebSocket = null;
+let isTTSConnected = false;
+let bufferReportTimer = null;
+const BUFFER_REPORT_MS = 250;
+let audioContext = null;
+// Chunks play back to back from here on the AudioContext clock
+let playbackEnd = 0;
+let decodeChain = Promise.resolve();
+const scheduledSources = new Set();
 
 // Populate personas
 personas.forEach(persona => {
@@ -25,6 +36,7 @@ personas.forEach(persona => {
       <span class="persona-emoji">${persona.emoji}</span>
       <div class="persona-desc">${persona.desc}</div>
     </label>
+    <div class="persona-reply" aria-live="polite"></div>
     <div class="action-buttons" style="display: none;">
       <button class="add-button" data-persona="${persona.id}">Add to Call</button>
       <button class="hangup-button" data-persona="${persona.id}">Hangup</button>
@@ -80,12 +92,11 @@ callButton.addEventListener('click', async () => {
   callButton.textContent = 'Calling...';
 
   try {
-    // Mock response since backend not built; in production, fetch('/api/create-call')
-    const response = await new Promise(resolve => {
-      setTimeout(() => resolve({ id: 'call-' + Math.random().toString(36).substr(2, 9) }), 1000);
-    });
+    // The server returns the id right away and streams replies afterwards
+    const response = await postJSON('/call', { url: urlInput.value, personas: [...selectedPersonas] });
 
     currentCallId = response.id;
+    followCall(currentCallId);
     callIdDisplay.textContent = currentCallId;
     callControls.style.display = 'block';
 
@@ -117,8 +128,9 @@ async function addToCall(personaId) {
   if (!currentCallId) return;
 
   try {
-    // Mock; in prod: await fetch('/api/add-to-call', { method: 'POST', body: JSON.stringify({ id: currentCallId, persona: personaId }) });
-    await new Promise(resolve => setTimeout(resolve, 500));
+    await postJSON('/add_to_call', { id: currentCallId, persona: personaId });
+    // Reopen from the last event seen, in case the old stream ended as this turn started
+    followCall(currentCallId);
     const checkbox = document.getElementById(personaId);
     checkbox.checked = true;
     selectedPersonas.add(personaId);
@@ -134,8 +146,7 @@ async function removeFromCall(personaId) {
   if (!currentCallId) return;
 
   try {
-    // Mock; in prod: await fetch('/api/remove-from-call', { method: 'POST', body: JSON.stringify({ id: currentCallId, persona: personaId }) });
-    await new Promise(resolve => setTimeout(resolve, 500));
+    await postJSON('/remove_from_call', { id: currentCallId, persona: personaId });
     const checkbox = document.getElementById(personaId);
     checkbox.checked = false;
     selectedPersonas.delete(personaId);
@@ -146,6 +157,57 @@ async function removeFromCall(personaId) {
   }
 }
 
+// JSON POST helper for the party line API
+async function postJSON(path, body) {
+  const res = await fetch(path, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  });
+  if (!res.ok) throw new Error(`${path} failed with ${res.status}`);
+  return res.json();
+}
+
+// Render persona replies token by token as the server streams them; the stream
+// ends once the call goes idle and is followed again when a persona joins
+function followCall(callId) {
+  if (callEvents) callEvents.close();
+  const resume = lastEventId === null ? '' : `?last_id=${encodeURIComponent(lastEventId)}`;
+  const source = new EventSource(`/call/${encodeURIComponent(callId)}/events${resume}`);
+  callEvents = source;
+  const seen = (event) => { if (event.lastEventId) lastEventId = event.lastEventId; };
+  ['token', 'response', 'done'].forEach(type => source.addEventListener(type, seen));
+
+  source.addEventListener('end', () => {
+    source.close();
+    if (callEvents === source) callEvents = null;
+  });
+
+  callEvents.addEventListener('token', (event) => {
+    const data = JSON.parse(event.data);
+    const reply = replyElement(data.persona);
+    if (reply) reply.textContent += data.text;
+  });
+
+  callEvents.addEventListener('response', (event) => {
+    const data = JSON.parse(event.data);
+    const reply = replyElement(data.persona);
+    if (reply) reply.textContent = data.text;
+    // Turns arrive in transcript order; the TTS session queues them the same way
+    if (data.turn !== undefined) synthesizeText(data.text, data.voice || data.persona, data.trace_id);
+  });
+
+  callEvents.addEventListener('error', (event) => {
+    seen(event);
+    if (event.data) console.error('Call error:', JSON.parse(event.data).message);
+  });
+}
+
+function replyElement(personaId) {
+  const checkbox = document.getElementById(personaId);
+  return checkbox ? checkbox.closest('.persona-card').querySelector('.persona-reply') : null;
+}
+
 // Toggle action buttons visibility
 function toggleActions(actions, show) {
   actions.style.display = show ? 'flex' : 'none';
@@ -160,6 +222,12 @@ function toggleActions(actions, show) {
 
 // Reset call
 function resetCall() {
+  if (callEvents) {
+    callEvents.close();
+    callEvents = null;
+  }
+  lastEventId = null;
+  document.querySelectorAll('.persona-reply').forEach(reply => { reply.textContent = ''; });
   currentCallId = null;
   selectedPersonas.clear();
   callControls.style.display = 'none';
@@ -190,41 +258,84 @@ urlInput.addEventListener('input', updateCallButton);
 
 // Initial state
 updateCallButton();
+initializeTTS();
 
 function initializeTTS() {
   ttsWebSocket = new WebSocket('ws://localhost:8765');
   
   ttsWebSocket.onopen = () => {
     isTTSConnected = true;
+    // The server paces its sends from these reports instead of guessing
+    bufferReportTimer = setInterval(reportBufferStatus, BUFFER_REPORT_MS);
+  };
+
+  ttsWebSocket.onclose = () => {
+    isTTSConnected = false;
+    clearInterval(bufferReportTimer);
   };
   
   ttsWebSocket.onmessage = (event) => {
     const data = JSON.parse(event.data);
     if (data.type === 'audio_chunk') {
       playAudioChunk(data);
+    } else if (data.type === 'cancelled') {
+      stopPlayback();
     }
   };
 }
 
+function bufferedMs() {
+  if (!audioContext) return 0;
+  return Math.max(0, playbackEnd - audioContext.currentTime) * 1000;
+}
+
+function reportBufferStatus() {
+  if (isTTSConnected && ttsWebSocket.readyState === WebSocket.OPEN) {
+    ttsWebSocket.send(JSON.stringify({ type: 'buffer_status', buffered_ms: Math.round(bufferedMs()) }));
+  }
+}
+
 function playAudioChunk(data) {
+  audioContext = audioContext || new AudioContext();
+  if (audioContext.state === 'suspended') audioContext.resume();
+
   const audioBytes = atob(data.data);
   const audioArray = new Uint8Array(audioBytes.length);
   for (let i = 0; i < audioBytes.length; i++) {
     audioArray[i] = audioBytes.charCodeAt(i);
   }
   
-  const audioBlob = new Blob([audioArray], { type: 'audio/wav' });
-  const audioUrl = URL.createObjectURL(audioBlob);
-  const audio = new Audio(audioUrl);
-  audio.play();
+  // Decoding is async, so chain it to keep chunks in arrival order
+  decodeChain = decodeChain
+    .then(() => audioContext.decodeAudioData(audioArray.buffer))
+    .then(buffer => {
+      const source = audioContext.createBufferSource();
+      source.buffer = buffer;
+      source.connect(audioContext.destination);
+      const startAt = Math.max(audioContext.currentTime, playbackEnd);
+      source.start(startAt);
+      playbackEnd = startAt + buffer.duration;
+      scheduledSources.add(source);
+      source.onended = () => scheduledSources.delete(source);
+    })
+    .catch(error => console.error('Could not play audio chunk', error));
+}
+
+function stopPlayback() {
+  scheduledSources.forEach(source => source.stop());
+  scheduledSources.clear();
+  playbackEnd = 0;
+  reportBufferStatus();
 }
 
-function synthesizeText(text, speakerName) {
+function synthesizeText(text, speakerName, traceId = currentCallId) {
   if (isTTSConnected) {
     ttsWebSocket.send(JSON.stringify({
       type: 'generate_speech',
       text: text,
-      speaker_names: [speakerName]
+      speaker_names: [speakerName],
+      // Ties the speech to its call in server logs and metrics
+      trace_id: traceId
     }));
   }
 }
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration (overridable from the environment / .env)
+LLM_CACHE_BACKEND = os.environ.get("LLM_CACHE_BACKEND", "memory")  # memory | sqlite | redis | off
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_ERROR_TTL = float(os.environ.get("LLM_CACHE_ERROR_TTL", "30"))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_SQLITE_PATH = os.environ.get("LLM_CACHE_SQLITE_PATH", ".cache/llm.sqlite3")
+LLM_CACHE_REDIS_URL = os.environ.get("LLM_CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+
+
+def make_key(model: str, system_prompt: str, content: str, **params) -> str:
+    """Stable hash of everything that determines a completion"""
+    payload = {
+        "model": model,
+        "system": system_prompt,
+        # Whitespace differences in the page should not miss the cache
+        "content": hashlib.sha256(" ".join(content.split()).encode("utf-8")).hexdigest(),
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """Process-local LRU"""
+
+    # Cheap enough to call on the event loop
+    blocking = False
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteBackend:
+    """On-disk cache shared by every worker process on the host"""
+
+    blocking = True
+
+    def __init__(self, path: str = LLM_CACHE_SQLITE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM responses WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            # Opportunistic cleanup keeps the file from growing without bound
+            conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+
+
+class RedisBackend:
+    """Any Redis-protocol server (redis, valkey); needs the `redis` package (pip install redis)"""
+
+    blocking = True
+
+    def __init__(self, url: str = LLM_CACHE_REDIS_URL, prefix: str = "partyline:llm:"):
+        try:
+            import redis  # optional dependency, only needed for this backend
+        except ImportError:
+            raise RuntimeError("LLM_CACHE_BACKEND=redis needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+
+BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend, "redis": RedisBackend}
+
+
+class ResponseCache:
+    """Completion cache with negative caching of provider errors and per-persona stats"""
+
+    def __init__(self, backend=None, ttl: float = LLM_CACHE_TTL, error_ttl: float = LLM_CACHE_ERROR_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.stats = defaultdict(lambda: {"hits": 0, "misses": 0, "errors_cached": 0})
+        self._lock = threading.Lock()
+
+    def _count(self, persona: str, field: str):
+        with self._lock:
+            self.stats[persona][field] += 1
+
+    def lookup(self, key: str, persona: str = "-") -> Optional[dict]:
+        """{"text": ...} or {"error": ...} for a cached result, None on a miss"""
+        if self.backend is None:
+            return None
+        try:
+            raw = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed: {e}")
+            raw = None
+        if raw is None:
+            self._count(persona, "misses")
+            return None
+        self._count(persona, "hits")
+        return json.loads(raw)
+
+    def store(self, key: str, text: str):
+        self._set(key, {"text": text}, self.ttl)
+
+    def store_error(self, key: str, message: str, persona: str = "-"):
+        # Remember failures briefly so a broken provider isn't hammered by retries
+        self._count(persona, "errors_cached")
+        self._set(key, {"error": message}, self.error_ttl)
+
+    def _set(self, key: str, value: dict, ttl: float):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, json.dumps(value), ttl)
+        except Exception as e:
+            logger.warning(f"LLM cache store failed: {e}")
+
+    # Coroutine versions for the pipeline's event loop: disk and network
+    # backends run on a thread so a slow lookup doesn't stall every call
+
+    async def lookup_async(self, key: str, persona: str = "-") -> Optional[dict]:
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(self.lookup, key, persona)
+        return self.lookup(key, persona)
+
+    async def store_async(self, key: str, text: str):
+        if getattr(self.backend, "blocking", False):
+            await asyncio.to_thread(self.store, key, text)
+        else:
+            self.store(key, text)
+
+    async def store_error_async(self, key: str, message: str, persona: str = "-"):
+        if getattr(self.backend, "blocking", False):
+            await asyncio.to_thread(self.store_error, key, message, persona)
+        else:
+            self.store_error(key, message, persona)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            personas = {}
+            for persona, counts in self.stats.items():
+                lookups = counts["hits"] + counts["misses"]
+                personas[persona] = dict(counts, hit_rate=round(counts["hits"] / lookups, 3) if lookups else 0.0)
+        return {"backend": type(self.backend).__name__ if self.backend else None, "personas": personas}
+
+
+def from_env() -> ResponseCache:
+    """ResponseCache using the backend named by LLM_CACHE_BACKEND"""
+    if LLM_CACHE_BACKEND == "off":
+        return ResponseCache(None)
+    try:
+        return ResponseCache(BACKENDS[LLM_CACHE_BACKEND]())
+    except Exception as e:
+        logger.error(f"LLM cache backend {LLM_CACHE_BACKEND!r} unavailable, using memory: {e}")
+        return ResponseCache(MemoryBackend())
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Transport configuration (overridable from the environment / .env)
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", "32"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60"))
+# Needs the h2 package (pip install 'httpx[http2]'), which requirements.txt leaves out
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "0") == "1"
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "60"))
+
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_CAP = float(os.environ.get("LLM_BACKOFF_CAP", "20"))
+
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+# A half-open trial that neither succeeds nor fails within this long frees its slot
+LLM_BREAKER_TRIAL_TIMEOUT = float(os.environ.get("LLM_BREAKER_TRIAL_TIMEOUT", str(LLM_READ_TIMEOUT)))
+
+# Client-side quota, matched to the OpenRouter plan; 0 disables the limiter
+LLM_RATE_LIMIT_RPS = float(os.environ.get("LLM_RATE_LIMIT_RPS", "0"))
+LLM_RATE_LIMIT_BURST = int(os.environ.get("LLM_RATE_LIMIT_BURST", "20"))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def http_client() -> httpx.AsyncClient:
+    """Shared keep-alive pool for the OpenAI client"""
+    http2 = LLM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        except ImportError:
+            logger.warning("LLM_HTTP2 is set but the h2 package is missing; using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+
+
+class CircuitOpenError(Exception):
+    """The model has failed too often recently; calls are refused until it cools down"""
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures -> half-open after `cooldown`"""
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN,
+                 trial_timeout: float = LLM_BREAKER_TRIAL_TIMEOUT):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.trial_timeout = trial_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # When the half-open trial call started; None when no trial is running
+        self._trial_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    @property
+    def trial_running(self) -> bool:
+        return (self._trial_started is not None
+                and time.monotonic() - self._trial_started < self.trial_timeout)
+
+    @property
+    def available(self) -> bool:
+        """Whether a call would be let through right now"""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.trial_running)
+
+    def before_call(self, model: str) -> bool:
+        """Raise if the call must be refused; True when it is the half-open trial"""
+        if not self.available:
+            raise CircuitOpenError(f"circuit for {model} is open")
+        if self.state == "half-open":
+            self._trial_started = time.monotonic()
+            return True
+        return False
+
+    def release_trial(self):
+        """The trial ended with no verdict (cancelled, e.g. a losing hedge); let another try"""
+        self._trial_started = None
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_started = None
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """Async request rate limiter: `rate` per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        # Single event loop: no await between the check and the decrement, so no lock
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None  # HTTP-date form; fall back to our own backoff
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+class ResilientTransport:
+    """Rate limiting, jittered retries and a per-model circuit breaker around LLM calls"""
+
+    def __init__(self, max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_cap: float = LLM_BACKOFF_CAP, rate: float = LLM_RATE_LIMIT_RPS,
+                 burst: int = LLM_RATE_LIMIT_BURST):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "rejected_open_circuit": 0}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker()
+        return self.breakers[model]
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter keeps a burst of 429s from retrying in lockstep
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    async def call(self, model: str, request: Callable[[], Awaitable[T]]) -> T:
+        """Run `request()` (e.g. a chat.completions.create) with limits and retries"""
+        breaker = self.breaker(model)
+        self.stats["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            try:
+                trial = breaker.before_call(model)
+            except CircuitOpenError:
+                self.stats["rejected_open_circuit"] += 1
+                raise
+            try:
+                if self.bucket is not None:
+                    await self.bucket.acquire()
+                result = await request()
+            except asyncio.CancelledError:
+                if trial:
+                    breaker.release_trial()
+                raise
+            except Exception as e:
+                if _is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()  # the model answered; the request itself was bad
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                self.stats["retries"] += 1
+                logger.warning(f"{model} attempt {attempt + 1} failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, circuits={model: b.state for model, b in self.breakers.items()})
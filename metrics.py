@@ -0,0 +1,248 @@
+"""Prometheus-format metrics and a sampling profiler for one process
+
+The registry lives in process memory: each process counts only what it
+did, and /metrics reports that process alone. Run the web app with one
+worker (WEB_WORKERS=1, the default) when scraping it, or scrapes land on
+an arbitrary worker and counters jump between workers' values. The TTS
+server is one process and exposes its own port.
+"""
+import bisect
+import collections
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Instrumentation configuration (overridable from the environment / .env)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+# Stack samples per second for the opt-in profiler; 0 leaves it off
+METRICS_PROFILE_HZ = float(os.environ.get("METRICS_PROFILE_HZ", "0"))
+METRICS_PROFILE_DEPTH = 48
+# Serve /debug/profile (stack samples name internal code paths); off unless set
+METRICS_PROFILE_ENDPOINT = os.environ.get("METRICS_PROFILE_ENDPOINT", "0") == "1"
+
+# Seconds; spans sub-millisecond post-processing up to slow LLM replies
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: LabelKey = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions under a lock"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters, gauges and histograms rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = collections.defaultdict(dict)
+        self.gauges: Dict[str, Dict[LabelKey, float]] = collections.defaultdict(dict)
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = collections.defaultdict(dict)
+        # name -> (callback, label name)
+        self.gauge_fns: Dict[str, tuple] = {}
+        self.help: Dict[str, str] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self.counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self.gauges[name][_labels(labels)] = value
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = _labels(labels)
+        with self._lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the block's wall time in seconds (also when it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def gauge_fn(self, name: str, fn: Callable[[], Dict[str, float]], label: str = "name", help: str = ""):
+        """Gauge read at scrape time: `fn()` returns {label value: reading}"""
+        self.gauge_fns[name] = (fn, label)
+        if help:
+            self.help[name] = help
+
+    def describe(self, name: str, help: str):
+        self.help[name] = help
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def header(name, kind):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.extend(f"{name}{_format_labels(k)} {v}" for k, v in series.items())
+            for name, series in sorted(self.gauges.items()):
+                header(name, "gauge")
+                lines.extend(f"{name}{_format_labels(k)} {v}" for k, v in series.items())
+            for name, series in sorted(self.histograms.items()):
+                header(name, "histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(h.buckets + (float("inf"),), h.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+            gauge_fns = list(self.gauge_fns.items())
+
+        # Callbacks run outside the lock; they may take their own
+        for name, (fn, label) in gauge_fns:
+            try:
+                readings = fn()
+            except Exception as e:
+                logger.warning(f"Gauge {name} failed: {e}")
+                continue
+            header(name, "gauge")
+            lines.extend(f"{name}{_format_labels(((label, str(k)),))} {v}" for k, v in readings.items())
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Samples every thread's stack `hz` times a second into collapsed-stack counts
+
+    Output is the "frame;frame;frame count" format that flamegraph.pl and
+    speedscope read. Sampling costs one sys._current_frames() per tick, so
+    it is meant to be switched on (METRICS_PROFILE_HZ) while investigating.
+    """
+
+    def __init__(self, hz: float = METRICS_PROFILE_HZ, depth: int = METRICS_PROFILE_DEPTH):
+        self.interval = 1 / hz if hz > 0 else 0
+        self.depth = depth
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            logger.info(f"Sampling profiler on at {1 / self.interval:.0f} Hz")
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.depth:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                sampled.append(";".join(reversed(names)))
+            with self._lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    def collapsed(self, reset: bool = False) -> str:
+        with self._lock:
+            text = "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+        return text + "\n"
+
+
+# Process-wide instances shared by every module
+registry = Registry()
+profiler = SamplingProfiler()
+
+inc = registry.inc
+set_gauge = registry.set
+observe = registry.observe
+timer = registry.timer
+gauge_fn = registry.gauge_fn
+describe = registry.describe
+render = registry.render
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """/metrics and /debug/profile on their own port, for processes without a web app"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = render(), CONTENT_TYPE
+            elif self.path.startswith("/debug/profile") and METRICS_PROFILE_ENDPOINT:
+                body, content_type = profiler.collapsed(reset="reset=1" in self.path), "text/plain"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would drown the server log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Routing configuration (overridable from the environment / .env)
+LLM_MODELS = [m.strip() for m in os.environ.get("LLM_MODELS", "mistralai/mistral-7b-instruct").split(",") if m.strip()]
+# Off by default: a hedge can pay for two completions of the same reply
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_DELAY_MS = float(os.environ.get("LLM_HEDGE_DELAY_MS", "1500"))
+LLM_MAX_ERROR_RATE = float(os.environ.get("LLM_MAX_ERROR_RATE", "0.25"))
+# Successes needed before a model's latency is trusted for ranking
+LLM_MIN_SAMPLES = int(os.environ.get("LLM_MIN_SAMPLES", "5"))
+# Share of traffic sent to under-sampled models so their stats stay current
+LLM_EXPLORE_RATE = float(os.environ.get("LLM_EXPLORE_RATE", "0.05"))
+LLM_STATS_WINDOW = 200
+# Outcomes older than this stop counting toward a model's error rate, so an
+# early burst of failures doesn't bench a model for good
+LLM_ERROR_WINDOW_S = float(os.environ.get("LLM_ERROR_WINDOW_S", "300"))
+
+if not LLM_MODELS:
+    raise ValueError("LLM_MODELS must name at least one model")
+
+
+class ModelStats:
+    """Rolling latency/error window for one model"""
+
+    def __init__(self, window: int = LLM_STATS_WINDOW, error_window_s: float = LLM_ERROR_WINDOW_S):
+        self.latencies_ms: deque = deque(maxlen=window)
+        # (monotonic time, ok)
+        self.outcomes: deque = deque(maxlen=window)
+        self.error_window_s = error_window_s
+        self.selected = 0
+        self.hedges_won = 0
+
+    def record(self, ok: bool, latency_ms: Optional[float] = None):
+        self.outcomes.append((time.monotonic(), ok))
+        if ok and latency_ms is not None:
+            self.latencies_ms.append(latency_ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        return ordered[int(q * (len(ordered) - 1))]
+
+    @property
+    def error_rate(self) -> float:
+        cutoff = time.monotonic() - self.error_window_s
+        while self.outcomes and self.outcomes[0][0] < cutoff:
+            self.outcomes.popleft()
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+
+class ModelRouter:
+    """Picks the fastest healthy model from an ordered list, with optional hedging
+
+    Latency is time to the first streamed token, which is what a listener
+    on the party line actually waits for.
+    """
+
+    def __init__(self, is_available: Callable[[str], bool] = lambda model: True,
+                 hedge_delay_ms: float = LLM_HEDGE_DELAY_MS, max_error_rate: float = LLM_MAX_ERROR_RATE,
+                 min_samples: int = LLM_MIN_SAMPLES, explore_rate: float = LLM_EXPLORE_RATE):
+        self.is_available = is_available
+        self.hedge_delay = hedge_delay_ms / 1000
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self.models: Dict[str, ModelStats] = {}
+        self.hedges_fired = 0
+        self.failovers = 0
+
+    def stats(self, model: str) -> ModelStats:
+        if model not in self.models:
+            self.models[model] = ModelStats()
+        return self.models[model]
+
+    def rank(self, models: List[str]) -> List[str]:
+        """Healthy models fastest first, then everything else in configured order"""
+        if not models:
+            raise ValueError("no candidate models to route between")
+        healthy, unhealthy = [], []
+        for model in models:
+            stats = self.stats(model)
+            ok = self.is_available(model) and stats.error_rate <= self.max_error_rate
+            (healthy if ok else unhealthy).append(model)
+
+        sampled = [m for m in healthy if len(self.stats(m).latencies_ms) >= self.min_samples]
+        unsampled = [m for m in healthy if m not in sampled]
+        sampled.sort(key=lambda m: self.stats(m).percentile(0.5))
+
+        if unsampled and (not sampled or random.random() < self.explore_rate):
+            ranked = unsampled + sampled
+        else:
+            ranked = sampled + unsampled
+        return ranked + unhealthy
+
+    async def _timed(self, model: str, open_fn: Callable[[str], Awaitable[Any]]):
+        started = time.monotonic()
+        try:
+            result = await open_fn(model)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats(model).record(False)
+            raise
+        self.stats(model).record(True, (time.monotonic() - started) * 1000)
+        return result
+
+    async def first(self, models: List[str], open_fn: Callable[[str], Awaitable[Any]],
+                    hedge: bool = False, discard: Optional[Callable[[Any], Awaitable[None]]] = None):
+        """Run `open_fn(model)` on the best model, failing over down the ranking
+
+        With `hedge`, a second model is started if the first has not answered
+        within the hedge delay; whichever answers first wins and the other is
+        cancelled (or handed to `discard` if it also finished).
+        """
+        ranked = self.rank(models)
+        tasks: Dict[asyncio.Task, str] = {}
+        errors = []
+        next_index = 0
+        hedged = False
+
+        def launch():
+            nonlocal next_index
+            model = ranked[next_index]
+            next_index += 1
+            self.stats(model).selected += 1
+            tasks[asyncio.ensure_future(self._timed(model, open_fn))] = model
+
+        launch()
+        try:
+            while tasks:
+                can_hedge = hedge and not hedged and len(tasks) == 1 and next_index < len(ranked)
+                done, _ = await asyncio.wait(list(tasks), timeout=self.hedge_delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.hedges_fired += 1
+                    launch()
+                    continue
+
+                winner = None
+                for task in done:
+                    model = tasks.pop(task)
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        logger.warning(f"Model {model} failed: {task.exception()}")
+                    elif winner is None:
+                        winner = (model, task.result())
+                    elif discard is not None:
+                        await discard(task.result())
+                if winner is not None:
+                    if hedged:
+                        self.stats(winner[0]).hedges_won += 1
+                    return winner[1]
+
+                if not tasks and next_index < len(ranked):
+                    self.failovers += 1
+                    launch()
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise errors[-1]
+
+    def snapshot(self) -> dict:
+        models = {}
+        for model, stats in self.models.items():
+            p50, p95 = stats.percentile(0.5), stats.percentile(0.95)
+            models[model] = {
+                "selected": stats.selected,
+                "hedges_won": stats.hedges_won,
+                "error_rate": round(stats.error_rate, 3),
+                "ttft_p50_ms": round(p50, 1) if p50 is not None else None,
+                "ttft_p95_ms": round(p95, 1) if p95 is not None else None,
+                "available": self.is_available(model),
+            }
+        return {"hedges_fired": self.hedges_fired, "failovers": self.failovers, "models": models}
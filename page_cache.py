@@ -0,0 +1,367 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration (overridable from the environment / .env)
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_MB", "64")) * 1024 * 1024
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", ".cache/pages")
+PAGE_CACHE_TTL = float(os.environ.get("PAGE_CACHE_TTL", "600"))
+PAGE_CACHE_REVALIDATE = os.environ.get("PAGE_CACHE_REVALIDATE", "1") == "1"
+PAGE_CACHE_PROBE_TIMEOUT = float(os.environ.get("PAGE_CACHE_PROBE_TIMEOUT", "3"))
+PAGE_CACHE_DISK_MAX_BYTES = int(os.environ.get("PAGE_CACHE_DISK_MAX_MB", "512")) * 1024 * 1024
+# Disk eviction trims down to this share of the cap, so it doesn't run on every write
+PAGE_CACHE_DISK_LOW_WATER = 0.9
+
+# Query parameters that never change page content
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL so trivially different spellings share an entry"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """A fetch in progress that concurrent callers wait on instead of repeating"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry: Optional[dict] = None
+        self.error: Optional[BaseException] = None
+
+
+class PageCache:
+    """Two-tier (memory LRU + disk) cache of scraped HTML and its markdown
+
+    Entries are keyed by the normalized URL. Markdown is converted on first
+    use (an entry holds only HTML until then) and is additionally keyed by
+    the hash of the HTML it came from, so an unchanged page is never converted
+    twice even after its URL entry expires.
+    """
+
+    def __init__(self, max_bytes: int = PAGE_CACHE_MAX_BYTES, cache_dir: Optional[str] = PAGE_CACHE_DIR,
+                 ttl: float = PAGE_CACHE_TTL, revalidate: bool = PAGE_CACHE_REVALIDATE,
+                 disk_max_bytes: int = PAGE_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0,
+                      "revalidated": 0, "shared_fetches": 0, "disk_evictions": 0}
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        # content hash -> [markdown, number of entries with that content]
+        self._markdown_by_content: Dict[str, list] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    # -- memory tier ---------------------------------------------------------
+
+    @staticmethod
+    def _size(entry: dict) -> int:
+        return len(entry["html"]) + len(entry["markdown"] or "")
+
+    def _remember(self, key: str, entry: dict):
+        """Insert into the LRU and evict the oldest entries over budget (lock held)"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= self._size(old)
+            self._release_markdown(old)
+        self._entries[key] = entry
+        if entry["markdown"] is not None:
+            shared = self._markdown_by_content.setdefault(entry["content_hash"], [entry["markdown"], 0])
+            shared[1] += 1
+        self._bytes += self._size(entry)
+
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._size(evicted)
+            self._release_markdown(evicted)
+            self.stats["evictions"] += 1
+
+    def _release_markdown(self, entry: dict):
+        """Drop an entry's reference to its shared markdown; the last one removes it (lock held)"""
+        shared = self._markdown_by_content.get(entry["content_hash"])
+        if shared is not None and entry["markdown"] is not None:
+            shared[1] -= 1
+            if shared[1] <= 0:
+                del self._markdown_by_content[entry["content_hash"]]
+
+    # -- disk tier -----------------------------------------------------------
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load(self, key: str) -> Optional[dict]:
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # mtime is the disk tier's recency for eviction
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def _disk_files(self):
+        """(path, size, mtime) of every entry file on disk"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _enforce_disk_cap(self):
+        """Delete least recently used files down to the low-water mark
+
+        The running byte count only sees this process's writes, so the
+        directory is rescanned here and other workers' files are counted too.
+        """
+        with self._disk_lock:
+            if self._disk_bytes <= self.disk_max_bytes:
+                return
+            files = sorted(self._disk_files(), key=lambda f: f[2])
+            total = sum(size for _, size, _ in files)
+            target = self.disk_max_bytes * PAGE_CACHE_DISK_LOW_WATER
+            for path, size, _ in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.stats["disk_evictions"] += 1
+            self._disk_bytes = total
+
+    def _store(self, key: str, entry: dict):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write page cache entry {path}: {e}")
+            return
+        with self._disk_lock:
+            self._disk_bytes += size
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._enforce_disk_cap()
+
+    # -- freshness -----------------------------------------------------------
+
+    def _is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def _probe(self, url: str, entry: Optional[dict] = None):
+        """HEAD the origin; returns (status, etag, last_modified) or None on failure"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        req = urllib.request.Request(url, method="HEAD", headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=PAGE_CACHE_PROBE_TIMEOUT) as response:
+                return response.status, response.headers.get("ETag"), response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get("ETag"), e.headers.get("Last-Modified")
+        except Exception:
+            return None
+
+    def _revalidate(self, url: str, entry: dict) -> Optional[dict]:
+        """The stale entry refreshed if the origin says it is unchanged, else None
+
+        One HEAD, made only once the entry has gone stale. With validators
+        (learned by an earlier probe) it is a conditional request answered
+        by 304. Without them the page counts as unchanged if its
+        Last-Modified is no later than our fetch, and the validators seen
+        are kept for next time.
+        """
+        if not self.revalidate:
+            return None
+        if entry.get("etag") or entry.get("last_modified"):
+            probe = self._probe(url, entry)
+            if probe is None or probe[0] != 304:
+                return None
+            return dict(entry, fetched_at=time.time())
+        probe = self._probe(url)
+        if probe is None or probe[0] != 200 or not probe[2]:
+            return None
+        try:
+            modified = parsedate_to_datetime(probe[2]).timestamp()
+        except (TypeError, ValueError):
+            return None
+        if modified > entry["fetched_at"]:
+            return None
+        return dict(entry, fetched_at=time.time(), etag=probe[1], last_modified=probe[2])
+
+    # -- public API ----------------------------------------------------------
+
+    def get(self, url: str, fetch_html: Callable[[str], str],
+            to_markdown: Optional[Callable[[str], str]] = None) -> dict:
+        """Return {"html", "markdown", ...} for `url`, fetching at most once across threads
+
+        A stale entry is revalidated before it is refetched. Without
+        `to_markdown` the page is not converted, and "markdown" is None
+        unless an earlier caller already converted it.
+        """
+        entry = self._get(url, fetch_html)
+        if to_markdown is not None and entry["markdown"] is None:
+            markdown = self.markdown_for(entry["html"])
+            if markdown is None:
+                markdown = to_markdown(entry["html"])
+            entry = self.set_markdown(url, entry["html"], markdown)
+        return entry
+
+    def _get(self, url: str, fetch_html: Callable[[str], str]) -> dict:
+        key = _sha256(normalize_url(url))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.stats["shared_fetches"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry
+
+        try:
+            flight.entry = self._fill(key, url, entry, fetch_html)
+            return flight.entry
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _fill(self, key, url, entry, fetch_html) -> dict:
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None and self._is_fresh(entry):
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._remember(key, entry)
+                return entry
+
+        refreshed = self._revalidate(url, entry) if entry is not None else None
+        if refreshed is not None:
+            entry = refreshed
+            with self._lock:
+                self.stats["revalidated"] += 1
+                self._remember(key, entry)
+            self._store(key, entry)
+            return entry
+
+        with self._lock:
+            self.stats["misses"] += 1
+
+        html = fetch_html(url)
+        return self.put(url, html, self.markdown_for(html))
+
+    def markdown_for(self, html: str) -> Optional[str]:
+        """Previously converted markdown for identical HTML, if still in memory"""
+        with self._lock:
+            shared = self._markdown_by_content.get(_sha256(html))
+            return shared[0] if shared is not None else None
+
+    def set_markdown(self, url: str, html: str, markdown: str) -> dict:
+        """Attach converted markdown to the cached entry for this HTML, keeping its freshness"""
+        key = _sha256(normalize_url(url))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["content_hash"] == _sha256(html):
+                entry = dict(entry, markdown=markdown)
+                self._remember(key, entry)
+            else:
+                entry = None
+        if entry is None:
+            return self.put(url, html, markdown)
+        self._store(key, entry)
+        return entry
+
+    def put(self, url: str, html: str, markdown: Optional[str], etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> dict:
+        """Store a freshly scraped page in both tiers
+
+        No request is made here: validators are passed in when the fetcher
+        has the response's own headers, and otherwise learned on revalidation.
+        """
+        normalized = normalize_url(url)
+        key = _sha256(normalized)
+        entry = {
+            "url": normalized,
+            "html": html,
+            "markdown": markdown,
+            "content_hash": _sha256(html),
+            "fetched_at": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        with self._lock:
+            self._remember(key, entry)
+        self._store(key, entry)
+        return entry
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes,
+                        max_bytes=self.max_bytes, disk_bytes=self._disk_bytes,
+                        disk_max_bytes=self.disk_max_bytes)
@@ -0,0 +1,388 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import statistics
+import threading
+import time
+import hashlib
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+# (persona_id, text) for both streamed tokens and finished replies
+ResponseCallback = Callable[[str, str], None]
+
+import chunking
+import metrics
+from page_cache import PageCache
+
+logger = logging.getLogger(__name__)
+
+# Per-stage limits (overridable from the environment / .env)
+PIPELINE_SCRAPE_CONCURRENCY = int(os.environ.get("PIPELINE_SCRAPE_CONCURRENCY", "4"))
+PIPELINE_CONVERT_CONCURRENCY = int(os.environ.get("PIPELINE_CONVERT_CONCURRENCY", "2"))
+PIPELINE_LLM_CONCURRENCY = int(os.environ.get("PIPELINE_LLM_CONCURRENCY", "32"))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "256"))
+# Persona completions in flight at once, shared by every call
+PIPELINE_LLM_FANOUT = int(os.environ.get("PIPELINE_LLM_FANOUT", "16"))
+
+# Persona-neutral prompt for the map step of map-reduce summarization
+MAP_PROMPT = "You condense web pages. State the key facts of this section in a few plain sentences."
+# Condensed pages kept for late personas joining the same page
+CONDENSED_CACHE_SIZE = 256
+
+
+class CallJob:
+    """State of one /call (or one late persona) as it moves through the pipeline"""
+
+    def __init__(self, url: str, personas: Dict[str, str],
+                 on_response: Optional[ResponseCallback] = None,
+                 on_token: Optional[ResponseCallback] = None,
+                 trace_id: str = "-",
+                 transcript: Sequence[Tuple[str, str]] = (),
+                 condensed: Optional[str] = None,
+                 on_error: Optional[ResponseCallback] = None,
+                 on_scraped: Optional[Callable[[], None]] = None):
+        self.url = url
+        # Call id (or any caller-chosen id) carried into logs and on to TTS
+        self.trace_id = trace_id
+        self.created_at = time.monotonic()
+        self.enqueued_at = self.created_at
+        # persona id -> system prompt; each gets its own completion
+        self.personas = personas
+        self.on_response = on_response
+        self.on_token = on_token
+        self.on_error = on_error
+        # Called on the pipeline loop once the page is fetched (or found cached); must not block
+        self.on_scraped = on_scraped
+        self.html: Optional[str] = None
+        self.markdown: Optional[str] = None
+        # What the persona completions actually see: the cleaned page or its map summaries.
+        # Given up front (a persona joining a running call), the page stages are skipped
+        self.condensed: Optional[str] = condensed
+        # Some map-step chunks failed and were left out; don't cache this page anywhere
+        self.partial_page = False
+        # Earlier turns of the call, (persona id, text), that these personas respond to
+        self.transcript = tuple(transcript)
+        self.tokens: Dict[str, int] = {}
+        self.responses: Dict[str, str] = {}
+        # persona id -> error message, for personas whose completion failed
+        self.errors: Dict[str, str] = {}
+        self.ttft_ms: Dict[str, float] = {}
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+
+class Stage:
+    """A bounded queue drained by a fixed number of worker tasks"""
+
+    def __init__(self, name: str, handler: Callable[[CallJob], Awaitable[None]],
+                 concurrency: int, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.next: Optional["Stage"] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def put(self, job: CallJob):
+        # Blocks when the queue is full, pushing back on the stage before it
+        job.enqueued_at = time.monotonic()
+        await self.queue.put(job)
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            started = time.monotonic()
+            metrics.observe("pipeline_queue_wait_seconds", started - job.enqueued_at, stage=self.name)
+            try:
+                await self.handler(job)
+            except Exception as e:
+                metrics.inc("pipeline_stage_errors_total", stage=self.name)
+                logger.error(f"Pipeline stage {self.name} failed for {job.url} [{job.trace_id}]: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if self.next is not None:
+                    await self.next.put(job)
+                elif not job.future.done():
+                    job.future.set_result(job)
+            finally:
+                metrics.observe("pipeline_stage_seconds", time.monotonic() - started, stage=self.name)
+                self.queue.task_done()
+
+
+class CallPipeline:
+    """scrape -> convert -> summarize, each stage with its own concurrency limit
+
+    The stages run on a private event loop in a background thread so that
+    many in-flight calls share one thread instead of holding a worker each.
+    """
+
+    def __init__(self, page_cache: PageCache,
+                 scrape: Callable[[str], Awaitable[str]],
+                 convert: Callable[[str], str],
+                 summarize: Callable[..., AsyncIterator[str]],
+                 scrape_concurrency: int = PIPELINE_SCRAPE_CONCURRENCY,
+                 convert_concurrency: int = PIPELINE_CONVERT_CONCURRENCY,
+                 llm_concurrency: int = PIPELINE_LLM_CONCURRENCY,
+                 llm_fanout: int = PIPELINE_LLM_FANOUT,
+                 token_budget: int = chunking.SUMMARY_TOKEN_BUDGET,
+                 max_chunks: int = chunking.SUMMARY_MAX_CHUNKS,
+                 cpu_executor: Optional[concurrent.futures.Executor] = None):
+        self.page_cache = page_cache
+        self.scrape = scrape
+        self.convert = convert
+        self.summarize = summarize
+        self.stages = [
+            Stage("scrape", self._scrape_stage, scrape_concurrency),
+            Stage("convert", self._convert_stage, convert_concurrency),
+            Stage("condense", self._condense_stage, llm_concurrency),
+            Stage("summarize", self._summarize_stage, llm_concurrency),
+        ]
+        for stage, following in zip(self.stages, self.stages[1:]):
+            stage.next = following
+
+        self.llm_fanout = llm_fanout
+        self.token_budget = token_budget
+        self.max_chunks = max_chunks
+        self._condensed: "OrderedDict[str, tuple]" = OrderedDict()
+        self.tokens_saved_total = 0
+        self._fanout: Optional[asyncio.Semaphore] = None
+        # Recent time-to-first-token samples, the headline latency number
+        self._ttft_ms: deque = deque(maxlen=1000)
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Cache I/O runs on threads; conversion and chunking go to `cpu_executor`
+        # (a process pool, so big pages don't contend for the GIL) when given
+        self._convert_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=convert_concurrency, thread_name_prefix="convert"
+        )
+        self._cpu_executor = cpu_executor or self._convert_executor
+        # Page cache lookups block on revalidation or on another caller's fetch
+        self._scrape_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=scrape_concurrency, thread_name_prefix="scrape"
+        )
+        self._start_lock = threading.Lock()
+        # Futures of submitted calls that have not finished, for a graceful stop
+        self._inflight: set = set()
+        self._inflight_lock = threading.Lock()
+        metrics.gauge_fn("pipeline_queue_depth", self.queue_depths, label="stage",
+                         help="Calls waiting in front of each pipeline stage")
+
+    def start(self):
+        """Start the event loop thread (idempotent, done lazily after worker fork)"""
+        with self._start_lock:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            async def start_stages():
+                self._fanout = asyncio.Semaphore(self.llm_fanout)
+                for stage in self.stages:
+                    stage.start()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.run_until_complete(start_stages())
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name="call-pipeline", daemon=True).start()
+            ready.wait()
+            self.loop = loop
+
+    def submit(self, url: str, personas: Dict[str, str],
+               on_response: Optional[ResponseCallback] = None,
+               on_token: Optional[ResponseCallback] = None,
+               trace_id: str = "-",
+               transcript: Sequence[Tuple[str, str]] = (),
+               condensed: Optional[str] = None,
+               on_error: Optional[ResponseCallback] = None,
+               on_scraped: Optional[Callable[[], None]] = None) -> concurrent.futures.Future:
+        """Queue a call for some personas; the future resolves to the finished CallJob
+
+        `on_token(persona_id, delta)` fires for every streamed fragment and
+        `on_response(persona_id, text)` once each persona's reply is complete,
+        so callers can relay output before the slowest persona is done. A
+        persona whose completion fails gets `on_error(persona_id, message)`
+        instead and no response; the others carry on. Both run on a thread,
+        so they may block (e.g. on a store write).
+        Each persona sees `transcript` as the conversation so far; passing the
+        call's `condensed` page as well makes a late joiner one completion.
+        `on_scraped()` fires as the call leaves the scrape stage, i.e. once it
+        no longer touches the origin site.
+        """
+        self.start()
+        job = CallJob(url, personas, on_response, on_token, trace_id, transcript, condensed, on_error,
+                      on_scraped)
+        with self._inflight_lock:
+            self._inflight.add(job.future)
+        job.future.add_done_callback(self._finished)
+        asyncio.run_coroutine_threadsafe(self.stages[0].put(job), self.loop)
+        return job.future
+
+    def _finished(self, future: concurrent.futures.Future):
+        with self._inflight_lock:
+            self._inflight.discard(future)
+
+    def stop(self, timeout: float = 30) -> bool:
+        """Let in-flight calls finish for up to `timeout` seconds, then stop the loop thread
+
+        Returns False when calls were still running at the deadline.
+        """
+        with self._inflight_lock:
+            inflight = list(self._inflight)
+        if inflight:
+            logger.info(f"Waiting up to {timeout:.0f}s for {len(inflight)} in-flight calls")
+        _, unfinished = concurrent.futures.wait(inflight, timeout=timeout)
+        with self._start_lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self.loop = None
+        self._convert_executor.shutdown(wait=False)
+        self._scrape_executor.shutdown(wait=False)
+        return not unfinished
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {stage.name: stage.queue.qsize() if stage.queue else 0 for stage in self.stages}
+
+    def latency_summary(self) -> dict:
+        samples = sorted(self._ttft_ms)
+        if not samples:
+            return {"ttft_samples": 0}
+        return {
+            "ttft_samples": len(samples),
+            "ttft_p50_ms": round(statistics.median(samples), 1),
+            "ttft_p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 1),
+        }
+
+    def token_summary(self) -> dict:
+        return {"input_tokens_saved_total": self.tokens_saved_total}
+
+    # -- stage handlers (run on the pipeline loop) ---------------------------
+
+    async def _scrape_stage(self, job: CallJob):
+        try:
+            await self._scrape_page(job)
+        finally:
+            if job.on_scraped is not None:
+                job.on_scraped()
+
+    async def _scrape_page(self, job: CallJob):
+        if job.condensed is not None:
+            return
+        loop = asyncio.get_running_loop()
+
+        def fetch_html(url):
+            # Called on a scrape thread by whichever caller leads the fetch
+            return asyncio.run_coroutine_threadsafe(self.scrape(url), loop).result()
+
+        # The page cache revalidates stale entries and shares one fetch per
+        # page with every concurrent caller, /scrape included
+        entry = await loop.run_in_executor(self._scrape_executor, self.page_cache.get, job.url, fetch_html)
+        job.html, job.markdown = entry["html"], entry["markdown"]
+
+    async def _convert_stage(self, job: CallJob):
+        if job.markdown is not None or job.condensed is not None:
+            return
+        loop = asyncio.get_running_loop()
+        markdown = await loop.run_in_executor(self._convert_executor, self.page_cache.markdown_for, job.html)
+        if markdown is None:
+            markdown = await loop.run_in_executor(self._cpu_executor, self.convert, job.html)
+        await loop.run_in_executor(self._convert_executor, self.page_cache.set_markdown, job.url, job.html, markdown)
+        job.markdown = markdown
+
+    async def _complete(self, content: str, system_prompt: str) -> str:
+        async with self._fanout:
+            with metrics.timer("llm_completion_seconds", persona="map"):
+                return "".join([delta async for delta in self.summarize(content, system_prompt, "map")]).strip()
+
+    async def _condense_stage(self, job: CallJob):
+        # Clean, chunk and (for big pages) map-reduce once per page, not per persona
+        if job.condensed is not None:
+            sent = chunking.estimate_tokens(job.condensed) * len(job.personas)
+            job.tokens = {"original": sent, "sent": sent, "saved": 0}
+            return
+        key = hashlib.sha256(job.markdown.encode("utf-8")).hexdigest()
+        cached = self._condensed.get(key)
+        if cached is not None:
+            self._condensed.move_to_end(key)
+            job.condensed, original_tokens, map_tokens = cached
+            map_tokens = 0  # the map step was paid for by an earlier call
+        else:
+            loop = asyncio.get_running_loop()
+            document = await loop.run_in_executor(
+                self._cpu_executor, chunking.prepare, job.markdown, self.token_budget
+            )
+            original_tokens = document.original_tokens
+            failed = []
+            if document.tokens <= self.token_budget:
+                job.condensed, map_tokens = document.text, 0
+            else:
+                chunks = chunking.select(document, self.max_chunks)
+                # A failed chunk is left out rather than failing the call; failures
+                # raise, so error text can never end up in the page the personas see
+                notes = await asyncio.gather(*(self._complete(chunk.text, MAP_PROMPT) for chunk in chunks),
+                                             return_exceptions=True)
+                failed = [note for note in notes if isinstance(note, BaseException)]
+                if len(failed) == len(notes):
+                    raise failed[0]
+                if failed:
+                    job.partial_page = True
+                    metrics.inc("pipeline_map_chunk_errors_total", len(failed))
+                    logger.warning(f"{job.url}: {len(failed)} of {len(notes)} map chunks failed: {failed[0]}")
+                job.condensed = "\n\n".join(note for note in notes if isinstance(note, str) and note)
+                map_tokens = sum(chunk.tokens for chunk in chunks)
+            if not failed:
+                # Only complete condensations are kept; a partial one is retried next call
+                self._condensed[key] = (job.condensed, original_tokens, map_tokens)
+                if len(self._condensed) > CONDENSED_CACHE_SIZE:
+                    self._condensed.popitem(last=False)
+
+        personas = len(job.personas)
+        naive = original_tokens * personas
+        sent = map_tokens + chunking.estimate_tokens(job.condensed) * personas
+        job.tokens = {"original": naive, "sent": sent, "saved": max(0, naive - sent)}
+        self.tokens_saved_total += job.tokens["saved"]
+        logger.info(f"{job.url}: sending {sent} input tokens instead of {naive}")
+
+    async def _summarize_stage(self, job: CallJob):
+        # One completion per persona, all in flight together under the shared limit
+        loop = asyncio.get_running_loop()
+
+        async def respond(persona_id, system_prompt):
+            parts = []
+            try:
+                async with self._fanout:
+                    started = time.monotonic()
+                    async for delta in self.summarize(job.condensed, system_prompt, persona_id, job.transcript):
+                        if not parts:
+                            job.ttft_ms[persona_id] = (time.monotonic() - started) * 1000
+                            self._ttft_ms.append(job.ttft_ms[persona_id])
+                            metrics.observe("llm_ttft_seconds", job.ttft_ms[persona_id] / 1000, persona=persona_id)
+                        parts.append(delta)
+                        if job.on_token is not None:
+                            job.on_token(persona_id, delta)
+                    metrics.observe("llm_completion_seconds", time.monotonic() - started, persona=persona_id)
+            except Exception as e:
+                # A failed turn is reported, never recorded as something the persona said
+                metrics.inc("llm_persona_errors_total", persona=persona_id)
+                logger.error(f"Persona {persona_id} failed for {job.url} [{job.trace_id}]: {e}")
+                job.errors[persona_id] = str(e)
+                if job.on_error is not None:
+                    await loop.run_in_executor(None, job.on_error, persona_id, str(e))
+                return
+            text = "".join(parts).strip()
+            job.responses[persona_id] = text
+            if job.on_response is not None:
+                # Callers write to the call store here; keep that off the loop
+                await loop.run_in_executor(None, job.on_response, persona_id, text)
+
+        await asyncio.gather(*(respond(persona_id, system_prompt)
+                               for persona_id, system_prompt in job.personas.items()))
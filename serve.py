@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Production entry point: gunicorn with threaded workers in front of app.py
+
+    python serve.py                       # WEB_BIND, WEB_WORKERS, ... from the environment / .env
+
+Each worker is a process with WEB_THREADS request threads, and every open
+SSE stream (/call/<id>/events) holds one of them until its call goes idle.
+So WEB_WORKERS * WEB_THREADS caps how many browsers can follow calls at
+once; further requests, static files included, queue behind them. Raise
+WEB_THREADS with the number of concurrent callers. Static files
+are built (compressed, hashed) once in the master and answered by
+static_assets.StaticFiles ahead of Flask. On SIGTERM gunicorn stops
+accepting, waits up to WEB_GRACEFUL_TIMEOUT for requests, and each worker
+lets its in-flight calls finish before exiting.
+
+More than one worker needs CALL_STORE_BACKEND=sqlite, so every worker
+sees every call (a worker that isn't generating a call follows its replies
+through the store), and BATCH_ENABLED=0, because the batch queue and its
+per-domain limits live in a single process; serve.py refuses to start
+otherwise. /metrics is per worker (metrics.py), so keep one worker where
+it is scraped.
+"""
+import logging
+import os
+import signal
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import static_assets  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Serving configuration (overridable from the environment / .env)
+WEB_BIND = os.environ.get("WEB_BIND", "127.0.0.1:5000")
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "1"))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "32"))
+WEB_GRACEFUL_TIMEOUT = float(os.environ.get("WEB_GRACEFUL_TIMEOUT", "30"))
+WEB_KEEPALIVE = float(os.environ.get("WEB_KEEPALIVE", "5"))
+WEB_MAX_REQUESTS = int(os.environ.get("WEB_MAX_REQUESTS", "0"))
+
+
+def load_application():
+    """The WSGI callable a worker serves (imported after fork, so each worker owns its pools)"""
+    import app
+
+    return static_assets.StaticFiles(app.app)
+
+
+# When this worker got SIGTERM; the arbiter SIGKILLs it WEB_GRACEFUL_TIMEOUT later
+_term_at = None
+
+
+def post_worker_init(worker):
+    handle_exit = worker.handle_exit
+
+    def on_term(sig, frame):
+        global _term_at
+        _term_at = time.monotonic()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_exit(server, worker):
+    # Called in the worker after its last request, when request draining has already
+    # used part of the graceful timeout; in-flight calls get only what is left of it
+    import app
+
+    timeout = WEB_GRACEFUL_TIMEOUT
+    if _term_at is not None:
+        timeout = max(0.0, WEB_GRACEFUL_TIMEOUT - (time.monotonic() - _term_at) - 1)
+    app.shutdown(timeout)
+
+
+def options() -> dict:
+    return {
+        "bind": WEB_BIND,
+        "workers": WEB_WORKERS,
+        "worker_class": "gthread",
+        "threads": WEB_THREADS,
+        "graceful_timeout": WEB_GRACEFUL_TIMEOUT,
+        "keepalive": WEB_KEEPALIVE,
+        "max_requests": WEB_MAX_REQUESTS,
+        # Spread recycling so workers don't all restart at once
+        "max_requests_jitter": WEB_MAX_REQUESTS // 10,
+        "sendfile": True,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+        "accesslog": "-",
+    }
+
+
+def main():
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options().items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load_application()
+
+    logging.basicConfig(level=logging.INFO)
+    if WEB_WORKERS > 1 and os.environ.get("CALL_STORE_BACKEND", "memory") == "memory":
+        raise SystemExit("WEB_WORKERS > 1 with the memory call store: calls would only be visible to "
+                         "the worker that created them; set CALL_STORE_BACKEND=sqlite")
+    if WEB_WORKERS > 1 and os.environ.get("BATCH_ENABLED", "1") == "1":
+        raise SystemExit("WEB_WORKERS > 1 with batch calls: jobs and per-domain limits are per worker; "
+                         "set BATCH_ENABLED=0 or run one worker")
+    if WEB_WORKERS > 1 and os.environ.get("METRICS_ENABLED", "1") == "1":
+        logger.warning("WEB_WORKERS > 1: /metrics reports whichever worker answers the scrape, "
+                       "not the whole server; run one worker where metrics are scraped")
+    static_assets.build()
+    Server().run()
+
+
+if __name__ == "__main__":
+    main()
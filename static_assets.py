@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Static file configuration (overridable from the environment / .env)
+STATIC_DIR = os.environ.get("STATIC_DIR", "fe")
+STATIC_BUILD_DIR = os.environ.get("STATIC_BUILD_DIR", ".cache/static")
+# For versioned (?v=<hash>) URLs; unversioned ones are revalidated with the ETag
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+
+MANIFEST = "manifest.json"
+# Smaller files aren't worth a Content-Encoding; these types are already compressed
+MIN_COMPRESS_BYTES = 512
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# Preferred first when the client accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+BLOCK_SIZE = 64 * 1024
+
+# src="script.js" / href="style.css" in HTML, rewritten to versioned URLs
+ASSET_REF = re.compile(r'''((?:src|href)=["'])([^"':?#]+)(["'])''')
+
+
+def _brotli():
+    try:
+        import brotli  # optional dependency; gzip copies are always written
+    except ImportError:
+        return None
+    return brotli
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build(src: str = STATIC_DIR, out: str = STATIC_BUILD_DIR) -> Dict[str, dict]:
+    """Copy `src` to `out` with .gz/.br siblings, content-hash ETags and a manifest
+
+    HTML is processed last so its references to other assets can carry
+    their hash as ?v=, which makes those URLs safe to cache for a year.
+    Run once before workers start (serve.py does); they only read the result.
+    """
+    brotli = _brotli()
+    names: List[str] = []
+    for root, _, files in os.walk(src):
+        names.extend(os.path.relpath(os.path.join(root, name), src).replace(os.sep, "/") for name in files)
+    names.sort(key=lambda name: (name.endswith(".html"), name))
+
+    manifest: Dict[str, dict] = {}
+    for name in names:
+        with open(os.path.join(src, name), "rb") as f:
+            data = f.read()
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if name.endswith(".html"):
+            base = os.path.dirname(name)
+
+            def versioned(match):
+                target = os.path.normpath(os.path.join(base, match.group(2))).replace(os.sep, "/")
+                if target not in manifest:
+                    return match.group(0)
+                return f"{match.group(1)}{match.group(2)}?v={manifest[target]['etag'][:12]}{match.group(3)}"
+
+            data = ASSET_REF.sub(versioned, data.decode("utf-8")).encode("utf-8")
+
+        entry = {"etag": hashlib.sha256(data).hexdigest()[:32], "type": content_type,
+                 "sizes": {"identity": len(data)}}
+        _write(os.path.join(out, name), data)
+        if len(data) >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE):
+            compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(data, quality=11)
+            for encoding, suffix in ENCODINGS:
+                if encoding in compressed and len(compressed[encoding]) < len(data):
+                    _write(os.path.join(out, name + suffix), compressed[encoding])
+                    entry["sizes"][encoding] = len(compressed[encoding])
+        manifest[name] = entry
+
+    _write(os.path.join(out, MANIFEST), json.dumps(manifest, indent=1).encode("utf-8"))
+    logger.info(f"Built {len(manifest)} static files into {out}"
+                f"{'' if brotli else ' (gzip only; install brotli for .br)'}")
+    return manifest
+
+
+def accepted_encodings(header: str) -> set:
+    """Codings the client accepts, from an Accept-Encoding header (q=0 excluded)"""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFiles:
+    """WSGI middleware answering for built static files before Flask sees the request
+
+    Picks the smallest representation the client accepts, answers
+    If-None-Match with 304, and hands the open file to the server's
+    wsgi.file_wrapper, which gunicorn turns into sendfile(2). API
+    requests pass straight through to `app`. The build directory's
+    layout (file, file.gz, file.br) also suits nginx's gzip_static and
+    brotli_static if a proxy should take these requests over entirely.
+    """
+
+    def __init__(self, app, build_dir: str = STATIC_BUILD_DIR, src: str = STATIC_DIR,
+                 max_age: int = STATIC_MAX_AGE):
+        self.app = app
+        self.build_dir = build_dir
+        self.max_age = max_age
+        try:
+            with open(os.path.join(build_dir, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = build(src, build_dir)
+
+    def _select(self, name: str, environ) -> Tuple[str, Optional[str], str]:
+        """(file path, Content-Encoding, ETag) of the representation to send"""
+        entry = self.manifest[name]
+        accepted = accepted_encodings(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        for encoding, suffix in ENCODINGS:
+            if encoding in entry["sizes"] and encoding in accepted:
+                # Strong ETags must differ between encodings of the same content
+                return os.path.join(self.build_dir, name + suffix), encoding, f'"{entry["etag"]}-{encoding}"'
+        return os.path.join(self.build_dir, name), None, f'"{entry["etag"]}"'
+
+    def __call__(self, environ, start_response):
+        method = environ.get("REQUEST_METHOD")
+        name = environ.get("PATH_INFO", "").lstrip("/") or "index.html"
+        if method not in ("GET", "HEAD") or name not in self.manifest:
+            return self.app(environ, start_response)
+
+        path, encoding, etag = self._select(name, environ)
+        versioned = "v=" in environ.get("QUERY_STRING", "")
+        headers = [
+            ("ETag", etag),
+            ("Vary", "Accept-Encoding"),
+            ("Cache-Control", f"public, max-age={self.max_age}, immutable" if versioned else "no-cache"),
+        ]
+        if etag in (tag.strip() for tag in environ.get("HTTP_IF_NONE_MATCH", "").split(",")):
+            start_response("304 Not Modified", headers)
+            return []
+
+        headers += [("Content-Type", self.manifest[name]["type"]),
+                    ("Content-Length", str(self.manifest[name]["sizes"][encoding or "identity"]))]
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        start_response("200 OK", headers)
+        if method == "HEAD":
+            return []
+        f = open(path, "rb")
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if file_wrapper is not None:
+            return file_wrapper(f, BLOCK_SIZE)
+        return _iter_file(f)
+
+
+def _iter_file(f):
+    with f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    shutil.rmtree(STATIC_BUILD_DIR, ignore_errors=True)
+    build()
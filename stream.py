@@ -3,157 +3,325 @@ import websockets
 import json
 import torch
 import logging
-from transformers import AutoTokenizer, AutoModel
 import soundfile as sf
 import io
+import os
 import numpy as np
 from typing import Dict, List, Optional
 import base64
+from collections import deque
 import time
 
+import audio_cache
+import audio_frames
+import metrics
+import tts_model
+from audio_post import SessionAudioProcessor
+from tts_batcher import InferenceScheduler
+from tts_stream import TTS_LOOKAHEAD, BufferPacer, split_for_speech
+
+# Session limits (overridable from the environment)
+TTS_SESSION_QUEUE = int(os.environ.get("TTS_SESSION_QUEUE", "8"))
+TTS_WRITE_LIMIT = int(os.environ.get("TTS_WRITE_LIMIT", str(256 * 1024)))
+TTS_SEND_TIMEOUT = float(os.environ.get("TTS_SEND_TIMEOUT", "10"))
+TTS_MAX_TEXT_CHARS = int(os.environ.get("TTS_MAX_TEXT_CHARS", "10000"))
+# Phrases one client "prewarm" message may ask for (TTS_PREWARM_FILE is not capped)
+TTS_PREWARM_MAX_PHRASES = int(os.environ.get("TTS_PREWARM_MAX_PHRASES", "100"))
+# Port for /metrics and /debug/profile (with METRICS_PROFILE_ENDPOINT=1); 0 disables it
+TTS_METRICS_PORT = int(os.environ.get("TTS_METRICS_PORT", "8766"))
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class VibeVoiceWebSocketServer:
-    def __init__(self, model_path: str = "microsoft/VibeVoice-1.5B"):
+    def __init__(self, model_path: str = tts_model.TTS_MODEL_PATH, workers: int = tts_model.TTS_WORKERS):
         self.model_path = model_path
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model = None
         self.tokenizer = None
         self.active_connections: Dict[str, websockets.WebSocketServerProtocol] = {}
+        # One model, many sessions: chunks from every connection share forward passes.
+        # With workers, each inference process takes whole batches off the same queue
+        self.workers = workers
+        if workers > 0:
+            self.scheduler = InferenceScheduler(tts_model.worker_generate_batch,
+                                                executor=tts_model.worker_pool(model_path, workers),
+                                                concurrency=workers)
+        else:
+            self.scheduler = InferenceScheduler(self._sync_generate_batch)
+        self.sample_rate = 24000
+        self.audio_seconds = 0.0
+        # Bump TTS_MODEL_VERSION when weights change so stale phrases aren't served
+        self.model_version = os.environ.get("TTS_MODEL_VERSION", model_path)
+        self.phrase_cache = audio_cache.from_env(self.model_version)
+        self.started_at = time.time()
+        metrics.gauge_fn("tts_queue_depth", self._queue_depths, label="queue",
+                         help="Chunks waiting for the model, and open connections")
+        metrics.gauge_fn("tts_phrase_cache", lambda: {k: float(v) for k, v in self.phrase_cache.snapshot().items()},
+                         label="stat")
         
     async def initialize_model(self):
-        """Load the VibeVoice model asynchronously"""
+        """Load (and warm up) the VibeVoice model before accepting connections"""
         logger.info("Loading VibeVoice model...")
+        loop = asyncio.get_event_loop()
         
-        # Load in a separate thread to avoid blocking
-        def load_model():
-            tokenizer = AutoTokenizer.from_pretrained(self.model_path)
-            model = AutoModel.from_pretrained(
-                self.model_path,
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                device_map="auto" if torch.cuda.is_available() else None
-            )
-            model.eval()
-            return tokenizer, model
+        if self.workers > 0:
+            # Each worker loads and warms up in its initializer; wait until all are up
+            pids = await asyncio.gather(*(loop.run_in_executor(self.scheduler.executor, tts_model.worker_ready)
+                                          for _ in range(self.workers)))
+            logger.info(f"{len(set(pids))} inference workers ready")
+            return
         
-        self.tokenizer, self.model = await asyncio.get_event_loop().run_in_executor(
-            None, load_model
+        # Load in a separate thread to avoid blocking
+        self.tokenizer, self.model = await loop.run_in_executor(
+            None, tts_model.load, self.model_path, self.device
         )
+        if tts_model.TTS_WARMUP:
+            await loop.run_in_executor(
+                self.scheduler.executor, tts_model.warm_up, self.tokenizer, self.model, self.device
+            )
         logger.info(f"Model loaded successfully on {self.device}")
     
     async def generate_streaming_audio(self, text: str, speaker_names: List[str], 
                                      websocket: websockets.WebSocketServerProtocol,
-                                     session_id: str):
+                                     session_id: str, options: Optional[dict] = None,
+                                     request_id=None, trace_id: Optional[str] = None):
         """Generate and stream audio in real-time chunks"""
+        requested_at = time.perf_counter()
+        options = options or {"protocol": "json"}
+        pacer = options.setdefault("pacer", BufferPacer())
+        # Loudness state carries across the session's utterances; the crossfade does not
+        post = options.setdefault("post", SessionAudioProcessor(self.sample_rate))
+        post.reset_boundary()
+        if options.get("encoder") is not None:
+            # Opus frames don't span requests either
+            options["encoder"].reset()
+        speaker = speaker_names[0] if speaker_names else "Alice"
+        pending = deque()
         try:
-            # Split text into words for ultra-low latency
-            words = text.split()
-            chunk_size = 5  # Very small chunks for minimal latency
+            # Sentence/clause chunks, small first so audio starts quickly
+            chunks = split_for_speech(text)
             
-            for i in range(0, len(words), chunk_size):
-                chunk_words = words[i:i + chunk_size]
-                text_chunk = " ".join(chunk_words)
-                
-                # Add punctuation for better synthesis
-                if i + chunk_size >= len(words):
-                    text_chunk += "."
-                
-                start_time = time.time()
-                
-                # Generate audio for this chunk
-                audio_bytes = await self._generate_audio_chunk(
-                    text_chunk, speaker_names[0] if speaker_names else "Alice"
-                )
-                
+            def schedule():
+                # Keep up to TTS_LOOKAHEAD chunks generating ahead of the one being sent
+                while len(pending) <= TTS_LOOKAHEAD and len(pending) + sent < len(chunks):
+                    text_chunk = chunks[len(pending) + sent]
+                    task = asyncio.ensure_future(self._generate_audio_chunk(text_chunk, speaker))
+                    pending.append((text_chunk, time.time(), task))
+            
+            sent = 0
+            schedule()
+            while pending:
+                text_chunk, start_time, task = pending.popleft()
+                audio = await task
                 generation_time = (time.time() - start_time) * 1000  # ms
+                metrics.observe("tts_chunk_generation_seconds", generation_time / 1000)
+                chunk_index = sent
+                sent += 1
+                schedule()
                 
-                if audio_bytes:
-                    # Encode audio as base64 for JSON transmission
-                    audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-                    
-                    response = {
-                        "type": "audio_chunk",
-                        "data": audio_base64,
-                        "chunk_index": i // chunk_size,
-                        "text_chunk": text_chunk,
-                        "generation_time_ms": round(generation_time, 2),
-                        "session_id": session_id
-                    }
-                    
-                    await websocket.send(json.dumps(response))
-                    
-                    # Very small delay to prevent overwhelming
-                    await asyncio.sleep(0.05)
+                if audio is not None and len(audio):
+                    # Paced by the client's buffer level, not a fixed delay
+                    with metrics.timer("tts_pacing_wait_seconds"):
+                        await pacer.wait()
+                    # Levelled and crossfaded into a reused buffer, sent before the next chunk
+                    last = sent == len(chunks)
+                    with metrics.timer("tts_postprocess_seconds"):
+                        audio = post.process(audio, last=last)
+                    duration_ms = len(audio) / self.sample_rate * 1000
+                    send_started = time.perf_counter()
+                    if options["protocol"] == "binary":
+                        await self._send_binary_chunk(websocket, options, chunk_index, audio, last)
+                    else:
+                        # Encode audio as base64 for JSON transmission
+                        audio_base64 = base64.b64encode(self._audio_to_bytes(audio)).decode('utf-8')
+                        
+                        response = {
+                            "type": "audio_chunk",
+                            "data": audio_base64,
+                            "chunk_index": chunk_index,
+                            "text_chunk": text_chunk,
+                            "generation_time_ms": round(generation_time, 2),
+                            "request_id": request_id,
+                            "trace_id": trace_id,
+                            "session_id": session_id
+                        }
+                        
+                        await self._send_audio(websocket, json.dumps(response))
+                    metrics.observe("tts_send_seconds", time.perf_counter() - send_started, protocol=options["protocol"])
+                    if chunk_index == 0:
+                        first_audio = time.perf_counter() - requested_at
+                        metrics.observe("tts_time_to_first_audio_seconds", first_audio)
+                        logger.info(f"[{trace_id or session_id}] first audio after {first_audio * 1000:.0f} ms")
+                    metrics.inc("tts_audio_seconds_total", duration_ms / 1000)
+                    pacer.sent(duration_ms)
             
             # Send completion signal
             completion = {
                 "type": "generation_complete",
+                "request_id": request_id,
+                "trace_id": trace_id,
                 "session_id": session_id,
-                "total_chunks": (len(words) + chunk_size - 1) // chunk_size
+                "total_chunks": len(chunks)
             }
             await websocket.send(json.dumps(completion))
             
         except Exception as e:
-            logger.error(f"Error in streaming generation: {e}")
+            metrics.inc("tts_generation_errors_total")
+            logger.error(f"[{trace_id or session_id}] Error in streaming generation: {e}")
             error_response = {
                 "type": "error",
                 "message": str(e),
+                "request_id": request_id,
                 "session_id": session_id
             }
             await websocket.send(json.dumps(error_response))
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+    
+    def _queue_depths(self) -> Dict[str, int]:
+        return {
+            "inference": self.scheduler.snapshot()["queued"],
+            "connections": len(self.active_connections),
+        }
+    
+    async def _session_worker(self, websocket: websockets.WebSocketServerProtocol,
+                              session_id: str, options: dict):
+        """Runs one session's requests in order, each as a cancellable task"""
+        while True:
+            request_id, text, speaker_names, trace_id = await options["queue"].get()
+            options["current"] = asyncio.ensure_future(self.generate_streaming_audio(
+                text, speaker_names, websocket, session_id, options, request_id=request_id, trace_id=trace_id
+            ))
+            try:
+                await asyncio.shield(options["current"])
+            except asyncio.CancelledError:
+                if not options["current"].cancelled():
+                    raise  # the worker itself was cancelled (disconnect)
+                # Only this request was cancelled; the client has moved on
+                options["pacer"] = BufferPacer()
+            except Exception as e:
+                logger.error(f"Session {session_id} request {request_id} failed: {e}")
+            finally:
+                options["current"] = None
+    
+    def _cancel_current(self, options: dict, drop_queued: bool = False) -> int:
+        """Cancel the request being spoken, optionally emptying the queue too"""
+        dropped = 0
+        if drop_queued:
+            while not options["queue"].empty():
+                options["queue"].get_nowait()
+                dropped += 1
+        if options.get("current") is not None:
+            options["current"].cancel()
+        return dropped
+    
+    @staticmethod
+    def _prewarm_phrases(phrases, max_phrases: Optional[int] = TTS_PREWARM_MAX_PHRASES) -> Dict[str, List[str]]:
+        """Validated {speaker: [phrase, ...]}; raises ValueError on a bad or oversized request"""
+        if not isinstance(phrases, dict) or not all(
+                isinstance(speaker, str) and isinstance(texts, list) and all(isinstance(t, str) for t in texts)
+                for speaker, texts in phrases.items()):
+            raise ValueError("phrases must map speaker names to lists of strings")
+        count = sum(len(texts) for texts in phrases.values())
+        if max_phrases is not None and count > max_phrases:
+            raise ValueError(f"Too many phrases to prewarm (max {max_phrases})")
+        if any(len(text) > TTS_MAX_TEXT_CHARS for texts in phrases.values() for text in texts):
+            raise ValueError(f"Phrase too long (max {TTS_MAX_TEXT_CHARS} characters)")
+        return phrases
+    
+    async def prewarm(self, phrases: Dict[str, List[str]]) -> int:
+        """Synthesize each speaker's stock phrases into the phrase cache"""
+        jobs = [(speaker, chunk) for speaker, texts in phrases.items()
+                for text in texts for chunk in split_for_speech(text)]
+        missing = await asyncio.to_thread(
+            lambda: [(speaker, chunk) for speaker, chunk in jobs if self.phrase_cache.get(speaker, chunk) is None])
+        # Submitted together so the scheduler batches them
+        await asyncio.gather(*(self._generate_audio_chunk(chunk, speaker) for speaker, chunk in missing))
+        logger.info(f"Pre-warmed {len(missing)} of {len(jobs)} phrase chunks")
+        return len(missing)
+    
+    async def _prewarm_for_client(self, websocket: websockets.WebSocketServerProtocol,
+                                  session_id: str, phrases: Dict[str, List[str]]):
+        try:
+            warmed = await self.prewarm(phrases)
+            await websocket.send(json.dumps({"type": "prewarmed", "synthesized": warmed, "session_id": session_id}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"Session {session_id} prewarm failed: {e}")
+    
+    async def _send_binary_chunk(self, websocket: websockets.WebSocketServerProtocol,
+                                 options: dict, chunk_index: int, audio: np.ndarray, last: bool = True):
+        """Header frame, then the raw PCM16 buffer or one frame per Opus packet"""
+        if options["format"] == "opus":
+            # Samples short of a frame go out with the next chunk, or padded with the last
+            payloads = options["encoder"].encode(audio, last=last)
+        else:
+            # A view of the session processor's output buffer: no copy
+            payloads = [memoryview(audio).cast("B")]
+        await self._send_audio(websocket, audio_frames.header(options["format"], chunk_index,
+                                                              self.sample_rate, len(payloads)))
+        for payload in payloads:
+            await self._send_audio(websocket, payload)
+    
+    async def _send_audio(self, websocket: websockets.WebSocketServerProtocol, message):
+        """send() waits while the socket's write buffer is over TTS_WRITE_LIMIT,
+        which in turn holds back lookahead generation for this session. A
+        client that stays stalled past TTS_SEND_TIMEOUT is dropped."""
+        try:
+            await asyncio.wait_for(websocket.send(message), TTS_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Client not reading for {TTS_SEND_TIMEOUT}s; closing")
+            await websocket.close(code=1008, reason="client too slow")
+            raise
     
-    async def _generate_audio_chunk(self, text: str, speaker_name: str) -> bytes:
-        """Generate audio for a single text chunk"""
+    async def _generate_audio_chunk(self, text: str, speaker_name: str) -> Optional[np.ndarray]:
+        """Float32 samples for a single text chunk, from the phrase cache when possible"""
         try:
+            cached = await self.phrase_cache.get_async(speaker_name, text)
+            if cached is not None:
+                return cached
+            
             # Format text for VibeVoice
             formatted_text = f"{speaker_name}: {text}"
             
-            # Tokenize
-            inputs = self.tokenizer(formatted_text, return_tensors="pt")
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            # Batched with whatever other sessions have pending
+            audio_output = await self.scheduler.submit(formatted_text)
             
-            # Generate audio
-            with torch.no_grad():
-                # Run inference in executor to avoid blocking event loop
-                audio_output = await asyncio.get_event_loop().run_in_executor(
-                    None, self._sync_generate, inputs
-                )
-            
-            # Convert to bytes
-            return self._audio_to_bytes(audio_output)
+            samples = self._audio_to_float(audio_output)
+            await self.phrase_cache.put_async(speaker_name, text, samples)
+            return samples
             
         except Exception as e:
             logger.error(f"Audio generation error: {e}")
-            return b""
+            return None
     
-    def _sync_generate(self, inputs):
-        """Synchronous generation wrapper"""
-        # Note: Adapt this based on actual VibeVoice inference API
-        # Check demo/inference_from_file.py for exact usage
-        return self.model.generate(**inputs, max_length=512, do_sample=True)
+    def _sync_generate_batch(self, texts: List[str]) -> list:
+        """One padded forward pass for a batch of formatted chunks"""
+        return tts_model.generate_batch(self.tokenizer, self.model, self.device, texts)
     
-    def _audio_to_bytes(self, audio_tensor, sample_rate: int = 24000) -> bytes:
-        """Convert audio tensor to WAV bytes"""
+    def _audio_to_float(self, audio_tensor, sample_rate: int = 24000) -> np.ndarray:
+        """Convert audio tensor to float32 samples, unclipped (levelled and quantized later, per session)"""
         if torch.is_tensor(audio_tensor):
             audio_np = audio_tensor.cpu().numpy().squeeze()
         else:
             audio_np = np.array(audio_tensor).squeeze()
         
-        if audio_np.dtype != np.float32:
-            audio_np = audio_np.astype(np.float32)
-        
-        # Normalize audio
-        if np.max(np.abs(audio_np)) > 0:
-            audio_np = audio_np / np.max(np.abs(audio_np))
+        self.audio_seconds += len(audio_np) / sample_rate
         
+        return np.ascontiguousarray(audio_np, dtype=np.float32)
+    
+    def _audio_to_bytes(self, pcm: np.ndarray, sample_rate: int = 24000) -> bytes:
+        """Convert PCM16 samples to WAV bytes (JSON protocol)"""
         buffer = io.BytesIO()
-        sf.write(buffer, audio_np, sample_rate, format='WAV')
+        sf.write(buffer, pcm, sample_rate, format='WAV', subtype='PCM_16')
         return buffer.getvalue()
     
-    async def handle_client(self, websocket: websockets.WebSocketServerProtocol, path: str):
-        """Handle individual client connections"""
+    async def handle_client(self, websocket: websockets.WebSocketServerProtocol, path: Optional[str] = None):
+        """Handle individual client connections (websockets >= 11 passes no path)"""
         client_id = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
         session_id = f"session_{int(time.time())}"
         
@@ -165,18 +333,27 @@ class VibeVoiceWebSocketServer:
             "type": "connection_established",
             "session_id": session_id,
             "server_info": {
-                "model": "microsoft/VibeVoice-1.5B",
+                "model": self.model_path,
+                "workers": self.workers,
                 "device": str(self.device),
                 "sample_rate": 24000
-            }
+            },
+            # Clients stay on JSON unless they pick another protocol with "configure"
+            "protocols": {"json": ["wav"], "binary": audio_frames.binary_formats()},
+            "binary_header": audio_frames.header_spec()
         }
         await websocket.send(json.dumps(welcome))
+        options = {"protocol": "json", "format": "wav",
+                   "queue": asyncio.Queue(maxsize=TTS_SESSION_QUEUE), "current": None, "requests": 0}
+        # One generation worker per session, so the read loop below never blocks
+        # and cancel/interrupt/buffer_status messages are handled immediately
+        worker = asyncio.ensure_future(self._session_worker(websocket, session_id, options))
         
         try:
             async for message in websocket:
                 try:
                     data = json.loads(message)
-                    await self._handle_message(data, websocket, session_id)
+                    await self._handle_message(data, websocket, session_id, options)
                 except json.JSONDecodeError as e:
                     error = {
                         "type": "error",
@@ -190,11 +367,16 @@ class VibeVoiceWebSocketServer:
         except Exception as e:
             logger.error(f"Error handling client {client_id}: {e}")
         finally:
+            # Nobody is listening any more: give the model time back right away
+            worker.cancel()
+            if options.get("prewarm") is not None:
+                options["prewarm"].cancel()
+            self._cancel_current(options)
             if client_id in self.active_connections:
                 del self.active_connections[client_id]
     
     async def _handle_message(self, data: dict, websocket: websockets.WebSocketServerProtocol, 
-                            session_id: str):
+                            session_id: str, options: dict):
         """Handle incoming messages from clients"""
         message_type = data.get("type")
         
@@ -211,17 +393,77 @@ class VibeVoiceWebSocketServer:
                 await websocket.send(json.dumps(error))
                 return
             
-            if len(text) > 10000:
+            if len(text) > TTS_MAX_TEXT_CHARS:
                 error = {
                     "type": "error", 
-                    "message": "Text too long (max 10000 characters)",
+                    "message": f"Text too long (max {TTS_MAX_TEXT_CHARS} characters)",
                     "session_id": session_id
                 }
                 await websocket.send(json.dumps(error))
                 return
             
-            # Start streaming generation
-            await self.generate_streaming_audio(text, speaker_names, websocket, session_id)
+            if data.get("interrupt"):
+                # Talking over: drop what is playing and queued, start on this now
+                self._cancel_current(options, drop_queued=True)
+            
+            options["requests"] += 1
+            request_id = data.get("request_id", options["requests"])
+            try:
+                # trace_id ties this speech to the /call that produced the text
+                options["queue"].put_nowait((request_id, text, speaker_names, data.get("trace_id")))
+            except asyncio.QueueFull:
+                error = {
+                    "type": "error",
+                    "message": f"Too many queued requests (max {TTS_SESSION_QUEUE})",
+                    "request_id": request_id,
+                    "session_id": session_id
+                }
+                await websocket.send(json.dumps(error))
+                return
+            queued = {
+                "type": "queued",
+                "request_id": request_id,
+                "trace_id": data.get("trace_id"),
+                "position": options["queue"].qsize(),
+                "session_id": session_id
+            }
+            await websocket.send(json.dumps(queued))
+        
+        elif message_type in ("cancel", "interrupt"):
+            # cancel: stop speaking and forget queued requests; interrupt: skip to the next one
+            dropped = self._cancel_current(options, drop_queued=message_type == "cancel")
+            cancelled = {
+                "type": "cancelled",
+                "dropped_queued": dropped,
+                "session_id": session_id
+            }
+            await websocket.send(json.dumps(cancelled))
+        
+        elif message_type == "buffer_status":
+            options.setdefault("pacer", BufferPacer()).report(data.get("buffered_ms", 0))
+        
+        elif message_type == "configure":
+            protocol = data.get("protocol", "json")
+            fmt = data.get("format", "wav" if protocol == "json" else "pcm16")
+            supported = {"json": ["wav"], "binary": audio_frames.binary_formats()}
+            if fmt not in supported.get(protocol, []):
+                error = {
+                    "type": "error",
+                    "message": f"Unsupported protocol/format: {protocol}/{fmt}",
+                    "session_id": session_id
+                }
+                await websocket.send(json.dumps(error))
+                return
+            options.update(protocol=protocol, format=fmt)
+            options["encoder"] = audio_frames.OpusEncoder(self.sample_rate) if fmt == "opus" else None
+            configured = {
+                "type": "configured",
+                "protocol": protocol,
+                "format": fmt,
+                "sample_rate": self.sample_rate,
+                "session_id": session_id
+            }
+            await websocket.send(json.dumps(configured))
         
         elif message_type == "ping":
             pong = {
@@ -231,6 +473,31 @@ class VibeVoiceWebSocketServer:
             }
             await websocket.send(json.dumps(pong))
         
+        elif message_type == "prewarm":
+            # {"type": "prewarm", "phrases": {"Alice": ["Hey there!", ...]}}; answered with
+            # "prewarmed" when done, while the read loop carries on with other messages
+            try:
+                if options.get("prewarm") is not None and not options["prewarm"].done():
+                    raise ValueError("A prewarm is already running for this session")
+                phrases = self._prewarm_phrases(data.get("phrases", {}))
+            except ValueError as e:
+                await websocket.send(json.dumps({"type": "error", "message": str(e), "session_id": session_id}))
+                return
+            options["prewarm"] = asyncio.ensure_future(self._prewarm_for_client(websocket, session_id, phrases))
+        
+        elif message_type == "stats":
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            stats = {
+                "type": "stats",
+                "batching": self.scheduler.snapshot(),
+                "phrase_cache": self.phrase_cache.snapshot(),
+                "active_connections": len(self.active_connections),
+                "audio_seconds": round(self.audio_seconds, 2),
+                "audio_seconds_per_second": round(self.audio_seconds / elapsed, 3),
+                "session_id": session_id
+            }
+            await websocket.send(json.dumps(stats))
+        
         else:
             error = {
                 "type": "error",
@@ -243,9 +510,19 @@ async def main():
     """Main server function"""
     server = VibeVoiceWebSocketServer()
     
+    if TTS_METRICS_PORT:
+        metrics.serve(TTS_METRICS_PORT)
+    metrics.profiler.start()
+    
     # Initialize model
     await server.initialize_model()
     
+    # Optional JSON file of {speaker: [phrases]} to synthesize before serving
+    prewarm_file = os.environ.get("TTS_PREWARM_FILE")
+    if prewarm_file:
+        with open(prewarm_file) as f:
+            await server.prewarm(server._prewarm_phrases(json.load(f), max_phrases=None))
+    
     # Start WebSocket server
     logger.info("Starting WebSocket server on ws://localhost:8765")
     async with websockets.serve(
@@ -253,7 +530,8 @@ async def main():
         "localhost", 
         8765,
         ping_interval=20,
-        ping_timeout=10
+        ping_timeout=10,
+        write_limit=TTS_WRITE_LIMIT
     ):
         logger.info("VibeVoice WebSocket TTS server is running...")
         logger.info("Connect to: ws://localhost:8765")
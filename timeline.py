@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Timeline configuration (overridable from the environment / .env)
+# Most recent turns a persona sees; older ones drop out of the prompt
+TIMELINE_MAX_TURNS = int(os.environ.get("TIMELINE_MAX_TURNS", "12"))
+TIMELINE_MAX_CALLS = int(os.environ.get("TIMELINE_MAX_CALLS", "1000"))
+# Mark the page prefix with cache_control for providers that need explicit
+# breakpoints (Anthropic, Gemini via OpenRouter); OpenAI-style caching is automatic
+TIMELINE_CACHE_CONTROL = os.environ.get("TIMELINE_CACHE_CONTROL", "0") == "1"
+
+CALL_PROMPT = ("You are one of several characters on a party-line phone call, chatting about a web page. "
+               "Keep your turn to a few spoken sentences and react to what the others said.\n\nThe page:\n\n")
+TURN_PROMPT = "Your character: {persona}\n\nIt's your turn to speak."
+
+# (persona id, text) in the order the turns finished
+Turn = Tuple[str, str]
+
+
+def prompt_messages(system_prompt: str, content: str, transcript: Optional[Sequence[Turn]] = None) -> List[dict]:
+    """Chat messages for one completion, laid out so calls share the longest possible prefix
+
+    Without a transcript this is a standalone request (the map step). For
+    a call turn the page comes first and is identical for every persona and
+    turn, earlier turns follow in order and only ever grow at the end, and
+    the persona's own instructions come last. Provider-side prompt caching
+    then covers everything but the final message.
+    """
+    if transcript is None:
+        return [{"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"Summarize the following: {content}"}]
+    page = CALL_PROMPT + content
+    if TIMELINE_CACHE_CONTROL:
+        page = [{"type": "text", "text": page, "cache_control": {"type": "ephemeral"}}]
+    messages = [{"role": "system", "content": page}]
+    messages.extend({"role": "user", "content": f"{speaker}: {text}"}
+                    for speaker, text in transcript[-TIMELINE_MAX_TURNS:])
+    messages.append({"role": "user", "content": TURN_PROMPT.format(persona=system_prompt)})
+    return messages
+
+
+def cache_content(content: str, transcript: Optional[Sequence[Turn]]) -> str:
+    """What a turn depends on besides its prompt, for the response cache key"""
+    if not transcript:
+        return content
+    turns = "\n".join(f"{speaker}: {text}" for speaker, text in transcript[-TIMELINE_MAX_TURNS:])
+    return f"{content}\n\n--- transcript ---\n{turns}"
+
+
+class Timeline:
+    """One call's processed page and the turns spoken so far"""
+
+    def __init__(self, url: str):
+        self.url = url
+        # The condensed page every turn is prompted with, once the first job has made it
+        self.page: Optional[str] = None
+        self.turns: List[Turn] = []
+        self.touched_at = time.time()
+
+
+class TimelineStore:
+    """Timelines for the calls this process is serving, least recently used evicted first
+
+    A worker that never saw a call rebuilds its timeline from the call
+    store's responses, so only turn order and the cached page are lost.
+    """
+
+    def __init__(self, max_calls: int = TIMELINE_MAX_CALLS):
+        self.max_calls = max_calls
+        self._timelines: "OrderedDict[str, Timeline]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, call: dict) -> Timeline:
+        timeline = self._timelines.get(call["id"])
+        if timeline is None:
+            timeline = self._timelines[call["id"]] = Timeline(call["url"])
+            timeline.turns = list(call.get("responses", {}).items())
+            if len(self._timelines) > self.max_calls:
+                self._timelines.popitem(last=False)
+        self._timelines.move_to_end(call["id"])
+        timeline.touched_at = time.time()
+        return timeline
+
+    def snapshot(self, call: dict) -> Tuple[Optional[str], List[Turn]]:
+        """(cached page or None, transcript so far) for generating the next turns"""
+        with self._lock:
+            timeline = self._get(call)
+            return timeline.page, list(timeline.turns)
+
+    def set_page(self, call: dict, page: Optional[str]):
+        with self._lock:
+            timeline = self._get(call)
+            if timeline.page is None:
+                timeline.page = page
+
+    def append(self, call: dict, persona_id: str, text: str) -> int:
+        """Add a finished turn; returns its position in the transcript"""
+        with self._lock:
+            timeline = self._get(call)
+            timeline.turns.append((persona_id, text))
+            return len(timeline.turns) - 1
+
+    def transcript(self, call: dict) -> List[dict]:
+        with self._lock:
+            return [{"persona": speaker, "text": text} for speaker, text in self._get(call).turns]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": len(self._timelines),
+                    "with_page": sum(1 for t in self._timelines.values() if t.page is not None)}
@@ -0,0 +1,114 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import time
+from typing import Any, Callable, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Batching configuration (overridable from the environment)
+TTS_MAX_BATCH = int(os.environ.get("TTS_MAX_BATCH", "8"))
+TTS_MAX_WAIT_MS = float(os.environ.get("TTS_MAX_WAIT_MS", "15"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class InferenceScheduler:
+    """Gathers text chunks from every open session into batched forward passes
+
+    `run_batch(texts)` is called on a single dedicated thread (the model is
+    not re-entrant) and must return one output per text, in order. With an
+    `executor` of inference processes, `concurrency` batches are in flight
+    at once, one per process. A batch is dispatched when it reaches
+    `max_batch` or when the oldest waiting chunk has waited `max_wait_ms`,
+    whichever comes first; under light load a lone chunk therefore pays at
+    most `max_wait_ms` of extra latency.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]],
+                 max_batch: int = TTS_MAX_BATCH, max_wait_ms: float = TTS_MAX_WAIT_MS,
+                 executor: Optional[concurrent.futures.Executor] = None, concurrency: int = 1):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-infer")
+        self.concurrency = max(1, concurrency)
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {"batches": 0, "items": 0, "max_batch_seen": 0, "busy_s": 0.0}
+
+    def start(self):
+        """Start the dispatch loops on the running event loop"""
+        if not self._tasks:
+            self.queue = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._dispatch()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one input and wait for its output"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Whatever else is already waiting rides along for free
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Sessions that went away while queued don't need a forward pass
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.run_batch, [item for item, _ in batch])
+                if len(outputs) != len(batch):
+                    raise RuntimeError(f"batch of {len(batch)} produced {len(outputs)} outputs")
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.stats["batches"] += 1
+                self.stats["items"] += len(batch)
+                self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+                self.stats["busy_s"] += time.monotonic() - started
+                metrics.observe("tts_batch_size", len(batch), buckets=BATCH_SIZE_BUCKETS)
+                metrics.observe("tts_batch_seconds", time.monotonic() - started)
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+    def snapshot(self) -> dict:
+        batches = self.stats["batches"]
+        return dict(self.stats, busy_s=round(self.stats["busy_s"], 3),
+                    mean_batch=round(self.stats["items"] / batches, 2) if batches else 0.0,
+                    queued=self.queue.qsize() if self.queue is not None else 0)
@@ -0,0 +1,191 @@
+import concurrent.futures
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import torch
+from transformers import AutoConfig, AutoModel, AutoTokenizer
+
+logger = logging.getLogger(__name__)
+
+# Model loading configuration (overridable from the environment)
+TTS_MODEL_PATH = os.environ.get("TTS_MODEL_PATH", "microsoft/VibeVoice-1.5B")
+# Directory written by `python tts_model.py convert DIR`; loaded with mmap when present
+TTS_WEIGHTS_DIR = os.environ.get("TTS_WEIGHTS_DIR", ".cache/tts-weights")
+TTS_INT8 = os.environ.get("TTS_INT8", "0") == "1"
+TTS_WARMUP = os.environ.get("TTS_WARMUP", "1") == "1"
+# Inference processes behind the WebSocket front end; 0 = run the model in-process
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", "0"))
+
+WEIGHTS_FILE = "model.safetensors"
+WARMUP_TEXT = "Alice: Hello there, this is a warm-up."
+
+
+def _dtype(device: torch.device) -> torch.dtype:
+    return torch.float16 if device.type == "cuda" else torch.float32
+
+
+def convert(out_dir: str, model_path: str = TTS_MODEL_PATH):
+    """Save tokenizer, config and a single safetensors file for _fast_load"""
+    from safetensors.torch import save_model
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModel.from_pretrained(model_path, torch_dtype=torch.float32)
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+    # save_model stores tensors that share storage (tied weights) once; save_file rejects them
+    save_model(model, os.path.join(out_dir, WEIGHTS_FILE), metadata={"source": model_path})
+    with open(os.path.join(out_dir, "converted.json"), "w") as f:
+        json.dump({"source": model_path, "converted_at": time.time()}, f)
+    logger.info(f"Converted {model_path} to {out_dir}")
+
+
+def _fast_load(weights_dir: str, device: torch.device):
+    """Model whose CPU weights are views of the mmapped safetensors file
+
+    Building on the meta device and loading with assign=True keeps the
+    tensors backed by the file mapping instead of copying them, so every
+    process serving the same file shares one copy in the page cache.
+    """
+    from safetensors.torch import load_file
+
+    config = AutoConfig.from_pretrained(weights_dir)
+    with torch.device("meta"):
+        model = AutoModel.from_config(config, torch_dtype=torch.float32)
+    state = load_file(os.path.join(weights_dir, WEIGHTS_FILE), device="cpu")
+    model.load_state_dict(state, strict=False, assign=True)
+    # Tied weights were saved under one name only; point the others at it again
+    if hasattr(model, "tie_weights"):
+        model.tie_weights()
+    # Non-persistent buffers aren't in the file and would stay on the meta device
+    if any(t.is_meta for t in itertools.chain(model.parameters(), model.buffers())):
+        raise RuntimeError("converted weights do not cover every tensor")
+    if device.type == "cuda":
+        model = model.to(device=device, dtype=_dtype(device))
+    return model
+
+
+def load(model_path: str = TTS_MODEL_PATH, device: Optional[torch.device] = None,
+         int8: bool = TTS_INT8, weights_dir: str = TTS_WEIGHTS_DIR) -> Tuple[object, object]:
+    """(tokenizer, model), from the converted weights when available"""
+    device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    started = time.monotonic()
+    model = None
+    if os.path.exists(os.path.join(weights_dir, WEIGHTS_FILE)):
+        try:
+            tokenizer = AutoTokenizer.from_pretrained(weights_dir)
+            model = _fast_load(weights_dir, device)
+            source = weights_dir
+        except Exception as e:
+            logger.warning(f"Fast load from {weights_dir} failed, loading {model_path}: {e}")
+    if model is None:
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModel.from_pretrained(
+            model_path,
+            torch_dtype=_dtype(device),
+            device_map="auto" if device.type == "cuda" else None
+        )
+        source = model_path
+    if tokenizer.pad_token is None:
+        # Batched chunks are padded to a common length
+        tokenizer.pad_token = tokenizer.eos_token
+    model.eval()
+    if int8 and device.type == "cpu":
+        # Dynamic int8 Linear layers: faster CPU matmuls, but the quantized
+        # weights are private to this process rather than shared via mmap
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    logger.info(f"Loaded {source} on {device} in {time.monotonic() - started:.1f}s"
+                f"{' (int8)' if int8 and device.type == 'cpu' else ''}")
+    return tokenizer, model
+
+
+def generate(model, inputs):
+    """Synchronous generation wrapper"""
+    # Note: Adapt this based on actual VibeVoice inference API
+    # Check demo/inference_from_file.py for exact usage
+    return model.generate(**inputs, max_length=512, do_sample=True)
+
+
+def _trim(row, pad_token_id: Optional[int]):
+    """One row of a batched output without the padding that evened it up with the others
+
+    Audio rows are cut after their last non-zero sample; token rows lose
+    their pad positions (at either end, whichever side the tokenizer pads).
+    """
+    if not torch.is_tensor(row) or row.dim() == 0:
+        return row
+    if row.dtype.is_floating_point:
+        active = (row != 0).reshape(-1, row.shape[-1]).any(dim=0).nonzero()
+        return row[..., :int(active[-1]) + 1 if len(active) else 0]
+    if pad_token_id is None or row.dim() != 1:
+        return row
+    return row[row != pad_token_id]
+
+
+def generate_batch(tokenizer, model, device, texts: List[str]) -> list:
+    """One padded forward pass for a batch of formatted chunks, each row trimmed to its own length"""
+    inputs = tokenizer(texts, return_tensors="pt", padding=True)
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    with torch.no_grad():
+        output = generate(model, inputs)
+    # Row i of the batched output belongs to texts[i]
+    return [_trim(output[i], tokenizer.pad_token_id) for i in range(len(texts))]
+
+
+def warm_up(tokenizer, model, device):
+    """Run one pass so kernels, allocator pools and caches are primed before serving"""
+    started = time.monotonic()
+    generate_batch(tokenizer, model, device, [WARMUP_TEXT])
+    logger.info(f"Warm-up pass took {time.monotonic() - started:.1f}s")
+
+
+# -- inference worker processes ---------------------------------------------
+
+_worker: Optional[tuple] = None
+
+
+def _init_worker(model_path: str):
+    global _worker
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // max(1, TTS_WORKERS)))
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer, model = load(model_path, device)
+    if TTS_WARMUP:
+        warm_up(tokenizer, model, device)
+    _worker = (tokenizer, model, device)
+
+
+def worker_ready() -> int:
+    return os.getpid()
+
+
+def worker_generate_batch(texts: List[str]) -> list:
+    """Runs in a worker process; outputs go back to the front end as NumPy arrays"""
+    tokenizer, model, device = _worker
+    return [row.float().cpu().numpy() if torch.is_tensor(row) else row
+            for row in generate_batch(tokenizer, model, device, texts)]
+
+
+def worker_pool(model_path: str = TTS_MODEL_PATH, workers: int = TTS_WORKERS) -> concurrent.futures.Executor:
+    """Inference processes, each loading (and mmap-sharing) the model once
+
+    Started with forkserver/spawn: torch's thread pools do not survive a fork.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(model_path,)
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) >= 3 and sys.argv[1] == "convert":
+        convert(sys.argv[2], *sys.argv[3:4])
+    else:
+        print(f"usage: {sys.argv[0]} convert OUT_DIR [MODEL_PATH]")
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import re
+import time
+from typing import List, Optional
+
+# Streaming configuration (overridable from the environment)
+TTS_FIRST_CHUNK_WORDS = int(os.environ.get("TTS_FIRST_CHUNK_WORDS", "4"))
+TTS_MAX_CHUNK_WORDS = int(os.environ.get("TTS_MAX_CHUNK_WORDS", "40"))
+TTS_CHUNK_GROWTH = float(os.environ.get("TTS_CHUNK_GROWTH", "2.0"))
+# Chunks generated ahead of the one being sent
+TTS_LOOKAHEAD = int(os.environ.get("TTS_LOOKAHEAD", "2"))
+# Audio the client should hold buffered; sending pauses while it has more
+TTS_TARGET_BUFFER_MS = float(os.environ.get("TTS_TARGET_BUFFER_MS", "1500"))
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|(?<=[.!?…][\"')\]])\s+")
+CLAUSE_END = re.compile(r"(?<=[,;:—–])\s+")
+# A period after these (or after a lone initial) doesn't end the sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "sr", "jr", "mt", "vs", "etc", "e.g", "i.e",
+                 "inc", "ltd", "co", "corp", "dept", "approx", "fig", "jan", "feb", "mar", "apr",
+                 "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec"}
+
+
+def _ends_with_abbreviation(text: str) -> bool:
+    if not text.endswith("."):
+        return False
+    word = text.rsplit(None, 1)[-1][:-1].lstrip("(\"'[").lower()
+    return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+
+def _sentences(text: str) -> List[str]:
+    sentences: List[str] = []
+    for part in SENTENCE_END.split(text.strip()):
+        if sentences and _ends_with_abbreviation(sentences[-1]):
+            sentences[-1] += " " + part
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def _clauses(text: str) -> List[str]:
+    clauses = []
+    for sentence in _sentences(text):
+        parts = [p for p in CLAUSE_END.split(sentence) if p.strip()]
+        clauses.extend(parts)
+    return clauses
+
+
+def split_for_speech(text: str, first_words: int = TTS_FIRST_CHUNK_WORDS,
+                     max_words: int = TTS_MAX_CHUNK_WORDS, growth: float = TTS_CHUNK_GROWTH) -> List[str]:
+    """Chunks on sentence/clause boundaries, small first and growing after
+
+    The first chunk is about `first_words` long so audio starts quickly;
+    each later chunk may be `growth` times bigger, up to `max_words`. A
+    clause is only cut mid-way when it alone exceeds `max_words`, and then
+    at the current chunk size, so unpunctuated text still starts small.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    target = max(1, first_words)
+
+    def emit():
+        nonlocal current, target
+        if current:
+            chunks.append(" ".join(current))
+            current = []
+            target = min(max_words, max(target + 1, int(target * growth)))
+
+    for clause in _clauses(text):
+        words = clause.split()
+        if current and len(current) + len(words) > target:
+            emit()
+        while len(words) > max_words:
+            take = max(1, target - len(current))
+            current.extend(words[:take])
+            words = words[take:]
+            emit()
+        current.extend(words)
+        if len(current) >= target or current[-1][-1:] in ".!?…":
+            emit()
+    emit()
+
+    if chunks and chunks[-1][-1] not in ".!?…":
+        # Final punctuation gives the synthesizer a proper sentence ending
+        chunks[-1] += "."
+    return chunks
+
+
+class BufferPacer:
+    """Decides how long to wait before sending more audio to one client
+
+    Clients that report {"type": "buffer_status", "buffered_ms": N} are
+    paced from that report; for the rest the buffer is estimated as audio
+    sent minus wall time since playback started.
+    """
+
+    def __init__(self, target_ms: float = TTS_TARGET_BUFFER_MS):
+        self.target_ms = target_ms
+        self.playback_started: Optional[float] = None
+        self.sent_ms = 0.0
+        self.reported_ms: Optional[float] = None
+        self.reported_at = 0.0
+        self.sent_since_report_ms = 0.0
+
+    def report(self, buffered_ms: float):
+        self.reported_ms = max(0.0, float(buffered_ms))
+        self.reported_at = time.monotonic()
+        self.sent_since_report_ms = 0.0
+
+    def sent(self, duration_ms: float):
+        now = time.monotonic()
+        if self.playback_started is None:
+            self.playback_started = now
+        self.sent_ms += duration_ms
+        self.sent_since_report_ms += duration_ms
+
+    def buffered_ms(self) -> float:
+        now = time.monotonic()
+        if self.reported_ms is not None:
+            played = (now - self.reported_at) * 1000
+            return max(0.0, self.reported_ms + self.sent_since_report_ms - played)
+        if self.playback_started is None:
+            return 0.0
+        return max(0.0, self.sent_ms - (now - self.playback_started) * 1000)
+
+    async def wait(self):
+        excess = self.buffered_ms() - self.target_ms
+        if excess > 0:
+            await asyncio.sleep(excess / 1000)